@@ -1,7 +1,10 @@
 import streamlit as st
-import pandas as pd
 import hmac
-from datetime import datetime
+
+# Keep this page light: the login form must not wait for pandas, sklearn or Firestore.
+# Those are warmed up in the background (see core.bootstrap).
+from core.bootstrap import start_bootstrap
+from core.tracing import span, start_rerun
 
 def check_password():
 
@@ -27,7 +30,11 @@ def check_password():
         st.error("😕 Incorrect username or password.")
     return False
 
-if not check_password():
+start_bootstrap()
+start_rerun()
+with span("auth.check_password"):
+    authenticated = check_password()
+if not authenticated:
     st.stop()
             
 st.set_page_config(
@@ -58,8 +65,14 @@ view_data_page = st.Page(
     icon="📊",
 )
 
+admin_page = st.Page(
+    page="views/admin.py",
+    title="Performance",
+    icon="⏱️",
+)
+
 pg = st.navigation(
-    pages=[home_page, view_data_page])
+    pages=[home_page, view_data_page, admin_page])
 
 with st.sidebar:
     # build the sidebar content
@@ -69,4 +82,5 @@ with st.sidebar:
     st.write("Expert: **dr. Reza Fahlevi, Sp.A (RSCM UI)**")
     # st.download_button("Download Data", data=df.to_csv(), file_name="data.csv", mime="text/csv", use_container_width=True, icon=":material/download:")
 
-pg.run()
\ No newline at end of file
+with span("page.run", page=pg.title):
+    pg.run()
\ No newline at end of file
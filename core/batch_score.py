@@ -0,0 +1,109 @@
+"""
+Headless batch scoring.
+
+    python -m core.batch_score patients.csv scores.parquet [--model model.pkl] [--chunk-size 10000]
+
+Streams the input (CSV or Parquet) in fixed-size chunks through the same rule-based
+scoring and KNN pipeline the calculator uses, appending each chunk to the output Parquet
+so memory stays bounded by the chunk size rather than the file size.
+"""
+import argparse
+import os
+import pickle
+import sys
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from core.features import SCHEMA
+from core.model_registry import get_registry
+from core.scoring import score_patients
+
+ID_COLUMNS = ["Patient_ID", "Patient_Name", "Date"]
+
+OUTPUT_SCHEMA = pa.schema([
+    ("Patient_ID", pa.string()),
+    ("Patient_Name", pa.string()),
+    ("Date", pa.string()),
+    ("RuleBased_Score", pa.float64()),
+    ("KNN_Prediction", pa.int64()),
+    ("KNN_Probability", pa.float64()),
+])
+
+
+def iter_chunks(path, chunk_size):
+    """Yield DataFrames of at most `chunk_size` rows from a CSV or Parquet file."""
+    if path.lower().endswith((".parquet", ".pq")):
+        parquet_file = pq.ParquetFile(path)
+        wanted = [c for c in ID_COLUMNS + SCHEMA.names if c in parquet_file.schema_arrow.names]
+        for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=wanted):
+            yield batch.to_pandas()
+    else:
+        wanted = set(ID_COLUMNS) | set(SCHEMA.names)
+        yield from pd.read_csv(path, chunksize=chunk_size, usecols=lambda c: c in wanted)
+
+
+def load_pipeline(model_path=None):
+    if model_path:
+        with open(model_path, "rb") as f:
+            return pickle.load(f)
+    registry = get_registry()
+    return registry.load(registry.current_version())
+
+
+def score_chunk(chunk: pd.DataFrame, knn_pipeline):
+    """Score one chunk; returns a DataFrame matching OUTPUT_SCHEMA."""
+    out = pd.DataFrame(index=chunk.index)
+    for col in ID_COLUMNS:
+        out[col] = chunk[col].astype("string") if col in chunk.columns else pd.Series(pd.NA, index=chunk.index, dtype="string")
+
+    scores, _ = score_patients(chunk)
+    out["RuleBased_Score"] = scores
+
+    if knn_pipeline is not None:
+        X = SCHEMA.model_input(chunk)
+        proba = knn_pipeline.predict_proba(X)
+        classes = np.asarray(knn_pipeline.classes_)
+        # Assume class 1 = survivor probability
+        class_index = list(classes).index(1)
+        out["KNN_Prediction"] = classes[proba.argmax(axis=1)].astype(np.int64)
+        out["KNN_Probability"] = proba[:, class_index] * 100.0
+    else:
+        out["KNN_Prediction"] = pd.Series(pd.NA, index=chunk.index, dtype="Int64")
+        out["KNN_Probability"] = np.nan
+    return out
+
+
+def run(input_path, output_path, model_path=None, chunk_size=10_000):
+    """Score `input_path` into `output_path`; returns the number of rows written."""
+    knn_pipeline = load_pipeline(model_path)
+    if knn_pipeline is None:
+        print("No model available; KNN columns will be empty.", file=sys.stderr)
+
+    tmp_path = output_path + ".partial"
+    rows = 0
+    with pq.ParquetWriter(tmp_path, OUTPUT_SCHEMA) as writer:
+        for chunk in iter_chunks(input_path, chunk_size):
+            out = score_chunk(chunk, knn_pipeline)
+            writer.write_table(pa.Table.from_pandas(out, schema=OUTPUT_SCHEMA, preserve_index=False))
+            rows += len(out)
+    os.replace(tmp_path, output_path)
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch-score patients with the rule-based score and KNN model.")
+    parser.add_argument("input", help="patients file (.csv or .parquet)")
+    parser.add_argument("output", help="output .parquet path")
+    parser.add_argument("--model", default=None, help="pickled pipeline (default: current registry version)")
+    parser.add_argument("--chunk-size", type=int, default=10_000, help="rows per chunk (default: 10000)")
+    args = parser.parse_args(argv)
+
+    rows = run(args.input, args.output, model_path=args.model, chunk_size=args.chunk_size)
+    print(f"Scored {rows} patients -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
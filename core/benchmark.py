@@ -0,0 +1,212 @@
+"""
+Performance baseline on synthetic patients.
+
+    python -m core.benchmark [--sizes 100,1000,10000,100000,1000000] [--repeat 3]
+                             [--output bench.json] [--baseline previous.json]
+
+Times, at every size, the rule-based score, KNN fit, single-row and batched inference,
+model load (pickle and compact), and the history page's collection-to-DataFrame path
+against an in-memory Firestore. Writes one JSON document (stdout by default) so runs
+from different commits can be compared with --baseline.
+"""
+import argparse
+import json
+import os
+import pickle
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+import sklearn
+
+from core.compact_model import CompactKNN, export_compact
+from core.features import SCHEMA
+from core.history import SUMMARY_FIELDS, aggregate_periods, query_page, summary_periods
+from core.inference import predict_with_neighbours
+from core.memory_db import MemoryFirestore
+from core.mirror import LocalMirror
+from core.scoring import score_patients
+from core.synthetic import synthetic_patients, synthetic_results
+from core.training import build_knn_pipeline
+
+DEFAULT_SIZES = [10 ** e for e in range(2, 7)]
+BATCH_QUERIES = 1000
+SINGLE_QUERIES = 50
+HISTORY_PAGE_SIZE = 25
+# The stand-in keeps every document as a Python dict; above this the history
+# benchmarks would measure swap rather than the code.
+HISTORY_MAX_DOCS = 100_000
+
+
+def measure(fn, repeat=3, number=1):
+    """Seconds per call of `fn` over `repeat` rounds of `number` calls."""
+    rounds = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        rounds.append((time.perf_counter() - t0) / number)
+    return {
+        "repeat": repeat,
+        "number": number,
+        "min_s": min(rounds),
+        "median_s": statistics.median(rounds),
+        "mean_s": statistics.fmean(rounds),
+    }
+
+
+def _record(results, name, n, items, timing):
+    timing = {"benchmark": name, "n": n, "items": items, **timing}
+    timing["items_per_s"] = items / timing["median_s"] if timing["median_s"] > 0 else None
+    results.append(timing)
+    print(f"{name:>22}  n={n:<8} median {timing['median_s'] * 1e3:10.3f} ms", file=sys.stderr)
+
+
+def bench_size(n, repeat, history_max_docs, seed=0):
+    """Run every benchmark on `n` synthetic patients; returns a list of result dicts."""
+    results = []
+    df = synthetic_patients(n, seed=seed)
+    X = SCHEMA.coerce(df[SCHEMA.names])
+    y = df["Survival"]
+    queries = SCHEMA.model_input(synthetic_patients(BATCH_QUERIES, seed=seed + 1))
+
+    _record(results, "rule_score", n, n, measure(lambda: score_patients(df), repeat))
+
+    pipeline = build_knn_pipeline(SCHEMA.categorical, SCHEMA.numeric)
+    _record(results, "knn_fit", n, n, measure(lambda: pipeline.fit(X, y), repeat))
+
+    rows = [queries.iloc[[i]] for i in range(SINGLE_QUERIES)]
+    row_iter = iter(rows * repeat)
+    _record(results, "infer_single", n, 1,
+            measure(lambda: predict_with_neighbours(pipeline, next(row_iter)), repeat, SINGLE_QUERIES))
+    _record(results, "infer_batch", n, len(queries),
+            measure(lambda: predict_with_neighbours(pipeline, queries), repeat))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pkl_path = os.path.join(tmp, "model.pkl")
+        with open(pkl_path, "wb") as f:
+            pickle.dump(pipeline, f)
+
+        def load_pickle():
+            with open(pkl_path, "rb") as f:
+                pickle.load(f)
+
+        _record(results, "model_load_pickle", n, 1, measure(load_pickle, repeat))
+
+        arrow_path = export_compact(pipeline, os.path.join(tmp, "model.arrow"))
+        _record(results, "model_load_compact", n, 1, measure(lambda: CompactKNN.load(arrow_path), repeat))
+        compact = CompactKNN.load(arrow_path)
+        dict_rows = [r.iloc[0].to_dict() for r in rows]
+        dict_iter = iter(dict_rows * repeat)
+        _record(results, "infer_single_compact", n, 1,
+                measure(lambda: compact.predict_proba(next(dict_iter)), repeat, SINGLE_QUERIES))
+
+        if n <= history_max_docs:
+            db = MemoryFirestore()
+            db.load("Hasil_KNN", synthetic_results(df, seed=seed))
+
+            def legacy_frame():
+                # What the history page did originally: download everything, build one frame.
+                pd.DataFrame([doc.to_dict() for doc in db.collection("Hasil_KNN").stream()])
+
+            _record(results, "history_full_frame", n, n, measure(legacy_frame, repeat))
+            _record(results, "history_first_page", n, HISTORY_PAGE_SIZE, measure(
+                lambda: pd.DataFrame(query_page(db, "Hasil_KNN", HISTORY_PAGE_SIZE)[0]), repeat))
+            displayed = tuple(SCHEMA.history_columns)
+            _record(results, "history_projected_page", n, HISTORY_PAGE_SIZE, measure(
+                lambda: pd.DataFrame(query_page(db, "Hasil_KNN", HISTORY_PAGE_SIZE, columns=displayed)[0]), repeat))
+            first, last = df["Date"].min().to_pydatetime(), df["Date"].max().to_pydatetime()
+            periods = summary_periods("Month", first, last + timedelta(seconds=1))
+            _record(results, "history_aggregate_months", n, n, measure(
+                lambda: aggregate_periods(db, "Hasil_KNN", periods), repeat))
+
+            def mirror_sync():
+                mirror = LocalMirror(os.path.join(tmp, f"mirror-{time.perf_counter_ns()}.duckdb"))
+                mirror.sync(db, "Hasil_KNN")
+                return mirror
+
+            _record(results, "history_mirror_sync", n, n, measure(mirror_sync, repeat=1))
+            mirror = mirror_sync()
+            columns = SCHEMA.history_columns
+            _record(results, "history_mirror_page", n, HISTORY_PAGE_SIZE, measure(
+                lambda: mirror.read_page("Hasil_KNN", columns, HISTORY_PAGE_SIZE, 0), repeat))
+            _record(results, "history_mirror_aggregate_months", n, n, measure(
+                lambda: mirror.aggregate_periods("Hasil_KNN", periods, SUMMARY_FIELDS), repeat))
+    return results
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "sklearn": sklearn.__version__,
+    }
+
+
+def compare(current, baseline, tolerance=1.2):
+    """(benchmark, n, ratio) of median times, plus the entries slower than `tolerance`x."""
+    before = {(r["benchmark"], r["n"]): r["median_s"] for r in baseline["results"]}
+    rows = []
+    for r in current["results"]:
+        old = before.get((r["benchmark"], r["n"]))
+        if old:
+            rows.append((r["benchmark"], r["n"], r["median_s"] / old))
+    return rows, [row for row in rows if row[2] > tolerance]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark scoring, KNN and history paths on synthetic patients.")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="comma-separated patient counts (default: 10^2..10^6)")
+    parser.add_argument("--repeat", type=int, default=3, help="timed rounds per benchmark (default: 3)")
+    parser.add_argument("--history-max-docs", type=int, default=HISTORY_MAX_DOCS,
+                        help="skip the Firestore history benchmarks above this size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="write JSON here instead of stdout")
+    parser.add_argument("--baseline", default=None, help="earlier JSON output to compare against")
+    parser.add_argument("--tolerance", type=float, default=1.2,
+                        help="slowdown ratio reported as a regression (default: 1.2)")
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    report = {"environment": environment(), "sizes": sizes,
+              "history_max_docs": args.history_max_docs, "results": []}
+    for n in sizes:
+        report["results"].extend(bench_size(n, args.repeat, args.history_max_docs, seed=args.seed))
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        rows, regressions = compare(report, baseline, args.tolerance)
+        for name, n, ratio in rows:
+            flag = "  REGRESSION" if ratio > args.tolerance else ""
+            print(f"{name:>22}  n={n:<8} {ratio:6.2f}x{flag}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+Warm start for a server process.
+
+    python -m core.bootstrap [streamlit options, e.g. --server.port 8501]
+
+starts the warm-up and then the Streamlit server in the same process, so the first
+visitor after a deploy or scale-out does not pay for it. app.py also calls
+start_bootstrap(); under a plain `streamlit run app.py` the warm-up then begins with the
+first session instead (still in the background).
+
+    python -m core.bootstrap --check
+
+exits 0 once this machine's server has finished warming up (for readiness probes).
+"""
+import argparse
+import importlib
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+from core.shared import process_singleton
+from core.tracing import span
+
+STATUS_PATH = os.path.join("data", "ready.json")
+APP_PATH = "app.py"
+# Imported up front so page scripts find them in sys.modules.
+HEAVY_MODULES = [
+    "numpy", "pandas", "pyarrow", "duckdb", "sklearn.pipeline", "sklearn.neighbors",
+    "google.cloud.firestore", "core.history", "core.inference_worker", "core.model_registry",
+]
+
+
+class Bootstrap:
+    """
+    One warm-up pass per server process, on a background thread:
+      - imports the heavy scientific and Firestore modules
+      - opens the shared Firestore client and makes one small read (channel handshake)
+      - loads the current model version, pickled and compact
+      - runs a dummy prediction in-process and on the inference workers
+      - opens the local history mirror
+    Each step is traced as `bootstrap.<step>`. A failing step is recorded and the others
+    still run; everything skipped is simply done lazily on first use, as before.
+    """
+
+    def __init__(self, status_path=STATUS_PATH):
+        self.status_path = status_path
+        self.state = "pending"          # pending -> warming -> ready | degraded
+        self.steps = {}                 # step -> {"seconds", "error"}
+        self.started_at = None
+        self.finished_at = None
+        self.done = threading.Event()
+        self._version = None
+        self._X = None
+        self._thread = None
+
+    # --- steps ---
+    def _imports(self):
+        for name in HEAVY_MODULES:
+            importlib.import_module(name)
+
+    def _firestore(self):
+        from core.db import get_db
+
+        get_db().collection("Hasil_KNN").limit(1).get()
+
+    def _model(self):
+        from core.model_registry import get_registry
+
+        registry = get_registry()
+        self._version = registry.current_version()
+        if self._version is None:
+            raise RuntimeError("no saved model yet")
+        registry.load(self._version)
+        registry.load_compact(self._version)
+
+    def _predict(self):
+        import pandas as pd
+
+        from core.features import SCHEMA
+        from core.inference import predict_with_neighbours
+        from core.model_registry import get_registry
+
+        if self._version is None:
+            raise RuntimeError("no model loaded")
+        # A patient with every field blank: all calculator defaults.
+        self._X = SCHEMA.model_input(pd.DataFrame([{}]))
+        registry = get_registry()
+        for model in (registry.load(self._version), registry.load_compact(self._version)):
+            if model is not None:
+                predict_with_neighbours(model, self._X)
+
+    def _workers(self):
+        from core.inference_worker import START_TIMEOUT_SECONDS, get_inference_pool
+
+        if self._version is None:
+            raise RuntimeError("no model loaded")
+        # The calculator's default search method; workers load the model on first request.
+        get_inference_pool().predict(self._version, "compact", self._X, timeout=START_TIMEOUT_SECONDS)
+
+    def _mirror(self):
+        from core.mirror import get_mirror
+
+        get_mirror()
+
+    # --- running ---
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name="bootstrap", daemon=True)
+        self._thread.start()
+
+    def run(self):
+        self.started_at = datetime.now(timezone.utc)
+        self.state = "warming"
+        self._write_status()
+        steps = [("imports", self._imports), ("firestore", self._firestore), ("model", self._model),
+                 ("predict", self._predict), ("workers", self._workers), ("mirror", self._mirror)]
+        for name, step in steps:
+            error = None
+            t0 = time.perf_counter()
+            try:
+                with span(f"bootstrap.{name}"):
+                    step()
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            self.steps[name] = {"seconds": round(time.perf_counter() - t0, 3), "error": error}
+        self.finished_at = datetime.now(timezone.utc)
+        self.state = "degraded" if any(s["error"] for s in self.steps.values()) else "ready"
+        self._write_status()
+        self.done.set()
+
+    def status(self):
+        return {
+            "state": self.state,
+            "pid": os.getpid(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "steps": dict(self.steps),
+        }
+
+    def _write_status(self):
+        try:
+            os.makedirs(os.path.dirname(self.status_path) or ".", exist_ok=True)
+            tmp = f"{self.status_path}.{os.getpid()}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(self.status(), f, indent=2)
+            os.replace(tmp, self.status_path)
+        except OSError:
+            pass   # the in-process status (admin page) still works
+
+
+@process_singleton
+def start_bootstrap():
+    """Start the warm-up once per server process; returns the shared Bootstrap."""
+    bootstrap = Bootstrap()
+    bootstrap.start()
+    return bootstrap
+
+
+def check(status_path=STATUS_PATH):
+    """Exit code for a readiness probe: 0 once a live server has finished warming up."""
+    try:
+        with open(status_path) as f:
+            status = json.load(f)
+        os.kill(status["pid"], 0)
+    except (OSError, ValueError, KeyError):
+        return 1
+    print(json.dumps(status, indent=2))
+    return 0 if status["state"] in ("ready", "degraded") else 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Warm up, then run the Streamlit server in this process.")
+    parser.add_argument("--check", action="store_true", help="report readiness of the running server and exit")
+    args, streamlit_args = parser.parse_known_args(argv)
+    if args.check:
+        sys.exit(check())
+
+    # Run as __main__, this file is a different module object from the `core.bootstrap`
+    # app.py imports; start through the latter so app.py finds the warm-up already running.
+    from core.bootstrap import start_bootstrap as start_shared
+    from streamlit.web import cli as stcli
+
+    start_shared()
+    sys.argv = ["streamlit", "run", APP_PATH, *streamlit_args]
+    sys.exit(stcli.main())
+
+
+if __name__ == "__main__":
+    main()
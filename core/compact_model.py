@@ -0,0 +1,217 @@
+import json
+import math
+import os
+
+import numpy as np
+import pyarrow as pa
+
+from core.inference import brute_kneighbors, vote
+
+FORMAT_VERSION = 1
+
+
+def _is_missing(value):
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+def _matrix_column(X):
+    X = np.ascontiguousarray(X, dtype=np.float32)
+    return pa.FixedSizeListArray.from_arrays(pa.array(X.reshape(-1), type=pa.float32()), X.shape[1])
+
+
+def export_compact(pipeline, path):
+    """
+    Write the fitted preprocessing and training matrix of a build_knn_pipeline() model
+    to an uncompressed Arrow IPC file that CompactKNN memory-maps. No pickle involved:
+    imputer fills, scaler means/scales, one-hot categories and KNN settings go into the
+    schema metadata; the float32 training matrix and encoded labels are the columns.
+    """
+    pre = pipeline.named_steps["preprocess"]
+    knn = pipeline.steps[-1][1]
+    if knn.metric not in ("minkowski", "euclidean") or (knn.metric == "minkowski" and knn.p != 2):
+        raise ValueError("Compact export supports Euclidean KNN only.")
+
+    num_cols, cat_cols = pre.transformers_[0][2], pre.transformers_[1][2]
+    num_pipe, cat_pipe = pre.named_transformers_["num"], pre.named_transformers_["cat"]
+    num_imputer, scaler = num_pipe.named_steps["imputer"], num_pipe.named_steps["scaler"]
+    cat_imputer, ohe = cat_pipe.named_steps["imputer"], cat_pipe.named_steps["ohe"]
+
+    # SimpleImputer drops features that were entirely missing at fit time.
+    num_fill = [float(v) for v in num_imputer.statistics_]
+    num_keep = [not math.isnan(v) for v in num_fill]
+    cat_fill = [None if _is_missing(v) else str(v) for v in cat_imputer.statistics_]
+    cat_keep = [v is not None for v in cat_fill]
+    n_num = sum(num_keep)
+    mean = scaler.mean_ if scaler.mean_ is not None else np.zeros(n_num)
+    scale = scaler.scale_ if scaler.scale_ is not None else np.ones(n_num)
+
+    meta = {
+        "format": FORMAT_VERSION,
+        "num_cols": list(num_cols),
+        "num_keep": num_keep,
+        "num_fill": [v if keep else None for v, keep in zip(num_fill, num_keep)],
+        "mean": [float(v) for v in mean],
+        "scale": [float(v) for v in scale],
+        "cat_cols": list(cat_cols),
+        "cat_keep": cat_keep,
+        "cat_fill": cat_fill,
+        "categories": [[str(c) for c in cats] for cats in ohe.categories_],
+        "classes": [int(c) for c in knn.classes_],
+        "n_neighbors": int(knn.n_neighbors),
+        "weights": knn.weights,
+    }
+
+    X = knn._fit_X.toarray() if hasattr(knn._fit_X, "toarray") else knn._fit_X
+    table = pa.table(
+        {"x": _matrix_column(X), "y": pa.array(np.asarray(knn._y, dtype=np.int32))},
+        metadata={"pccsp_knn": json.dumps(meta)},
+    )
+
+    tmp_path = path + ".tmp"
+    with pa.OSFile(tmp_path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+    return path
+
+
+def export_delta(Xt, y, doc_ids, meta):
+    """
+    Arrow IPC bytes for rows appended to a model version (see ModelRegistry.save_delta):
+    the already-transformed float32 rows, their encoded labels and source document ids,
+    with `meta` (parent version, outcome watermark) in the schema metadata.
+    """
+    table = pa.table(
+        {"x": _matrix_column(Xt), "y": pa.array(np.asarray(y, dtype=np.int32)),
+         "doc_id": pa.array(list(doc_ids), type=pa.string())},
+        metadata={"pccsp_delta": json.dumps({"format": FORMAT_VERSION, **meta})},
+    )
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def load_delta(path):
+    """(meta, X, y, doc_ids) of a file written from export_delta()."""
+    with pa.memory_map(path, "r") as source:
+        table = pa.ipc.open_file(source).read_all()
+    meta = json.loads(table.schema.metadata[b"pccsp_delta"])
+    x = table.column("x").combine_chunks()
+    X = x.values.to_numpy().reshape(-1, x.type.list_size)
+    y = table.column("y").to_numpy()
+    return meta, X, y, table.column("doc_id").to_pylist()
+
+
+class CompactKNN:
+    """
+    Pickle-free, sklearn-free KNN predictor over an artifact written by export_compact().
+    The training matrix is a zero-copy view of the memory-mapped file, so loading is
+    near-instant and processes opening the same file share its pages.
+    Outputs match the source pipeline within float32 tolerance.
+    """
+
+    def __init__(self, meta, X, y):
+        self.meta = meta
+        self.X = X
+        self.y = y
+        self.classes_ = np.asarray(meta["classes"])
+        self.n_neighbors = meta["n_neighbors"]
+        self.weights = meta["weights"]
+
+        self._num_cols = [c for c, keep in zip(meta["num_cols"], meta["num_keep"]) if keep]
+        self._num_fill = np.array([v for v in meta["num_fill"] if v is not None], dtype=np.float64)
+        self._mean = np.asarray(meta["mean"], dtype=np.float64)
+        self._scale = np.asarray(meta["scale"], dtype=np.float64)
+        kept = [i for i, keep in enumerate(meta["cat_keep"]) if keep]
+        self._cat_cols = [meta["cat_cols"][i] for i in kept]
+        self._cat_fill = [meta["cat_fill"][i] for i in kept]
+        self._categories = meta["categories"]
+        # One-hot slot of every (column, category) for the single-row path.
+        self._slots = []
+        offset = len(self._num_cols)
+        for cats in self._categories:
+            self._slots.append({c: offset + j for j, c in enumerate(cats)})
+            offset += len(cats)
+        self.n_features = offset
+
+    @classmethod
+    def load(cls, path):
+        source = pa.memory_map(path, "r")
+        table = pa.ipc.open_file(source).read_all()
+        meta = json.loads(table.schema.metadata[b"pccsp_knn"])
+        x = table.column("x").chunk(0)
+        d = x.type.list_size
+        X = x.values.to_numpy(zero_copy_only=True).reshape(-1, d)
+        y = table.column("y").chunk(0).to_numpy(zero_copy_only=True)
+        return cls(meta, X, y)
+
+    def extend(self, Xt_new, y_new):
+        """Predictor with already-transformed rows appended (an in-memory copy, not the mapped file)."""
+        X = np.vstack([self.X, np.asarray(Xt_new, dtype=np.float32)])
+        y = np.concatenate([self.y, np.asarray(y_new, dtype=self.y.dtype)])
+        return CompactKNN(self.meta, X, y)
+
+    # --- preprocessing ---
+    def transform_row(self, row: dict):
+        """Fast path for one patient given as a {column: value} dict."""
+        out = np.zeros(self.n_features, dtype=np.float32)
+        num = np.array([row.get(c) if not _is_missing(row.get(c)) else np.nan for c in self._num_cols], dtype=np.float64)
+        num = np.where(np.isnan(num), self._num_fill, num)
+        out[:len(num)] = (num - self._mean) / self._scale
+        for col, fill, slots in zip(self._cat_cols, self._cat_fill, self._slots):
+            value = row.get(col)
+            slot = slots.get(fill if _is_missing(value) else str(value))
+            if slot is not None:   # unknown categories encode as all zeros
+                out[slot] = 1.0
+        return out[None, :]
+
+    def transform(self, X):
+        """Vectorized preprocessing of a DataFrame (or a single dict row)."""
+        if isinstance(X, dict):
+            return self.transform_row(X)
+        if len(X) == 1:
+            return self.transform_row(X.iloc[0].to_dict())
+        import pandas as pd
+
+        n = len(X)
+        out = np.zeros((n, self.n_features), dtype=np.float32)
+        num = X.reindex(columns=self._num_cols).apply(pd.to_numeric, errors="coerce").to_numpy(dtype=np.float64)
+        num = np.where(np.isnan(num), self._num_fill, num)
+        out[:, :num.shape[1]] = (num - self._mean) / self._scale
+        offset = len(self._num_cols)
+        for col, fill, cats in zip(self._cat_cols, self._cat_fill, self._categories):
+            values = X[col].to_numpy(dtype=object) if col in X.columns else np.full(n, None, dtype=object)
+            values = np.where(pd.isna(values), fill, values).astype(str)
+            out[:, offset:offset + len(cats)] = values[:, None] == np.asarray(cats)[None, :]
+            offset += len(cats)
+        return out
+
+    # --- search / prediction ---
+    def kneighbors(self, Xt, n_neighbors=None):
+        k = min(n_neighbors or self.n_neighbors, self.X.shape[0])
+        Q = np.ascontiguousarray(Xt, dtype=np.float32)
+        if Q.shape[0] == 1:
+            # Direct differences are more precise than the GEMM expansion for one query.
+            sq = ((self.X - Q[0]) ** 2).sum(axis=1)
+            ind = np.argpartition(sq, k - 1)[:k] if k < len(sq) else np.arange(len(sq))
+            ind = ind[np.argsort(sq[ind], kind="stable")]
+            return np.sqrt(sq[ind].astype(np.float64))[None, :], ind[None, :]
+        return brute_kneighbors(self.X, Q, k)
+
+    def predict_proba(self, X):
+        dist, ind = self.kneighbors(self.transform(X))
+        return vote(self.y[ind], dist, self.weights, len(self.classes_))
+
+    def predict(self, X):
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+
+def check_parity(pipeline, compact, X):
+    """Largest absolute probability gap and prediction agreement between sklearn and compact."""
+    expected = pipeline.predict_proba(X)
+    got = compact.predict_proba(X)
+    return {
+        "max_abs_proba_diff": float(np.abs(expected - got).max()),
+        "prediction_agreement": float((pipeline.predict(X) == compact.predict(X)).mean()),
+    }
@@ -0,0 +1,13 @@
+import json
+
+import streamlit as st
+from google.cloud import firestore
+
+from core.tracing import traced
+
+
+@st.cache_resource
+@traced("firestore.client")
+def get_db():
+    key_dict = json.loads(st.secrets["textkey"])
+    return firestore.Client.from_service_account_info(key_dict)
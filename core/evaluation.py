@@ -0,0 +1,105 @@
+"""
+Cross-validated choice of k for the KNN model.
+
+    python -m core.evaluation training.csv [--folds 5]
+
+Each fold fits the preprocessing once, queries the neighbour graph once at the largest k,
+and scores every candidate k from prefixes of that one graph, so the whole sweep costs
+one fit and one neighbour query per fold instead of one per (k, fold).
+"""
+import argparse
+import sys
+
+import numpy as np
+import pandas as pd
+from sklearn.metrics import roc_auc_score
+from sklearn.model_selection import StratifiedKFold
+
+from core.features import SCHEMA
+from core.inference import vote
+from core.training import build_knn_pipeline, load_training_frame
+
+K_CANDIDATES = list(range(3, 32, 2))
+
+
+def expected_calibration_error(y_true, prob, n_bins=10):
+    """Weighted gap between mean predicted probability and observed rate over equal-width bins."""
+    bins = np.minimum((prob * n_bins).astype(int), n_bins - 1)
+    ece = 0.0
+    for b in range(n_bins):
+        mask = bins == b
+        if mask.any():
+            ece += mask.mean() * abs(prob[mask].mean() - y_true[mask].mean())
+    return ece
+
+
+def k_sweep(X, y, ks=K_CANDIDATES, n_splits=5, random_state=0, schema=SCHEMA):
+    """
+    Stratified CV of every k in `ks` from a single neighbour graph per fold.
+    Returns one row per k with mean/std accuracy, ROC AUC, Brier score and calibration error.
+    """
+    y = np.asarray(y)
+    ks = sorted(ks)
+    k_max = ks[-1]
+    folds = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=random_state)
+    scores = {k: [] for k in ks}
+
+    for train_idx, test_idx in folds.split(X, y):
+        pipeline = build_knn_pipeline(schema.categorical, schema.numeric, n_neighbors=k_max)
+        pipeline.fit(X.iloc[train_idx], y[train_idx])
+        knn = pipeline.steps[-1][1]
+        classes = np.asarray(knn.classes_)
+        dist, ind = knn.kneighbors(pipeline[:-1].transform(X.iloc[test_idx]),
+                                   n_neighbors=min(k_max, len(train_idx)))
+        neighbour_y = np.asarray(knn._y)[ind]
+        y_test = y[test_idx]
+        # Survival (class 1) is the positive class
+        positive = list(classes).index(1)
+
+        for k in ks:
+            proba = vote(neighbour_y[:, :k], dist[:, :k], knn.weights, len(classes))
+            prob = proba[:, positive]
+            y_pos = (y_test == 1).astype(float)
+            scores[k].append({
+                "accuracy": float((classes[proba.argmax(axis=1)] == y_test).mean()),
+                "auc": float(roc_auc_score(y_pos, prob)) if 0 < y_pos.sum() < len(y_pos) else np.nan,
+                "brier": float(((prob - y_pos) ** 2).mean()),
+                "ece": float(expected_calibration_error(y_pos, prob)),
+            })
+
+    rows = []
+    for k in ks:
+        fold_scores = pd.DataFrame(scores[k])
+        row = {"k": k}
+        for metric in ["accuracy", "auc", "brier", "ece"]:
+            row[metric] = fold_scores[metric].mean()
+            row[f"{metric}_std"] = fold_scores[metric].std(ddof=0)
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def best_k(table, metric="auc"):
+    """k with the best mean score (lowest for brier/ece, highest otherwise)."""
+    column = table[metric]
+    return int(table.loc[column.idxmin() if metric in ("brier", "ece") else column.idxmax(), "k"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cross-validated accuracy/AUC/calibration for every odd k from 3 to 31.")
+    parser.add_argument("csv", help="training CSV with a 'Survival' column")
+    parser.add_argument("--folds", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    with open(args.csv, "rb") as f:
+        data = f.read()
+    try:
+        X, y, _ = load_training_frame(data)
+    except ValueError as e:
+        sys.exit(str(e))
+    table = k_sweep(X, y, n_splits=args.folds)
+    print(table.to_string(index=False, float_format=lambda v: f"{v:.4f}"))
+    print(f"Best k by AUC: {best_k(table)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+import hashlib
+import json
+
+import numpy as np
+import pandas as pd
+
+# Feature definitions shared by the calculator, scoring and training paths.
+
+VARIABLES = {
+    "Sex": {"label": "Sex", "default": "Male", "tag": "Sex"},
+    "Age": {"label": "Age (years)", "default": 5.7, "tag": "Age (Significant)"},
+    "Weight": {"label": "Weight (kg)", "default": 16.8, "tag": "Weight (Significant)"},
+    "PRISM_III_Score": {"label": "PRISM III Score *", "default": 14.02, "tag": "PRISM III Score (Significant)"},
+    "Vasoactive_Inotropic_Score": {"label": "Vasoactive-Inotropic Score *", "default": 9.36, "tag": "Vasoactive-Inotropic Score (Significant)"},
+    "PICU_Stay": {"label": "PICU Stay (days)", "default": 13.5, "tag": "PICU Stay"},
+    "Ventilator_Usage": {"label": "Ventilator Usage *", "default": "No", "tag": "Ventilator Usage (Significant)"},
+    "Interval_from_Admission": {"label": "Interval from Admission (hours)", "default": 18.17, "tag": "Interval from Admission"},
+    "Duration_of_CRRT": {"label": "Duration of CRRT (days)", "default": 4.23, "tag": "Duration of CRRT (Significant)"},
+    "Fluid_Overload": {"label": "Fluid Overload *", "default": "No", "tag": "Fluid Overload (Significant)"},
+    "FO_at_CRRT_Initiation": {"label": "% FO at CRRT Initiation *", "default": 8.12, "tag": "% FO at CRRT Initiation (Significant)"},
+    "pH": {"label": "pH Level *", "default": 7.33, "tag": "pH Level (Significant)"},
+    "Lactic_Acid": {"label": "Lactic Acid (mmol/L) *", "default": 2.24, "tag": "Lactic Acid"},
+    "Hb": {"label": "Hemoglobin (g/dL)", "default": 9.45, "tag": "Hemoglobin"},
+    "Platelet": {"label": "Platelet (10³/µL)", "default": 109.54, "tag": "Platelet"},
+    "Urine_Volume": {"label": "Urine Volume (mL/Kg/h) *", "default": 0.9, "tag": "Urine Volume"},
+    "Sepsis": {"label": "Sepsis", "default": "No", "tag": "Sepsis (Significant)"},
+    "Acute_Liver_Failure": {"label": "Acute Liver Failure", "default": "No", "tag": "Acute Liver Failure (Significant)"},
+    "Respiratory_Disease": {"label": "Respiratory System Disease *", "default": "No", "tag": "Respiratory System Disease (Significant)"},
+    "Albumin": {"label": "Albumin (g/dL) *", "default": 3.05, "tag": "Albumin (Significant)"},
+    "Creatinine": {"label": "Creatinine (mg/dL)", "default": 1.5, "tag": "Creatinine (Significant)"},
+    "PELOD": {"label": "PELOD Score *", "default": 12.22, "tag": "PELOD Score (Significant)"},
+    "pSOFA": {"label": "pSOFA Score *", "default": 9.56, "tag": "pSOFA Score (Significant)"},
+    "Bicarbonate": {"label": "Bicarbonate (mmEq/L)", "default": 21.7, "tag": "Bicarbonate"},
+    "Sodium": {"label": "Sodium (mmol/L)", "default": 138.72, "tag": "Sodium (Significant)"},
+    "Potassium": {"label": "Potassium (mmol/L)", "default": 3.61, "tag": "Potassium"},
+    "Tumor_Lysis_Syndrome": {"label": "Tumor Lysis Syndrome", "default": "Yes", "tag": "Tumor Lysis Syndrome"},
+    "Hyperammonemia": {"label": "Hyperammonemia", "default": "Yes", "tag": "Hyperammonemia"}
+}
+
+CATEGORICAL_OPTIONS = {
+    "Sex": ["Male", "Female"],
+    "Ventilator_Usage": ["Yes", "No"],
+    "Fluid_Overload": ["Yes", "No"],
+    "Sepsis": ["Yes", "No"],
+    "Acute_Liver_Failure": ["Yes", "No"],
+    "Respiratory_Disease": ["Yes", "No"],
+    "Tumor_Lysis_Syndrome": ["Yes", "No"],
+    "Hyperammonemia": ["Yes", "No"]
+}
+
+SIGNIFICANT_VARIABLES = ["Age","Weight","PRISM_III_Score","Vasoactive_Inotropic_Score","Ventilator_Usage","Duration_of_CRRT",
+                         "Fluid_Overload","FO_at_CRRT_Initiation","pH","Sepsis","Acute_Liver_Failure",
+                         "Respiratory_Disease","Albumin","Creatinine","PELOD","pSOFA","Sodium"]
+
+HIGHER_OR_EQUAL_VARIABLES = ["pH","Platelet","Urine_Volume","Albumin","Bicarbonate","Potassium"]
+
+# Categorical values that count towards the survivor criteria
+EXPECTED_CATEGORICAL = {
+    "Sex": "Male",
+    "Ventilator_Usage": "No",
+    "Fluid_Overload": "No",
+    "Respiratory_Disease": "No",
+    "Sepsis": "No",
+    "Acute_Liver_Failure": "No",
+    "Tumor_Lysis_Syndrome": "No",
+    "Hyperammonemia": "No"
+}
+
+# Legacy document fields that were stored under a different name.
+FIELD_ALIASES = {"Urin": "Urine_Volume"}
+
+
+class FeatureSchema:
+    """
+    The feature definitions above, compiled once per process:
+      - name lists and set lookups for categorical / numeric / significant / higher-or-equal
+      - threshold, direction and weight arrays for the vectorized rule-based score
+      - a dtype-coercion plan shared by training and prediction
+      - column projections for each consumer (model, results, history views)
+    """
+
+    def __init__(self, variables, categorical_options, significant_variables,
+                 higher_or_equal_variables, expected_categorical, field_aliases=None):
+        self.variables = variables
+        self.categorical_options = categorical_options
+        self.names = list(variables)
+        self.categorical_set = frozenset(categorical_options)
+        self.significant_set = frozenset(significant_variables)
+        self.higher_or_equal_set = frozenset(higher_or_equal_variables)
+        self.categorical = [v for v in self.names if v in self.categorical_set]
+        self.numeric = [v for v in self.names if v not in self.categorical_set]
+        self.defaults = {v: spec["default"] for v, spec in variables.items()}
+        self.tags = {v: spec["tag"] for v, spec in variables.items()}
+        self.field_aliases = dict(field_aliases or {})
+
+        # --- rule arrays (numeric block, then categorical block) ---
+        self.num_thresholds = np.array([self.defaults[v] for v in self.numeric], dtype=float)
+        self.num_higher = np.array([v in self.higher_or_equal_set for v in self.numeric])
+        self.num_weights = np.array([2 if v in self.significant_set else 1 for v in self.numeric], dtype=float)
+        # Categoricals without an expected value count towards the total but never within limit.
+        self.cat_expected = np.array([expected_categorical.get(v) for v in self.categorical], dtype=object)
+        self.cat_weights = np.array([2 if v in self.significant_set else 1 for v in self.categorical], dtype=float)
+
+        # --- column projections ---
+        # Survival is the outcome, recorded on a result once known (see core.incremental).
+        self.result_columns = ["Patient_ID", "Patient_Name", "Date", *self.names,
+                               "RuleBased_Score", "KNN_Prediction", "KNN_Probability", "Survival"]
+        self.history_columns = ["Patient_ID", "Patient_Name", "Date", "RuleBased_Score",
+                                "KNN_Probability", "KNN_Prediction", "Survival"]
+        self.legacy_patient_columns = ["Patient_ID", "Patient_Name", "Date", *self.names, "Prediction_Score"]
+        self.text_columns = frozenset(["Patient_ID", "Patient_Name", *self.categorical])
+
+        self.fingerprint = hashlib.sha256(
+            json.dumps([self.names, self.categorical]).encode()
+        ).hexdigest()[:16]
+
+    def coerce(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Training/prediction dtypes in one pass: categoricals as str, numerics as float."""
+        df = df.copy()
+        df[self.numeric] = df[self.numeric].apply(pd.to_numeric, errors="coerce").astype(float)
+        df[self.categorical] = df[self.categorical].astype(str)
+        return df
+
+    def model_input(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Frame the pipeline predicts on, in training column order: blanks fall back to the
+        calculator defaults, then the coercion plan applies.
+        """
+        X = df.reindex(columns=self.names)
+        num = X[self.numeric].apply(pd.to_numeric, errors="coerce").astype(float)
+        X[self.numeric] = num.fillna({v: self.defaults[v] for v in self.numeric})
+        cat = X[self.categorical].astype(object)
+        X[self.categorical] = cat.where(cat.notna(), pd.Series({v: self.defaults[v] for v in self.categorical}), axis=1).astype(str)
+        return X
+
+    def normalize_fields(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Rename legacy document fields (e.g. `Urin`) to their schema names."""
+        return df.rename(columns={old: new for old, new in self.field_aliases.items() if new not in df.columns})
+
+    def stored_fields(self, columns):
+        """
+        Document fields to request from Firestore for `columns`: the columns themselves plus
+        legacy names that normalize onto them. Patient_Name is left out; readers take it
+        from the document id.
+        """
+        wanted = set(columns)
+        return ([c for c in columns if c != "Patient_Name"]
+                + [old for old, new in self.field_aliases.items() if new in wanted])
+
+
+SCHEMA = FeatureSchema(
+    VARIABLES, CATEGORICAL_OPTIONS, SIGNIFICANT_VARIABLES,
+    HIGHER_OR_EQUAL_VARIABLES, EXPECTED_CATEGORICAL, FIELD_ALIASES,
+)
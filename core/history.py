@@ -0,0 +1,173 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from datetime import datetime
+
+import pandas as pd
+import streamlit as st
+from google.cloud import firestore
+from google.cloud.firestore_v1.base_query import FieldFilter
+
+from core.db import get_db
+from core.features import SCHEMA
+from core.mirror import COLLECTION_COLUMNS, mark_mirror_stale
+from core.timeline import query_timeline
+from core.tracing import span
+
+PAGE_TTL_SECONDS = 300
+PAGE_SIZES = [25, 50, 100, 250]
+
+# Summary buckets: label -> pandas period frequency (weeks run Monday to Sunday).
+PERIOD_FREQS = {"Day": "D", "Week": "W", "Month": "M"}
+DEFAULT_PERIODS = 12       # buckets shown when no date range is chosen
+MAX_PERIODS = 100          # one aggregation query per bucket
+SUMMARY_FIELDS = ("RuleBased_Score", "KNN_Probability")
+AGGREGATION_THREADS = 8
+
+
+@dataclass(frozen=True)
+class HistoryFilters:
+    """
+    Filters the history views push down to the query. Unset fields do not filter.
+    Dates are UTC datetimes; `start` is inclusive and `end` exclusive.
+    """
+    patient_id: str = None
+    start: datetime = None
+    end: datetime = None
+    prediction: int = None     # KNN_Prediction (1 survivor, 0 non-survivor)
+
+    def conditions(self, collection):
+        """(field, op, value) triples that apply to `collection`; fields it lacks are skipped."""
+        fields = COLLECTION_COLUMNS[collection]
+        conditions = [
+            ("Patient_ID", "==", self.patient_id),
+            ("KNN_Prediction", "==", self.prediction),
+            ("Date", ">=", self.start),
+            ("Date", "<", self.end),
+        ]
+        return [(f, op, v) for f, op, v in conditions if v is not None and f in fields]
+
+
+NO_FILTERS = HistoryFilters()
+
+
+def filtered_query(db, collection, filters=NO_FILTERS):
+    """
+    `collection` restricted by `filters` on the server. An equality filter combined with the
+    Date ordering needs a composite index (e.g. Patient_ID ASC, Date DESC); Firestore's
+    error message links to the console page that creates it.
+    """
+    query = db.collection(collection)
+    for field, op, value in filters.conditions(collection):
+        query = query.where(filter=FieldFilter(field, op, value))
+    return query
+
+
+def query_page(db, collection, page_size, cursor=None, columns=None, filters=NO_FILTERS):
+    """
+    One page of `collection`, newest first, ordered server-side by (Date, document id).
+      - `cursor` is the (Date, document id) of the last row of the previous page
+      - `columns` limits the fields transferred to those displayed (all fields when None)
+      - `filters` are applied by Firestore, so only matching documents are read
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    query = (
+        filtered_query(db, collection, filters)
+        .order_by("Date", direction=firestore.Query.DESCENDING)
+        .order_by("__name__", direction=firestore.Query.DESCENDING)
+        .limit(page_size)
+    )
+    if columns is not None:
+        # Firestore rejects a projection that names a field twice; "Date" may be in columns.
+        query = query.select(SCHEMA.stored_fields(list(dict.fromkeys(["Date", *columns]))))
+    if cursor is not None:
+        query = query.start_after(list(cursor))
+
+    rows = []
+    last = None
+    with span("firestore.query", collection=collection):
+        for doc in query.stream():
+            data = doc.to_dict()
+            last = (data.get("Date"), doc.id)
+            data["Patient_Name"] = doc.id
+            rows.append(data)
+    next_cursor = last if len(rows) == page_size else None
+    return rows, next_cursor
+
+
+@st.cache_data(ttl=PAGE_TTL_SECONDS, show_spinner=False)
+def fetch_page(collection, page_size, cursor=None, columns=None, filters=NO_FILTERS):
+    """Cached `query_page` against the app's Firestore client."""
+    return query_page(get_db(), collection, page_size, cursor, columns, filters)
+
+
+# --- summaries ---
+def summary_periods(freq, start=None, end=None, default_count=DEFAULT_PERIODS):
+    """
+    [(label, start, end)] UTC buckets of `freq` ("Day", "Week" or "Month") covering
+    [start, end), clipped to that range; without a range, the last `default_count` buckets
+    up to now. Raises ValueError past MAX_PERIODS buckets.
+    """
+    code = PERIOD_FREQS[freq]
+    if start is None or end is None:
+        now = pd.Timestamp.now(tz="UTC").tz_localize(None)
+        periods = pd.period_range(end=now, periods=default_count, freq=code)
+    else:
+        periods = pd.period_range(pd.Timestamp(start).tz_convert(None),
+                                  pd.Timestamp(end).tz_convert(None) - pd.Timedelta(1, "ns"), freq=code)
+    if len(periods) > MAX_PERIODS:
+        raise ValueError(f"{len(periods)} {freq.lower()}s selected; choose a shorter range or a coarser period.")
+
+    buckets = []
+    for period in periods:
+        lo = period.start_time.tz_localize("UTC").to_pydatetime()
+        hi = (period.end_time + pd.Timedelta(1, "ns")).tz_localize("UTC").to_pydatetime()
+        if start is not None and end is not None:
+            lo, hi = max(lo, start), min(hi, end)
+        buckets.append((str(period), lo, hi))
+    return buckets
+
+
+def _summary_frame(rows, fields):
+    means = [f"Mean {f}" for f in fields]
+    return pd.DataFrame(rows, columns=["Period", "Count", *means]).astype({m: float for m in means})
+
+
+def aggregate_periods(db, collection, periods, filters=NO_FILTERS, fields=SUMMARY_FIELDS):
+    """
+    Count and mean of `fields` per period, computed by Firestore aggregation queries: one
+    count/avg request per period (run concurrently), billed per index entry scanned rather
+    than per document, and no documents are transferred.
+    """
+    def one(period):
+        label, lo, hi = period
+        aggregation = filtered_query(db, collection, replace(filters, start=lo, end=hi)).count(alias="count")
+        for field in fields:
+            aggregation = aggregation.avg(field, alias=field)
+        with span("firestore.aggregate", collection=collection):
+            values = {result.alias: result.value for result in aggregation.get()[0]}
+        return [label, int(values["count"]), *(values.get(f) for f in fields)]
+
+    if not periods:
+        return _summary_frame([], fields)
+    with ThreadPoolExecutor(min(AGGREGATION_THREADS, len(periods))) as pool:
+        return _summary_frame(list(pool.map(one, periods)), fields)
+
+
+@st.cache_data(ttl=PAGE_TTL_SECONDS, show_spinner=False)
+def fetch_summary(collection, periods, filters=NO_FILTERS):
+    """Cached `aggregate_periods` against the app's Firestore client."""
+    return aggregate_periods(get_db(), collection, periods, filters)
+
+
+@st.cache_data(ttl=PAGE_TTL_SECONDS, show_spinner=False)
+def fetch_timeline(patient_id):
+    """Cached `query_timeline` against the app's Firestore client."""
+    return query_timeline(get_db(), patient_id)
+
+
+def invalidate_history():
+    """Drop cached pages so the next history view sees newly written records."""
+    fetch_page.clear()
+    fetch_summary.clear()
+    fetch_timeline.clear()
+    mark_mirror_stale()
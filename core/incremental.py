@@ -0,0 +1,197 @@
+"""
+Incremental model updates from labelled outcomes.
+
+    python -m core.incremental [--recalibrate]
+
+appends every Hasil_KNN record whose `Survival` outcome has been recorded since the
+current model version was built, and saves the appended rows as a new version. An
+outcome recorded again (a correction) replaces the row the model already holds for it.
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+from google.cloud.firestore_v1.base_query import FieldFilter
+from sklearn.base import clone
+from sklearn.pipeline import Pipeline
+
+from core.features import SCHEMA
+from core.training import build_knn_pipeline
+
+RESULTS_COLLECTION = "Hasil_KNN"
+TARGET = "Survival"
+OUTCOME_DATE = "Outcome_Date"
+
+
+def _dense(X):
+    return X.toarray() if hasattr(X, "toarray") else np.asarray(X)
+
+
+def labelled_rows(pipeline):
+    """{Hasil_KNN document id: row of the neighbour set} of the outcomes a full model version holds."""
+    return getattr(pipeline, "labelled_rows_", {})
+
+
+def outcomes_watermark(pipeline):
+    """Latest Outcome_Date a full model version already holds, or None."""
+    return getattr(pipeline, "outcomes_watermark_", None)
+
+
+def fetch_labelled(db, since=None, schema=SCHEMA):
+    """
+    (X, y, doc_ids, watermark) of Hasil_KNN records whose 0/1 outcome was recorded after
+    `since` (all recorded outcomes when None).
+      - Firestore filters on Outcome_Date itself (single-field index), so only the new
+        outcomes are read, however large the labelled cohort has grown
+      - X is rebuilt with `schema.model_input`, exactly as the calculator built it when the
+        result was scored, so fields left blank take the calculator defaults
+      - watermark is the latest Outcome_Date read (`since` when nothing was new)
+    """
+    query = db.collection(RESULTS_COLLECTION).order_by(OUTCOME_DATE)
+    if since is not None:
+        query = query.where(filter=FieldFilter(OUTCOME_DATE, ">", since))
+    records, doc_ids, watermark = [], [], since
+    for doc in query.stream():
+        data = doc.to_dict()
+        watermark = data[OUTCOME_DATE]
+        if data.get(TARGET) not in (0, 1):
+            continue
+        records.append(data)
+        doc_ids.append(doc.id)
+    frame = schema.normalize_fields(pd.DataFrame.from_records(records)).reindex(columns=[*schema.names, TARGET])
+    X = schema.model_input(frame)
+    y = frame[TARGET].astype(int)
+    return X, y, doc_ids, watermark
+
+
+def encode_rows(model, X_new, y_new):
+    """
+    (transformed rows, encoded labels) of new labelled rows under `model`'s frozen
+    preprocessing; `model` is a CompactKNN or a fitted pipeline.
+    Raises ValueError if a label is not one of the model's classes.
+    """
+    if hasattr(model, "steps"):
+        classes = np.asarray(model.steps[-1][1].classes_)
+        Xt_new = _dense(model[:-1].transform(X_new))
+    else:
+        classes = np.asarray(model.classes_)
+        Xt_new = model.transform(X_new)
+    unknown = set(np.unique(y_new)) - set(classes.tolist())
+    if unknown:
+        raise ValueError(f"Outcome labels {sorted(unknown)} are not model classes {classes.tolist()}; recalibrate instead.")
+    return np.asarray(Xt_new, dtype=np.float32), np.searchsorted(classes, np.asarray(y_new))
+
+
+def append_rows(pipeline, Xt_new, y_codes, doc_ids=(), watermark=None):
+    """
+    Pipeline with already-transformed rows added to the neighbour set, with the
+    preprocessing left as fitted: a row whose doc id the pipeline already holds replaces
+    that row, the others are appended. The registry uses this to assemble an incremental
+    version when something needs the sklearn pipeline itself (the "pipeline" search method,
+    recalibration); serving extends the compact predictor and indexes instead.
+    """
+    knn = pipeline.steps[-1][1]
+    classes = np.asarray(knn.classes_)
+    X_all = _dense(knn._fit_X).copy()
+    y_all = np.asarray(knn._y).copy()
+    rows = dict(labelled_rows(pipeline))
+    doc_ids = list(doc_ids) or [None] * len(Xt_new)
+    held = np.array([rows.get(d, -1) for d in doc_ids], dtype=np.intp)
+    replaced = held >= 0
+    X_all[held[replaced]] = Xt_new[replaced]
+    y_all[held[replaced]] = np.asarray(y_codes)[replaced]
+    for offset, doc_id in enumerate(d for d, r in zip(doc_ids, replaced) if not r):
+        if doc_id is not None:
+            rows[doc_id] = len(y_all) + offset
+    X_all = np.vstack([X_all, Xt_new[~replaced]])
+    y_all = np.concatenate([y_all, np.asarray(y_codes)[~replaced]])
+    new_knn = clone(knn).fit(X_all, classes[y_all])
+    updated = Pipeline(pipeline.steps[:-1] + [(pipeline.steps[-1][0], new_knn)])
+    updated.labelled_rows_ = rows
+    updated.outcomes_watermark_ = watermark or outcomes_watermark(pipeline)
+    return updated
+
+
+def training_rows(pipeline, schema=SCHEMA):
+    """
+    Reconstruct (X, y) in schema columns from a fitted pipeline's neighbour set, undoing
+    scaling and one-hot encoding. Values the imputers filled in come back as the fill
+    value; columns dropped as all-missing at fit time come back blank.
+    """
+    pre = pipeline.named_steps["preprocess"]
+    knn = pipeline.steps[-1][1]
+    Xt = _dense(knn._fit_X)
+    num_cols, cat_cols = pre.transformers_[0][2], pre.transformers_[1][2]
+    num_pipe, cat_pipe = pre.named_transformers_["num"], pre.named_transformers_["cat"]
+
+    kept = [c for c, fill in zip(num_cols, num_pipe.named_steps["imputer"].statistics_) if not np.isnan(fill)]
+    n_num = len(kept)
+    X = pd.DataFrame(index=range(Xt.shape[0]), columns=schema.names, dtype=object)
+    X[kept] = num_pipe.named_steps["scaler"].inverse_transform(Xt[:, :n_num])
+    X[cat_cols] = cat_pipe.named_steps["ohe"].inverse_transform(Xt[:, n_num:])
+    y = pd.Series(np.asarray(knn.classes_)[knn._y], name=TARGET)
+    return schema.coerce(X), y
+
+
+def recalibrate(pipeline, schema=SCHEMA):
+    """
+    Refit preprocessing statistics and the neighbour set on every row the model holds,
+    including incrementally appended ones. Run this explicitly (e.g. after many updates
+    have shifted the cohort); routine updates never touch the frozen statistics.
+    """
+    X, y = training_rows(pipeline, schema)
+    knn = pipeline.steps[-1][1]
+    refitted = build_knn_pipeline(schema.categorical, schema.numeric, n_neighbors=knn.n_neighbors)
+    refitted.fit(X, y)
+    refitted.labelled_rows_ = labelled_rows(pipeline)   # training_rows keeps the row order
+    refitted.outcomes_watermark_ = outcomes_watermark(pipeline)
+    return refitted
+
+
+def update_from_outcomes(db, registry, version):
+    """
+    Add outcomes recorded since model `version` was built and save them as a new version.
+      - new outcomes are appended as an incremental version: only they are read,
+        transformed and written (ModelRegistry.save_delta), and the neighbour set already
+        in memory is extended, not refit
+      - an outcome recorded again replaces the row the model holds for that result. This
+        rewrites the neighbour set, so that update is saved as a full version
+    Returns (new version or None when there was nothing to add, rows added or replaced).
+    """
+    base, chain = registry.lineage(version)
+    pipeline = registry.load(base)
+    if pipeline is None:
+        raise ValueError("No model to update; train one first.")
+    since = chain[-1].watermark if chain else outcomes_watermark(pipeline)
+    X_new, y_new, doc_ids, watermark = fetch_labelled(db, since=since)
+    if not doc_ids:
+        return None, 0
+    Xt_new, y_codes = encode_rows(registry.load_compact(version) or registry.load(version), X_new, y_new)
+    held = labelled_rows(pipeline).keys() | {i for delta in chain for i in delta.doc_ids}
+    if held.isdisjoint(doc_ids):
+        new_version = registry.save_delta(version, Xt_new, y_codes, doc_ids, watermark)
+    else:
+        new_version = registry.save(append_rows(registry.load(version), Xt_new, y_codes, doc_ids, watermark))
+    return new_version, len(doc_ids)
+
+
+def main(argv=None):
+    from core.db import get_db
+    from core.model_registry import get_registry
+
+    parser = argparse.ArgumentParser(description="Append newly labelled outcomes to the current model.")
+    parser.add_argument("--recalibrate", action="store_true",
+                        help="afterwards refit preprocessing statistics on all rows")
+    args = parser.parse_args(argv)
+
+    registry = get_registry()
+    version = registry.current_version()
+    new_version, added = update_from_outcomes(get_db(), registry, version)
+    print(f"Appended {added} labelled outcomes" + (f" -> model version {new_version}" if new_version else ""))
+    if args.recalibrate:
+        recalibrated = registry.save(recalibrate(registry.load(new_version or version)))
+        print(f"Recalibrated -> model version {recalibrated}")
+
+
+if __name__ == "__main__":
+    main()
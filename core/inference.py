@@ -0,0 +1,98 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+from core.tracing import span
+
+
+@dataclass
+class KNNResult:
+    """Everything one neighbour query yields, one row per patient."""
+    classes: np.ndarray               # (n_classes,)
+    proba: np.ndarray                 # (n, n_classes)
+    prediction: np.ndarray            # (n,) predicted class labels
+    probability: np.ndarray           # (n,) probability of class 1 (survivor)
+    neighbour_indices: np.ndarray     # (n, k) rows of the training matrix
+    neighbour_distances: np.ndarray   # (n, k)
+    neighbour_outcomes: np.ndarray    # (n, k) class labels of those rows
+
+
+def brute_kneighbors(X, Q, k):
+    """Exact Euclidean k-NN of each row of Q against X (both float32)."""
+    # ||q - x||^2 = ||q||^2 - 2 q.x + ||x||^2, computed in one GEMM
+    sq = (Q * Q).sum(axis=1)[:, None] - 2.0 * (Q @ X.T) + (X * X).sum(axis=1)[None, :]
+    np.maximum(sq, 0.0, out=sq)
+    k = min(k, X.shape[0])
+    ind = np.argpartition(sq, k - 1, axis=1)[:, :k]
+    part = np.take_along_axis(sq, ind, axis=1)
+    order = np.argsort(part, axis=1, kind="stable")
+    ind = np.take_along_axis(ind, order, axis=1)
+    dist = np.sqrt(np.take_along_axis(part, order, axis=1).astype(np.float64))
+    return dist, ind
+
+
+def neighbour_weights(dist, weights):
+    """Same weighting as KNeighborsClassifier: exact matches win outright under 'distance'."""
+    if weights in (None, "uniform"):
+        return np.ones_like(dist)
+    if weights == "distance":
+        with np.errstate(divide="ignore"):
+            w = 1.0 / dist
+        inf_mask = np.isinf(w)
+        inf_row = inf_mask.any(axis=1)
+        w[inf_row] = inf_mask[inf_row]
+        return w
+    return weights(dist)
+
+
+def vote(neighbour_y, dist, weights, n_classes):
+    """Class probabilities from encoded neighbour labels, as KNeighborsClassifier.predict_proba."""
+    w = neighbour_weights(dist, weights)
+    proba = np.zeros((neighbour_y.shape[0], n_classes))
+    for c in range(n_classes):
+        proba[:, c] = np.where(neighbour_y == c, w, 0.0).sum(axis=1)
+    normalizer = proba.sum(axis=1, keepdims=True)
+    normalizer[normalizer == 0.0] = 1.0
+    return proba / normalizer
+
+
+def neighbour_search(model, X, n_neighbors=None):
+    """
+    Preprocess `X` and query neighbours with either a fitted sklearn Pipeline or a
+    precomputed index (anything exposing transform/kneighbors/classes_/y/weights).
+    Returns (distances, indices, classes, encoded training labels, weights).
+    """
+    if hasattr(model, "steps"):
+        knn = model.steps[-1][1]
+        with span("model.transform"):
+            Xt = model[:-1].transform(X)
+        with span("model.kneighbors"):
+            dist, ind = knn.kneighbors(Xt, n_neighbors=n_neighbors)
+        return dist, ind, np.asarray(knn.classes_), np.asarray(knn._y), knn.weights
+    with span("model.transform"):
+        Xt = model.transform(X)
+    with span("model.kneighbors"):
+        dist, ind = model.kneighbors(Xt, n_neighbors=n_neighbors)
+    return dist, ind, np.asarray(model.classes_), np.asarray(model.y), model.weights
+
+
+def predict_with_neighbours(model, X, n_neighbors=None):
+    """
+    Single-pass KNN inference: preprocess `X` once, run one neighbour query, and derive
+    the class, the survival probability and the nearest training rows from it.
+    Matches pipeline.predict / predict_proba.
+    """
+    dist, ind, classes, y, weights = neighbour_search(model, X, n_neighbors=n_neighbors)
+    neighbour_y = y[ind]
+    proba = vote(neighbour_y, dist, weights, len(classes))
+    # Assume class 1 = survivor probability
+    class_index = list(classes).index(1) if 1 in classes else len(classes) - 1
+    return KNNResult(
+        classes=classes,
+        proba=proba,
+        prediction=classes[proba.argmax(axis=1)],
+        probability=proba[:, class_index],
+        neighbour_indices=ind,
+        neighbour_distances=dist,
+        neighbour_outcomes=classes[neighbour_y],
+    )
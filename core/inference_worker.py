@@ -0,0 +1,313 @@
+"""
+Out-of-process inference with request micro-batching.
+
+The web server starts a few worker processes (`python -m core.inference_worker`) that
+each hold one loaded copy of the model and answer over a localhost connection. Single-
+patient requests arriving from concurrent sessions within BATCH_WINDOW_SECONDS are
+coalesced into one batched neighbour query per (model version, search method).
+
+A version is preloaded on every worker when it is saved or a session switches to it. Until
+that load finishes, requests for the version fail at once so callers score in-process;
+after it, each request gets REQUEST_TIMEOUT_SECONDS in all. The default "compact" method
+memory-maps the version's .arrow file, so workers share its pages.
+"""
+import argparse
+import itertools
+import os
+import queue
+import secrets
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import replace
+from multiprocessing.connection import Client, Listener
+
+import pandas as pd
+
+from core.inference import predict_with_neighbours
+from core.shared import process_singleton
+
+BATCH_WINDOW_SECONDS = 0.005
+MAX_BATCH = 64
+REQUEST_TIMEOUT_SECONDS = 1.0
+START_TIMEOUT_SECONDS = 30.0
+PRELOAD_TIMEOUT_SECONDS = 30.0    # a preload not acknowledged by then is sent again
+RETRY_AFTER_SECONDS = 60.0     # after a pool fails to start, callers stay in-process this long
+WORKER_COUNT = max(1, min(4, (os.cpu_count() or 2) - 1))
+AUTHKEY_ENV = "PCCSP_WORKER_AUTHKEY"
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _rows(result, start, stop):
+    """Rows start:stop of a batched KNNResult as a KNNResult of their own."""
+    return replace(
+        result,
+        proba=result.proba[start:stop],
+        prediction=result.prediction[start:stop],
+        probability=result.probability[start:stop],
+        neighbour_indices=result.neighbour_indices[start:stop],
+        neighbour_distances=result.neighbour_distances[start:stop],
+        neighbour_outcomes=result.neighbour_outcomes[start:stop],
+    )
+
+
+# --- worker process ---
+def load_model(registry, version, method):
+    """Same model choices as the calculator's "Neighbour search" selector."""
+    from core.knn_index import NeighbourIndex
+
+    if method == "compact":
+        return registry.load_compact(version)
+    pipeline = registry.load(version)
+    if method == "pipeline" or pipeline is None:
+        return pipeline
+    return registry.derived(version, f"index:{method}",
+                            lambda: NeighbourIndex.from_pipeline(pipeline, method=method))
+
+
+def serve(address, authkey):
+    """
+    Worker loop: receive (batch id, version, method, frame), reply (batch id, result, error).
+    A frame of None is a preload: the model is loaded and (batch id, None, None) acknowledges it.
+    """
+    from core.model_registry import get_registry
+
+    registry = get_registry()
+    try:
+        conn = Client(address, authkey=authkey)
+    except (ConnectionError, EOFError):
+        return   # the server went away before this worker finished starting
+    with conn:
+        while True:
+            try:
+                batch_id, version, method, frame = conn.recv()
+            except (EOFError, ConnectionError):
+                return   # the server closed the connection or exited
+            try:
+                model = load_model(registry, version, method)
+                if model is None:
+                    raise ValueError(f"model version {version} is not available")
+                result = None if frame is None else predict_with_neighbours(model, frame)
+                conn.send((batch_id, result, None))
+            except Exception as e:
+                conn.send((batch_id, None, f"{type(e).__name__}: {e}"))
+
+
+# --- server side ---
+class _Worker:
+    def __init__(self, listener, authkey):
+        # The worker imports `core` no matter which directory the server was launched from.
+        pythonpath = os.pathsep.join(filter(None, [PACKAGE_ROOT, os.environ.get("PYTHONPATH")]))
+        env = {**os.environ, AUTHKEY_ENV: authkey.hex(), "PYTHONPATH": pythonpath}
+        host, port = listener.address
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "core.inference_worker", "--address", f"{host}:{port}"],
+            env=env,
+        )
+        # Listener.accept has no timeout; wait for it on a helper thread instead, giving
+        # up early if the worker exits before connecting.
+        accepted = {}
+        thread = threading.Thread(target=lambda: accepted.update(conn=listener.accept()), daemon=True)
+        thread.start()
+        deadline = time.monotonic() + START_TIMEOUT_SECONDS
+        while thread.is_alive() and self.alive() and time.monotonic() < deadline:
+            thread.join(0.05)
+        if "conn" not in accepted:
+            self.process.kill()
+            raise RuntimeError("inference worker did not start")
+        self.conn = accepted["conn"]
+        self.send_lock = threading.Lock()
+        self.pending = {}   # batch id -> [(future, row count)] in row order
+
+    def alive(self):
+        return self.process.poll() is None
+
+
+class InferencePool:
+    """
+    Client side of the worker processes.
+      - `submit` queues one request (usually one patient) and returns a Future of its KNNResult
+      - a dispatcher thread waits up to BATCH_WINDOW_SECONDS for more requests, groups them
+        by (version, method) and sends each group to the next worker as one frame
+      - a reader thread per worker resolves the futures of each answered batch
+      - `preload` loads a (version, method) on every worker ahead of its first request
+      - a worker that exits fails its pending requests and is replaced on next use
+    """
+
+    def __init__(self, n_workers=WORKER_COUNT):
+        self._authkey = secrets.token_bytes(32)
+        self._listener = Listener(("127.0.0.1", 0), authkey=self._authkey)
+        self._queue = queue.Queue()
+        self._batch_ids = itertools.count()
+        self._lock = threading.Lock()
+        self.broken = False
+        self._preloads = {}   # (version, method) -> (monotonic send time, futures, one per worker)
+        self._workers = [self._start_worker() for _ in range(n_workers)]
+        self._next = itertools.cycle(range(n_workers))
+        threading.Thread(target=self._dispatch_loop, name="inference-dispatch", daemon=True).start()
+
+    def _start_worker(self):
+        try:
+            worker = _Worker(self._listener, self._authkey)
+        except Exception:
+            # A listener whose accept() timed out may still hand a late worker to the
+            # abandoned thread, so this pool is not reused.
+            self.broken = True
+            raise
+        threading.Thread(target=self._read_loop, args=(worker,), name="inference-reader", daemon=True).start()
+        return worker
+
+    def submit(self, version, method, X: pd.DataFrame):
+        if self.broken:
+            raise RuntimeError("inference pool is unavailable")
+        future = Future()
+        self._queue.put((version, method, X, future))
+        return future
+
+    def preload(self, version, method):
+        """
+        Start loading (version, method) on every worker, once; returns the futures that
+        complete as each worker has it resident. A preload that failed, or that is still
+        unanswered after PRELOAD_TIMEOUT_SECONDS, is sent again on the next call.
+        """
+        key = (version, method)
+        with self._lock:
+            sent, futures = self._preloads.get(key, (None, None))
+            if futures is None or any(f.done() and f.exception() is not None for f in futures) or (
+                    not all(f.done() for f in futures) and time.monotonic() - sent > PRELOAD_TIMEOUT_SECONDS):
+                futures = [self._send_to(worker, version, method, None) for worker in self._live_workers()]
+                self._preloads[key] = (time.monotonic(), futures)
+        return futures
+
+    def predict(self, version, method, X: pd.DataFrame, timeout=REQUEST_TIMEOUT_SECONDS):
+        """
+        KNNResult for the rows of `X` from a worker; raises on timeout or worker error, and at
+        once while the version is still loading on the workers, so the caller can score
+        in-process instead of waiting for the load.
+        """
+        deadline = time.monotonic() + timeout
+        futures = self.preload(version, method)
+        if not all(f.done() for f in futures):
+            raise TimeoutError(f"model version {version} is still loading on the inference workers")
+        for future in futures:
+            future.result()   # re-raises a failed load
+        return self.submit(version, method, X).result(timeout=max(0.0, deadline - time.monotonic()))
+
+    # --- batching ---
+    def _dispatch_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + BATCH_WINDOW_SECONDS
+            while len(batch) < MAX_BATCH:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            groups = {}
+            for version, method, X, future in batch:
+                groups.setdefault((version, method), []).append((X, future))
+            for (version, method), items in groups.items():
+                self._send(version, method, items)
+
+    def _send(self, version, method, items):
+        requests = [(future, len(X)) for X, future in items]
+        try:
+            worker = self._pick_worker()
+            frame = pd.concat([X for X, _ in items], ignore_index=True)
+            self._send_to(worker, version, method, frame, requests)
+        except Exception as e:
+            for future, _ in requests:
+                if not future.done():
+                    future.set_exception(e)
+
+    def _send_to(self, worker, version, method, frame, requests=None):
+        """Send one frame (None: preload) to `worker`; returns the first request's future."""
+        requests = requests or [(Future(), 0)]
+        batch_id = next(self._batch_ids)
+        try:
+            with worker.send_lock:
+                worker.pending[batch_id] = requests
+                worker.conn.send((batch_id, version, method, frame))
+        except Exception as e:
+            worker.pending.pop(batch_id, None)
+            for future, _ in requests:
+                if not future.done():
+                    future.set_exception(e)
+        return requests[0][0]
+
+    def _live_workers(self):
+        """Every worker, replacing any that exited (lock held)."""
+        for i, worker in enumerate(self._workers):
+            if not worker.alive():
+                self._replace_worker(i)
+        return list(self._workers)
+
+    def _replace_worker(self, i):
+        self._workers[i] = self._start_worker()
+        # The new worker holds no models; preload again on next use.
+        self._preloads.clear()
+
+    def _pick_worker(self):
+        with self._lock:
+            i = next(self._next)
+            if not self._workers[i].alive():
+                self._replace_worker(i)
+            return self._workers[i]
+
+    def _read_loop(self, worker):
+        while True:
+            try:
+                batch_id, result, error = worker.conn.recv()
+            except (EOFError, OSError):
+                break
+            start = 0
+            for future, n_rows in worker.pending.pop(batch_id, []):
+                if error is not None:
+                    future.set_exception(RuntimeError(error))
+                elif result is None:
+                    future.set_result(None)   # preload acknowledged
+                else:
+                    future.set_result(_rows(result, start, start + n_rows))
+                start += n_rows
+        for requests in worker.pending.values():
+            for future, _ in requests:
+                future.set_exception(RuntimeError("inference worker exited"))
+        worker.pending.clear()
+
+
+_pool_failed_at = None
+
+
+@process_singleton(valid=lambda pool: not pool.broken)
+def get_inference_pool():
+    """
+    The worker pool shared by every session in this server process.
+    Raises RuntimeError while workers cannot be started; callers then score in-process.
+    """
+    global _pool_failed_at
+    if _pool_failed_at is not None and time.monotonic() - _pool_failed_at < RETRY_AFTER_SECONDS:
+        raise RuntimeError("inference workers unavailable")
+    try:
+        pool = InferencePool()
+    except Exception:
+        _pool_failed_at = time.monotonic()
+        raise
+    _pool_failed_at = None
+    return pool
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inference worker (started by InferencePool).")
+    parser.add_argument("--address", required=True, help="host:port of the server's listener")
+    args = parser.parse_args(argv)
+    host, port = args.address.rsplit(":", 1)
+    serve((host, int(port)), bytes.fromhex(os.environ[AUTHKEY_ENV]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""
+Streaming ingestion of training files.
+
+    python -m core.ingest training.csv [--max-examples 20]
+
+validates a CSV or Parquet export batch by batch and prints the bad-row report
+without fitting anything.
+"""
+import argparse
+import json
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+from pandas.api.types import union_categoricals
+
+from core.features import SCHEMA
+
+TARGET = "Survival"
+CSV_BLOCK_SIZE = 4 << 20        # bytes of CSV parsed per batch
+PARQUET_BATCH_ROWS = 64 * 1024
+NULL_VALUES = ["", "NA", "N/A", "NaN", "nan", "null", "NULL", "None"]
+NUMBER_PATTERN = r"^[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?$"
+
+
+@dataclass
+class IngestReport:
+    """Outcome of one ingestion pass; row numbers are 1-based data rows (header excluded)."""
+    rows_read: int = 0
+    rows_kept: int = 0
+    rows_dropped: int = 0                 # unusable target, excluded from training
+    issues_by_column: dict = field(default_factory=dict)
+    examples: list = field(default_factory=list)   # {"row", "column", "value", "problem"}
+
+    @property
+    def ok(self):
+        return not self.issues_by_column
+
+    def add(self, column, rows, values, problem, max_examples):
+        self.issues_by_column[column] = self.issues_by_column.get(column, 0) + len(rows)
+        for row, value in zip(rows, values):
+            if len(self.examples) >= max_examples:
+                break
+            self.examples.append({"row": int(row), "column": column, "value": value, "problem": problem})
+
+    def summary(self):
+        if self.ok:
+            return f"{self.rows_kept} rows read, no problems found."
+        parts = ", ".join(f"{c}: {n}" for c, n in sorted(self.issues_by_column.items()))
+        return (f"{self.rows_read} rows read, {self.rows_kept} kept, {self.rows_dropped} dropped "
+                f"(invalid {TARGET}). Problems by column: {parts}.")
+
+
+def _is_parquet(data: bytes):
+    return data[:4] == b"PAR1"
+
+
+def _check_columns(available, schema):
+    missing_cols = [c for c in schema.names if c not in available]
+    if missing_cols:
+        raise ValueError(f"Training CSV is missing columns: {', '.join(missing_cols)}")
+    if TARGET not in available:
+        raise ValueError(f"Training CSV must include target column '{TARGET}' (0/1).")
+
+
+def iter_record_batches(data: bytes, schema=SCHEMA):
+    """
+    Record batches of the feature and target columns of a CSV or Parquet file held in
+    `data`. CSV cells are read as strings under an explicit schema so that a malformed
+    value is reported by validation instead of aborting the parse or silently changing
+    the inferred type of a whole column. Raises ValueError when required columns are absent.
+    """
+    wanted = [*schema.names, TARGET]
+    source = pa.BufferReader(data)
+    if _is_parquet(data):
+        parquet_file = pq.ParquetFile(source)
+        _check_columns(parquet_file.schema_arrow.names, schema)
+        yield from parquet_file.iter_batches(batch_size=PARQUET_BATCH_ROWS, columns=wanted)
+        return
+
+    reader = pa_csv.open_csv(
+        source,
+        read_options=pa_csv.ReadOptions(block_size=CSV_BLOCK_SIZE, use_threads=True),
+        convert_options=pa_csv.ConvertOptions(
+            column_types={c: pa.string() for c in wanted},
+            include_columns=wanted,
+            include_missing_columns=True,
+            null_values=NULL_VALUES,
+            strings_can_be_null=True,
+        ),
+    )
+    # Missing columns come back as all-null; check the header itself instead.
+    header = pa_csv.read_csv(
+        pa.BufferReader(data[:CSV_BLOCK_SIZE].split(b"\n", 1)[0] + b"\n"),
+        read_options=pa_csv.ReadOptions(use_threads=False),
+    ).column_names
+    _check_columns(header, schema)
+    yield from reader
+
+
+def _to_float(column: pa.Array):
+    """(float64 array, mask of present-but-unparseable cells) for a string or numeric column."""
+    if pa.types.is_string(column.type) or pa.types.is_large_string(column.type):
+        text = pc.utf8_trim_whitespace(column)
+        parsable = pc.match_substring_regex(text, NUMBER_PATTERN)
+        values = pc.cast(pc.if_else(parsable, text, pa.scalar(None, pa.string())), pa.float64())
+        return values, pc.fill_null(pc.invert(parsable), False)
+    return pc.cast(column, pa.float64()), pa.array(np.zeros(len(column), dtype=bool))
+
+
+def _report(report, column, raw, bad, first_row, problem, max_examples):
+    rows = np.flatnonzero(bad)
+    values = pc.take(raw, pa.array(rows[:max_examples])).to_pylist()
+    report.add(column, rows + first_row, values, problem, max_examples)
+
+
+def _validate_batch(batch: pa.RecordBatch, first_row, schema, report, max_examples):
+    """
+    Typed (X, y) for one batch, converted with Arrow compute kernels (no per-cell Python).
+    Problems are added to `report`; rows whose target is unusable are dropped.
+    """
+    target, bad_target = _to_float(batch.column(TARGET))
+    keep = pc.fill_null(pc.is_in(target, value_set=pa.array([0.0, 1.0])), False).to_numpy(zero_copy_only=False)
+    if not keep.all():
+        _report(report, TARGET, batch.column(TARGET), ~keep, first_row, "not 0 or 1", max_examples)
+
+    X = {}
+    for col in schema.numeric:
+        values, bad = _to_float(batch.column(col))
+        bad = bad.to_numpy(zero_copy_only=False)
+        if bad.any():
+            _report(report, col, batch.column(col), bad, first_row, "not a number", max_examples)
+        X[col] = values.to_numpy(zero_copy_only=False)[keep]
+
+    for col in schema.categorical:
+        raw = pc.cast(batch.column(col), pa.string())
+        options = schema.categorical_options.get(col)
+        if options:
+            bad = pc.and_(pc.is_valid(raw), pc.invert(pc.is_in(raw, value_set=pa.array(options))))
+            bad = bad.to_numpy(zero_copy_only=False)
+            if bad.any():
+                _report(report, col, raw, bad, first_row, f"not one of {options}", max_examples)
+        # Same coercion as SCHEMA.coerce: blanks become the "nan" category.
+        encoded = pc.fill_null(raw, "nan").dictionary_encode()
+        X[col] = pd.Categorical.from_codes(
+            encoded.indices.to_numpy(zero_copy_only=False)[keep], encoded.dictionary.to_pylist()
+        )
+
+    report.rows_read += len(batch)
+    report.rows_kept += int(keep.sum())
+    report.rows_dropped += int((~keep).sum())
+    y = pd.Series(target.to_numpy(zero_copy_only=False)[keep].astype(int), name=TARGET)
+    return pd.DataFrame(X, columns=schema.names), y
+
+
+def ingest_training_data(data: bytes, schema=SCHEMA, max_examples=100):
+    """
+    Stream a training CSV/Parquet through validation and return (X, y, report).
+    Peak memory is the typed result plus one batch, not a fully inferred copy of the file;
+    categoricals stay pandas categories (one small code per cell).
+    Raises ValueError if required columns are missing or no row has a usable target.
+    """
+    report = IngestReport()
+    X_parts, y_parts = [], []
+    for batch in iter_record_batches(data, schema):
+        X_batch, y_batch = _validate_batch(batch, report.rows_read + 1, schema, report, max_examples)
+        X_parts.append(X_batch)
+        y_parts.append(y_batch)
+
+    if report.rows_kept == 0:
+        raise ValueError(f"Training file has no rows with a valid '{TARGET}' (0/1). " + report.summary())
+    # Give every batch the same categories so concat keeps one small code array per column.
+    for col in schema.categorical:
+        dtype = pd.CategoricalDtype(union_categoricals([part[col] for part in X_parts]).categories)
+        for part in X_parts:
+            part[col] = part[col].astype(dtype)
+    X = pd.concat(X_parts, ignore_index=True)
+    y = pd.concat(y_parts, ignore_index=True)
+    return X, y, report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Validate a training CSV/Parquet file in a streaming pass.")
+    parser.add_argument("input", help="training file (.csv or .parquet)")
+    parser.add_argument("--max-examples", type=int, default=20, help="bad cells listed in the report")
+    args = parser.parse_args(argv)
+
+    with open(args.input, "rb") as f:
+        data = f.read()
+    report = IngestReport()
+    for batch in iter_record_batches(data):
+        _validate_batch(batch, report.rows_read + 1, SCHEMA, report, args.max_examples)
+    print(report.summary())
+    print(json.dumps(report.examples, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
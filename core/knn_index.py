@@ -0,0 +1,210 @@
+"""
+Precomputed neighbour search over the preprocessed training matrix.
+
+    python -m core.knn_index [--model model.pkl] [--method ivf] [--queries 1000]
+
+prints a recall/latency report of the chosen index against exact brute-force search.
+"""
+import argparse
+import copy
+import json
+import pickle
+import time
+
+import numpy as np
+
+from core.inference import brute_kneighbors
+
+# Exact methods return the same neighbours as the sklearn pipeline; only these are offered
+# in the calculator. "ivf" trades recall for speed and is for offline evaluation.
+EXACT_METHODS = ["brute", "kd_tree", "ball_tree"]
+INDEX_METHODS = [*EXACT_METHODS, "ivf"]
+
+
+def _dense32(X):
+    if hasattr(X, "toarray"):
+        X = X.toarray()
+    return np.ascontiguousarray(X, dtype=np.float32)
+
+
+class NeighbourIndex:
+    """
+    KNN model whose training rows are stored once, already imputed, scaled and one-hot
+    encoded, as a float32 matrix, with a selectable search structure:
+      - "brute":     exact, one matrix product per query batch
+      - "kd_tree":   exact, sklearn KDTree; only pays off at low effective dimension, and is
+                     several times slower than brute on this model's one-hot feature space
+      - "ball_tree": exact, sklearn BallTree
+      - "ivf":       approximate, k-means partitions; only the `n_probe` closest are scanned.
+                     With the default n_probe, recall@7 is well below 1 and the predicted
+                     class can differ from exact search; check with recall_report first
+    Queries return the same (distances, indices) as KNeighborsClassifier.kneighbors.
+    sklearn's trees keep their own float64 copy of the matrix.
+    """
+
+    def __init__(self, preprocess, X, y, classes, n_neighbors=7, weights="distance",
+                 method="brute", n_lists=None, n_probe=8, leaf_size=40):
+        if method not in INDEX_METHODS:
+            raise ValueError(f"Unknown index method {method!r}; expected one of {', '.join(INDEX_METHODS)}")
+        self.preprocess = preprocess
+        self.X = _dense32(X)
+        self.y = np.asarray(y)
+        self.classes_ = np.asarray(classes)
+        self.n_neighbors = n_neighbors
+        self.weights = weights
+        self.method = method
+        self.n_probe = n_probe
+        self.leaf_size = leaf_size
+        self._tree = None
+        self._build_tree()
+        if method == "ivf":
+            self._build_ivf(n_lists or max(1, int(np.sqrt(self.X.shape[0]))))
+
+    def _build_tree(self):
+        # sklearn is imported on first use so that importing this module stays cheap.
+        from sklearn.neighbors import BallTree, KDTree
+
+        if self.method == "kd_tree":
+            self._tree = KDTree(self.X, leaf_size=self.leaf_size)
+        elif self.method == "ball_tree":
+            self._tree = BallTree(self.X, leaf_size=self.leaf_size)
+
+    @classmethod
+    def from_pipeline(cls, pipeline, method="brute", **kwargs):
+        """Reuse the fitted preprocessing and the already-transformed training rows of `pipeline`."""
+        knn = pipeline.steps[-1][1]
+        return cls(pipeline[:-1], knn._fit_X, knn._y, knn.classes_,
+                   n_neighbors=knn.n_neighbors, weights=knn.weights, method=method, **kwargs)
+
+    # --- ivf ---
+    def _build_ivf(self, n_lists):
+        from sklearn.cluster import MiniBatchKMeans
+
+        n_lists = min(n_lists, self.X.shape[0])
+        kmeans = MiniBatchKMeans(n_clusters=n_lists, random_state=0, n_init=3,
+                                 batch_size=min(4096, self.X.shape[0]))
+        labels = kmeans.fit_predict(self.X)
+        self.centroids = kmeans.cluster_centers_.astype(np.float32)
+        self._set_lists(labels)
+
+    def _set_lists(self, labels):
+        # Rows grouped by partition: list i is _order[_offsets[i]:_offsets[i + 1]]
+        self._labels = labels
+        self._order = np.argsort(labels, kind="stable")
+        self._offsets = np.concatenate([[0], np.cumsum(np.bincount(labels, minlength=len(self.centroids)))])
+
+    def _ivf_kneighbors(self, Q, k):
+        n_probe = min(self.n_probe, len(self.centroids))
+        _, probes = brute_kneighbors(self.centroids, Q, n_probe)
+        dist = np.empty((Q.shape[0], k))
+        ind = np.empty((Q.shape[0], k), dtype=np.intp)
+        for i, lists in enumerate(probes):
+            candidates = np.concatenate([self._order[self._offsets[j]:self._offsets[j + 1]] for j in lists])
+            if len(candidates) < k:
+                candidates = np.arange(self.X.shape[0])
+            d, local = brute_kneighbors(self.X[candidates], Q[i:i + 1], k)
+            dist[i], ind[i] = d[0], candidates[local[0]]
+        return dist, ind
+
+    # --- incremental updates ---
+    def extend(self, Xt_new, y_new):
+        """
+        New index with already-transformed rows appended (labels encoded like `y`).
+        The original is left untouched for sessions pinned to its model version.
+        IVF keeps its centroids and files the new rows under the nearest one, so no
+        k-means rerun; brute needs nothing more; kd/ball trees are rebuilt.
+        """
+        Xt_new = _dense32(Xt_new)
+        index = copy.copy(self)
+        index.X = np.vstack([self.X, Xt_new])
+        index.y = np.concatenate([self.y, np.asarray(y_new, dtype=self.y.dtype)])
+        index._build_tree()
+        if self.method == "ivf":
+            _, nearest = brute_kneighbors(self.centroids, Xt_new, 1)
+            index._set_lists(np.concatenate([self._labels, nearest[:, 0]]))
+        return index
+
+    # --- queries ---
+    def transform(self, X):
+        return _dense32(self.preprocess.transform(X))
+
+    def kneighbors(self, Xt, n_neighbors=None):
+        k = min(n_neighbors or self.n_neighbors, self.X.shape[0])
+        Q = _dense32(Xt)
+        if self._tree is not None:
+            return self._tree.query(Q, k=k)
+        if self.method == "ivf":
+            return self._ivf_kneighbors(Q, k)
+        return brute_kneighbors(self.X, Q, k)
+
+
+def recall_report(index, queries, k=None, single_row=200):
+    """
+    Compare `index` with exact brute-force search on already-transformed `queries`.
+    Returns recall@k plus batch and single-row latency for both.
+    """
+    k = k or index.n_neighbors
+    Q = _dense32(queries)
+
+    t0 = time.perf_counter()
+    _, exact = brute_kneighbors(index.X, Q, k)
+    exact_batch = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    _, found = index.kneighbors(Q, n_neighbors=k)
+    index_batch = time.perf_counter() - t0
+
+    hits = sum(len(np.intersect1d(a, b)) for a, b in zip(found, exact))
+    m = min(single_row, len(Q))
+    t0 = time.perf_counter()
+    for i in range(m):
+        brute_kneighbors(index.X, Q[i:i + 1], k)
+    exact_single = (time.perf_counter() - t0) / max(m, 1)
+    t0 = time.perf_counter()
+    for i in range(m):
+        index.kneighbors(Q[i:i + 1], n_neighbors=k)
+    index_single = (time.perf_counter() - t0) / max(m, 1)
+
+    return {
+        "method": index.method,
+        "n_train": int(index.X.shape[0]),
+        "n_features": int(index.X.shape[1]),
+        "n_queries": int(len(Q)),
+        "k": int(k),
+        f"recall_at_{k}": hits / (len(Q) * k),
+        "exact_batch_ms": exact_batch * 1e3,
+        "index_batch_ms": index_batch * 1e3,
+        "exact_single_row_ms": exact_single * 1e3,
+        "index_single_row_ms": index_single * 1e3,
+    }
+
+
+def main(argv=None):
+    from core.model_registry import get_registry
+
+    parser = argparse.ArgumentParser(description="Recall/latency of a neighbour index against exact search.")
+    parser.add_argument("--model", default=None, help="pickled pipeline (default: current registry version)")
+    parser.add_argument("--method", choices=INDEX_METHODS, default="brute")
+    parser.add_argument("--n-lists", type=int, default=None, help="ivf partitions (default: sqrt(n))")
+    parser.add_argument("--n-probe", type=int, default=8, help="ivf partitions scanned per query")
+    parser.add_argument("--queries", type=int, default=1000, help="training rows reused as queries")
+    args = parser.parse_args(argv)
+
+    if args.model:
+        with open(args.model, "rb") as f:
+            pipeline = pickle.load(f)
+    else:
+        registry = get_registry()
+        pipeline = registry.load(registry.current_version())
+    if pipeline is None:
+        parser.error("no model available")
+
+    index = NeighbourIndex.from_pipeline(pipeline, method=args.method, n_lists=args.n_lists, n_probe=args.n_probe)
+    rng = np.random.default_rng(0)
+    rows = rng.choice(index.X.shape[0], size=min(args.queries, index.X.shape[0]), replace=False)
+    # Jitter so queries are not exact hits on their own training rows.
+    queries = index.X[rows] + rng.normal(0, 0.05, size=(len(rows), index.X.shape[1])).astype(np.float32)
+    print(json.dumps(recall_report(index, queries), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+import copy
+import functools
+import operator
+import threading
+from datetime import datetime, timezone
+
+from google.cloud.firestore_v1.transforms import SERVER_TIMESTAMP
+
+# Firestore's comparison operators, as used by FieldFilter.op_string / where(field, op, value).
+_OPERATORS = {
+    "<": operator.lt,
+    "<=": operator.le,
+    "==": operator.eq,
+    "!=": operator.ne,
+    ">=": operator.ge,
+    ">": operator.gt,
+    "in": lambda a, b: a in b,
+    "not-in": lambda a, b: a not in b,
+    "array_contains": lambda a, b: isinstance(a, list) and b in a,
+}
+
+DOCUMENT_ID = "__name__"
+
+
+def _resolve_transforms(data):
+    """Replace SERVER_TIMESTAMP sentinels with the write time, as the server would."""
+    now = datetime.now(timezone.utc)
+    return {k: now if v is SERVER_TIMESTAMP else copy.deepcopy(v) for k, v in data.items()}
+
+
+class MemorySnapshot:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field):
+        return self.id if field == DOCUMENT_ID else self._data.get(field)
+
+
+class MemoryDocument:
+    def __init__(self, collection, doc_id):
+        self._collection = collection
+        self.id = doc_id
+
+    def set(self, data, merge=False):
+        with self._collection.lock:
+            docs = self._collection.docs
+            if merge and self.id in docs:
+                docs[self.id] = {**docs[self.id], **_resolve_transforms(data)}
+            else:
+                docs[self.id] = _resolve_transforms(data)
+            self._collection.version += 1
+
+    def get(self):
+        return MemorySnapshot(self.id, self._collection.docs.get(self.id))
+
+    def delete(self):
+        with self._collection.lock:
+            self._collection.docs.pop(self.id, None)
+            self._collection.version += 1
+
+
+class MemoryQuery:
+    """Immutable query over one collection, built like google.cloud.firestore.Query."""
+
+    def __init__(self, collection, orders=(), filters=(), limit=None, cursor=None, fields=None):
+        self._collection = collection
+        self._orders = tuple(orders)
+        self._filters = tuple(filters)
+        self._limit = limit
+        self._cursor = cursor
+        self._fields = fields
+
+    def _copy(self, **changes):
+        state = {"orders": self._orders, "filters": self._filters, "limit": self._limit,
+                 "cursor": self._cursor, "fields": self._fields}
+        state.update(changes)
+        return MemoryQuery(self._collection, **state)
+
+    def order_by(self, field, direction="ASCENDING"):
+        return self._copy(orders=self._orders + ((field, direction == "DESCENDING"),))
+
+    def where(self, field=None, op=None, value=None, filter=None):
+        if filter is not None:
+            field, op, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + ((field, _OPERATORS[op], value),))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def select(self, field_paths):
+        return self._copy(fields=tuple(field_paths))
+
+    def start_after(self, values):
+        if isinstance(values, MemorySnapshot):
+            values = [values.get(field) for field, _ in self._orders]
+        elif isinstance(values, dict):
+            values = [values.get(field) for field, _ in self._orders]
+        return self._copy(cursor=list(values))
+
+    def _compare(self, a, b):
+        """Order two snapshots (or a snapshot and cursor values) by the query's order_by fields."""
+        for i, (field, descending) in enumerate(self._orders):
+            x = a.get(field)
+            y = b[i] if isinstance(b, list) else b.get(field)
+            if x != y:
+                result = -1 if x < y else 1
+                return -result if descending else result
+        return 0
+
+    def _first_after(self, ordered):
+        """Index of the first snapshot in `ordered` that sorts after the cursor (binary search)."""
+        lo, hi = 0, len(ordered)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._compare(ordered[mid], self._cursor) > 0:
+                hi = mid
+            else:
+                lo = mid + 1
+        return lo
+
+    def _matches(self):
+        ordered = self._collection.ordered(self._orders, self._compare)
+        start = self._first_after(ordered) if self._cursor is not None else 0
+        returned = 0
+        for i in range(start, len(ordered)):
+            snapshot = ordered[i]
+            if self._limit is not None and returned >= self._limit:
+                break
+            if all(snapshot.get(f) is not None and op(snapshot.get(f), v) for f, op, v in self._filters):
+                returned += 1
+                yield snapshot
+
+    def stream(self):
+        for snapshot in self._matches():
+            data = snapshot._data
+            if self._fields is not None:
+                data = {f: data[f] for f in self._fields if f in data}
+            yield MemorySnapshot(snapshot.id, copy.deepcopy(data))
+
+    def get(self):
+        return list(self.stream())
+
+    # --- aggregation ---
+    def count(self, alias=None):
+        return MemoryAggregationQuery(self).count(alias)
+
+    def sum(self, field_ref, alias=None):
+        return MemoryAggregationQuery(self).sum(field_ref, alias)
+
+    def avg(self, field_ref, alias=None):
+        return MemoryAggregationQuery(self).avg(field_ref, alias)
+
+
+class MemoryAggregationResult:
+    def __init__(self, alias, value):
+        self.alias = alias
+        self.value = value
+
+
+class MemoryAggregationQuery:
+    """count/sum/avg over a query's matches; like Firestore, sum/avg skip non-numeric values."""
+
+    def __init__(self, query):
+        self._query = query
+        self._aggregations = []
+
+    def _add(self, kind, field, alias):
+        self._aggregations.append((kind, field, alias or f"field_{len(self._aggregations) + 1}"))
+        return self
+
+    def count(self, alias=None):
+        return self._add("count", None, alias)
+
+    def sum(self, field_ref, alias=None):
+        return self._add("sum", field_ref, alias)
+
+    def avg(self, field_ref, alias=None):
+        return self._add("avg", field_ref, alias)
+
+    def get(self):
+        matches = list(self._query._matches())
+        results = []
+        for kind, field, alias in self._aggregations:
+            if kind == "count":
+                value = len(matches)
+            else:
+                numbers = [v for v in (s.get(field) for s in matches)
+                           if isinstance(v, (int, float)) and not isinstance(v, bool)]
+                if kind == "sum":
+                    value = sum(numbers)
+                else:
+                    value = sum(numbers) / len(numbers) if numbers else None
+            results.append(MemoryAggregationResult(alias, value))
+        return [results]
+
+
+class MemoryCollection(MemoryQuery):
+    def __init__(self, name):
+        self.id = name
+        self.docs = {}
+        self.lock = threading.Lock()
+        self.version = 0
+        self._ordered = {}   # order_by fields -> (version, sorted snapshots)
+        super().__init__(self)
+
+    def ordered(self, orders, compare):
+        """
+        Snapshots sorted by `orders`, cached until the next write so paging through a
+        collection sorts it once rather than once per page. Like Firestore, ordering by
+        a field excludes documents that lack it.
+        """
+        with self.lock:
+            cached = self._ordered.get(orders)
+            if cached is not None and cached[0] == self.version:
+                return cached[1]
+            snapshots = [MemorySnapshot(doc_id, data) for doc_id, data in self.docs.items()]
+            snapshots = [s for s in snapshots if all(s.get(field) is not None for field, _ in orders)]
+            if orders:
+                snapshots.sort(key=functools.cmp_to_key(compare))
+            self._ordered[orders] = (self.version, snapshots)
+            return snapshots
+
+    def document(self, doc_id):
+        if not doc_id or "/" in doc_id:
+            # The real client reads "/" as a path separator and rejects the odd-length path.
+            raise ValueError(f"A document must have an even number of path elements: {self.id}/{doc_id}")
+        return MemoryDocument(self, doc_id)
+
+
+class MemoryBatch:
+    def __init__(self):
+        self._writes = []
+
+    def set(self, reference, data, merge=False):
+        self._writes.append((reference, data, merge))
+
+    def commit(self):
+        for reference, data, merge in self._writes:
+            reference.set(data, merge=merge)
+        self._writes = []
+
+
+class MemoryFirestore:
+    """
+    In-process stand-in for the subset of the Firestore client this app uses:
+    collection/document get and set, batched writes, queries with where/order_by/
+    limit/start_after/select, and count/sum/avg aggregation queries. Documents are deep-copied in and out like a real round trip,
+    but there is no network, so it measures client-side cost only. SERVER_TIMESTAMP
+    fields take the time of the write.
+    Used by the benchmarks (core.benchmark).
+    """
+
+    def __init__(self):
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def collection(self, name):
+        with self._lock:
+            if name not in self._collections:
+                self._collections[name] = MemoryCollection(name)
+            return self._collections[name]
+
+    def batch(self):
+        return MemoryBatch()
+
+    def load(self, collection, docs):
+        """Bulk-insert {doc_id: data} without per-document copies (for seeding fixtures)."""
+        target = self.collection(collection)
+        with target.lock:
+            target.docs.update(docs)
+            target.version += 1
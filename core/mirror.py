@@ -0,0 +1,319 @@
+import os
+import threading
+import time
+
+import duckdb
+import pandas as pd
+from google.cloud import firestore
+from google.cloud.firestore_v1.base_query import FieldFilter
+
+from core.features import SCHEMA
+from core.shared import process_singleton
+from core.timeline import TIMELINE_COLUMNS, TIMELINE_SOURCES, merge_timeline
+from core.tracing import span
+
+MIRROR_PATH = os.path.join("data", "mirror.duckdb")
+SYNC_INTERVAL_SECONDS = 60
+SYNC_PAGE_SIZE = 500
+# Server-side time of a document's last write. Every writer sets it (see `stamped`), so
+# sync sees late-arriving documents and edits that leave Date unchanged.
+UPDATED_AT = "Updated_At"
+
+# Fields mirrored per collection, in display order.
+COLLECTION_COLUMNS = {
+    "Patients": SCHEMA.legacy_patient_columns,
+    "Hasil_KNN": SCHEMA.result_columns,
+}
+
+
+def _sql_type(column):
+    if column == "Date":
+        return "TIMESTAMPTZ"
+    if column in SCHEMA.text_columns:
+        return "VARCHAR"
+    return "DOUBLE"
+
+
+def stamped(fields):
+    """`fields` plus the Updated_At server timestamp, for a Firestore set or merge."""
+    return {**fields, UPDATED_AT: firestore.SERVER_TIMESTAMP}
+
+
+def _timeline_type(column):
+    if column == "Version":
+        return "INTEGER"
+    if column in ("Patient_ID", "Result_ID", "Record_ID"):
+        return "VARCHAR"
+    return _sql_type(column)
+
+
+def _where(conditions, table=None):
+    """SQL predicate and parameters for (field, op, value) triples (see HistoryFilters)."""
+    prefix = f"{table}." if table else ""
+    clauses = [f'{prefix}"{field}" {"=" if op == "==" else op} ?' for field, op, _ in conditions]
+    return " AND ".join(clauses) or "TRUE", [value for _, _, value in conditions]
+
+
+def _docs_to_frame(docs, columns):
+    """Firestore snapshots -> typed DataFrame (doc_id + `columns`) ready for upsert."""
+    records = []
+    for doc in docs:
+        data = doc.to_dict()
+        data["Patient_Name"] = doc.id
+        data["doc_id"] = doc.id
+        records.append(data)
+    df = SCHEMA.normalize_fields(pd.DataFrame.from_records(records)).reindex(columns=["doc_id", *columns])
+    for col in columns:
+        sql_type = _sql_type(col)
+        if sql_type == "TIMESTAMPTZ":
+            df[col] = pd.to_datetime(df[col], utc=True, errors="coerce")
+        elif sql_type == "DOUBLE":
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype(float)
+        else:
+            df[col] = df[col].astype("string")
+    return df
+
+
+class LocalMirror:
+    """
+    Incremental local copy of the Firestore history collections in DuckDB.
+      - each collection is a table keyed by document id
+      - sync pulls only documents with Updated_At >= the last watermark, in Updated_At
+        order, and upserts them
+      - documents written without Updated_At (older records, other writers) are pulled
+        by Date >= the newest mirrored Date instead, as before
+      - readers query the local tables instead of downloading whole collections
+      - a patient_timeline table (see core.timeline) is kept up to date per touched patient
+        on every upsert and indexed on Patient_ID
+    Deletions are not picked up.
+    """
+
+    def __init__(self, path=MIRROR_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._conn = duckdb.connect(path)
+        self._conn.execute("SET TimeZone='UTC'")
+        self._write_lock = threading.Lock()
+        self._last_sync = {}
+        self._create_tables()
+
+    def _create_tables(self):
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS _sync_state (collection VARCHAR PRIMARY KEY, watermark TIMESTAMPTZ)"
+        )
+        # Mirrors created before Updated_At existed pull every stamped document once.
+        self._conn.execute("ALTER TABLE _sync_state ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ")
+        for collection, columns in COLLECTION_COLUMNS.items():
+            cols = ", ".join(f'"{c}" {_sql_type(c)}' for c in columns)
+            self._conn.execute(f'CREATE TABLE IF NOT EXISTS "{collection}" (doc_id VARCHAR PRIMARY KEY, {cols})')
+            # Mirrors created by an older schema gain any newly projected columns.
+            for c in columns:
+                self._conn.execute(f'ALTER TABLE "{collection}" ADD COLUMN IF NOT EXISTS "{c}" {_sql_type(c)}')
+            self._conn.execute(
+                f'CREATE INDEX IF NOT EXISTS "{collection}_patient" ON "{collection}" ("Patient_ID")'
+            )
+
+        has_timeline = self._conn.execute(
+            "SELECT count(*) FROM information_schema.tables WHERE table_name = 'patient_timeline'"
+        ).fetchone()[0]
+        cols = ", ".join(f'"{c}" {_timeline_type(c)}' for c in TIMELINE_COLUMNS)
+        self._conn.execute(f"CREATE TABLE IF NOT EXISTS patient_timeline ({cols})")
+        self._conn.execute('CREATE INDEX IF NOT EXISTS timeline_patient ON patient_timeline ("Patient_ID")')
+        if not has_timeline:
+            # Mirrors created before the timeline existed are backfilled once.
+            self._refresh_timeline(self._conn, None)
+
+    def cursor(self):
+        """Per-thread connection to the same database."""
+        c = self._conn.cursor()
+        c.execute("SET TimeZone='UTC'")
+        return c
+
+    # --- sync ---
+    def watermark(self, collection, field="Date"):
+        """Newest `field` ("Date" or UPDATED_AT) value pulled so far, or None."""
+        column = "updated_at" if field == UPDATED_AT else "watermark"
+        row = self.cursor().execute(
+            f"SELECT {column} FROM _sync_state WHERE collection = ?", [collection]
+        ).fetchone()
+        return row[0] if row else None
+
+    def sync(self, db, collection):
+        """Pull documents changed since the last watermarks; returns how many were upserted."""
+        with self._write_lock:
+            # Date first: where a document is pulled by both, the Updated_At read is the newer one.
+            synced = self._pull(db, collection, "Date")
+            synced += self._pull(db, collection, UPDATED_AT)
+            self._last_sync[collection] = time.monotonic()
+        return synced
+
+    def _pull(self, db, collection, field):
+        """Upsert the documents with `field` >= its watermark, in `field` order (write lock held)."""
+        columns = COLLECTION_COLUMNS[collection]
+        watermark = self.watermark(collection, field)
+        # Only the mirrored fields are transferred.
+        query = (db.collection(collection).select([*SCHEMA.stored_fields(columns), UPDATED_AT])
+                 .order_by(field).order_by("__name__"))
+        if watermark is not None:
+            query = query.where(filter=FieldFilter(field, ">=", watermark))
+
+        synced = 0
+        cursor = None
+        while True:
+            page_query = query.limit(SYNC_PAGE_SIZE)
+            if cursor is not None:
+                page_query = page_query.start_after(cursor)
+            with span("firestore.query", collection=collection):
+                docs = list(page_query.stream())
+            if not docs:
+                break
+            with span("mirror.upsert", collection=collection):
+                df = _docs_to_frame(docs, columns)
+                conn = self.cursor()
+                conn.register("batch_df", df)
+                # Patients whose entries change: the new values and any a document moved away from.
+                touched = set(df["Patient_ID"].dropna()) | {row[0] for row in conn.execute(
+                    f'SELECT DISTINCT "Patient_ID" FROM "{collection}" '
+                    f'WHERE doc_id IN (SELECT doc_id FROM batch_df) AND "Patient_ID" IS NOT NULL'
+                ).fetchall()}
+                col_list = ", ".join(f'"{c}"' for c in ["doc_id", *columns])
+                conn.execute(f'INSERT OR REPLACE INTO "{collection}" ({col_list}) SELECT {col_list} FROM batch_df')
+                conn.unregister("batch_df")
+                self._refresh_timeline(conn, touched)
+                if field == UPDATED_AT:
+                    conn.execute(
+                        "INSERT INTO _sync_state (collection, updated_at) VALUES (?, ?) "
+                        "ON CONFLICT (collection) DO UPDATE SET updated_at = excluded.updated_at",
+                        [collection, docs[-1].get(UPDATED_AT)],
+                    )
+                else:
+                    conn.execute(
+                        f'INSERT INTO _sync_state (collection, watermark) '
+                        f'VALUES (?, (SELECT max("Date") FROM "{collection}")) '
+                        f'ON CONFLICT (collection) DO UPDATE SET watermark = excluded.watermark',
+                        [collection],
+                    )
+            synced += len(docs)
+            last = docs[-1]
+            cursor = [last.get(field), last.id]
+            if len(docs) < SYNC_PAGE_SIZE:
+                break
+        return synced
+
+    def sync_if_stale(self, db, collection, max_age=SYNC_INTERVAL_SECONDS):
+        last = self._last_sync.get(collection)
+        if last is None or time.monotonic() - last > max_age:
+            return self.sync(db, collection)
+        return 0
+
+    def update_fields(self, collection, doc_id, fields):
+        """
+        Apply a field update this process just made to an existing document, so it shows
+        before the next sync (which pulls it again by Updated_At).
+        """
+        assignments = ", ".join(f'"{c}" = ?' for c in fields)
+        with self._write_lock:
+            conn = self.cursor()
+            conn.execute(f'UPDATE "{collection}" SET {assignments} WHERE doc_id = ?', [*fields.values(), doc_id])
+            row = conn.execute(f'SELECT "Patient_ID" FROM "{collection}" WHERE doc_id = ?', [doc_id]).fetchone()
+            if row and row[0] is not None:
+                self._refresh_timeline(conn, {row[0]})
+
+    def _refresh_timeline(self, conn, patient_ids):
+        """
+        Recompute the timeline entries of `patient_ids` (every patient when None) from the
+        mirrored tables; callers hold the write lock.
+        """
+        if patient_ids is not None and not patient_ids:
+            return
+        with span("mirror.timeline", patients=None if patient_ids is None else len(patient_ids)):
+            where = "TRUE"
+            if patient_ids is not None:
+                conn.register("touched_df", pd.DataFrame({"Patient_ID": sorted(map(str, patient_ids))}))
+                where = '"Patient_ID" IN (SELECT "Patient_ID" FROM touched_df)'
+            frames = {}
+            for collection, fields in TIMELINE_SOURCES.items():
+                col_list = ", ".join(f'"{c}"' for c in ["doc_id", *fields])
+                frames[collection] = conn.execute(f'SELECT {col_list} FROM "{collection}" WHERE {where}').df()
+            entries = merge_timeline(frames["Patients"], frames["Hasil_KNN"])
+            conn.execute(f"DELETE FROM patient_timeline WHERE {where}")
+            conn.register("timeline_df", entries)
+            col_list = ", ".join(f'"{c}"' for c in TIMELINE_COLUMNS)
+            conn.execute(f"INSERT INTO patient_timeline ({col_list}) SELECT {col_list} FROM timeline_df")
+            conn.unregister("timeline_df")
+            if patient_ids is not None:
+                conn.unregister("touched_df")
+
+    def mark_stale(self, collection=None):
+        """Force the next sync_if_stale to hit Firestore (e.g. right after a write)."""
+        if collection is None:
+            self._last_sync.clear()
+        else:
+            self._last_sync.pop(collection, None)
+
+    # --- reads ---
+    def count(self, collection, conditions=()):
+        where, params = _where(conditions)
+        return self.cursor().execute(f'SELECT count(*) FROM "{collection}" WHERE {where}', params).fetchone()[0]
+
+    def read_page(self, collection, columns, page_size, page=0, conditions=()):
+        """One page of `collection` matching `conditions`, newest first, projected onto `columns`."""
+        col_list = ", ".join(f'"{c}"' for c in columns)
+        where, params = _where(conditions)
+        with span("mirror.read_page", collection=collection):
+            return self.cursor().execute(
+                f'SELECT {col_list} FROM "{collection}" WHERE {where} '
+                f'ORDER BY "Date" DESC, doc_id DESC LIMIT ? OFFSET ?',
+                [*params, page_size, page * page_size],
+            ).df()
+
+    def aggregate_periods(self, collection, periods, fields, conditions=()):
+        """
+        Same frame as core.history.aggregate_periods, computed in one SQL pass: `periods`
+        [(label, start, end)] are joined against the rows matching `conditions`.
+        """
+        bounds = pd.DataFrame(periods, columns=["label", "lo", "hi"])
+        bounds["lo"] = pd.to_datetime(bounds["lo"], utc=True)
+        bounds["hi"] = pd.to_datetime(bounds["hi"], utc=True)
+        means = "".join(f', avg(t."{f}") AS "Mean {f}"' for f in fields)
+        where, params = _where(conditions, table="t")
+        conn = self.cursor()
+        conn.register("periods_df", bounds)
+        try:
+            with span("mirror.aggregate", collection=collection):
+                return conn.execute(
+                    f'SELECT p.label AS "Period", count(t.doc_id) AS "Count"{means} '
+                    f'FROM periods_df p LEFT JOIN "{collection}" t '
+                    f'ON t."Date" >= p.lo AND t."Date" < p.hi AND {where} '
+                    f'GROUP BY p.label, p.lo ORDER BY p.lo',
+                    params,
+                ).df()
+        finally:
+            conn.unregister("periods_df")
+
+    def timeline(self, patient_id):
+        """One patient's timeline entries, oldest first (an index lookup on Patient_ID)."""
+        col_list = ", ".join(f'"{c}"' for c in TIMELINE_COLUMNS)
+        with span("mirror.timeline_read"):
+            return self.cursor().execute(
+                f'SELECT {col_list} FROM patient_timeline WHERE "Patient_ID" = ? ORDER BY "Version"', [patient_id]
+            ).df()
+
+    def query(self, sql, params=None):
+        """Run an ad-hoc analytics query against the mirrored tables."""
+        return self.cursor().execute(sql, params or []).df()
+
+
+@process_singleton
+def get_mirror():
+    """The mirror shared by every session in this server process."""
+    return LocalMirror()
+
+
+def mark_mirror_stale():
+    """Mark the mirror stale if this process has opened one; never creates it."""
+    mirror = get_mirror.peek()
+    if mirror is not None:
+        mirror.mark_stale()
@@ -0,0 +1,305 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+
+import numpy as np
+
+from core.compact_model import CompactKNN, export_compact, export_delta, load_delta
+from core.shared import process_singleton
+from core.tracing import span
+
+MODELS_DIR = "models"
+LEGACY_MODEL_PATH = "model.pkl"
+CURRENT_POINTER = "CURRENT"
+MAX_IDLE_VERSIONS = 2      # resident versions beyond the current one and those sessions pin
+PIN_TTL_SECONDS = 3600     # a session pin lapses after this long without a rerun
+
+
+def _atomic_write(path, data: bytes):
+    """Write `data` to `path` via a temp file + rename so readers never see a partial file."""
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+@dataclass(frozen=True)
+class Delta:
+    """Rows an incremental update appended to its parent version (see save_delta)."""
+    parent: str
+    watermark: datetime      # latest Outcome_Date included, or None
+    X: np.ndarray            # (n, d) float32, already transformed by the parent's preprocessing
+    y: np.ndarray            # (n,) labels encoded as indices into the model's classes
+    doc_ids: list            # Hasil_KNN document each row came from
+
+
+class ModelRegistry:
+    """
+    Process-wide store of fitted pipelines.
+      - every saved model is written once as models/model-<hash>.pkl (never overwritten)
+      - models/CURRENT names the version new sessions should start on
+      - each version is unpickled at most once per process and shared by all sessions
+      - resident versions are bounded: besides the current version and those live sessions
+        have pinned, only the MAX_IDLE_VERSIONS most recently used stay in memory; others
+        are dropped with their derived artifacts and reloaded from disk if asked for again
+      - falls back to the legacy model.pkl when nothing has been saved yet
+      - each version may also have a pickle-free models/model-<hash>.arrow (see CompactKNN)
+      - an incremental update is stored as models/model-<hash>.delta.arrow holding only the
+        appended rows on top of its parent version; the full model is assembled on load
+    """
+
+    def __init__(self, models_dir=MODELS_DIR, legacy_path=LEGACY_MODEL_PATH):
+        self.models_dir = models_dir
+        self.legacy_path = legacy_path
+        # Re-entrant: derived() factories may call load() while the lock is held.
+        self._lock = threading.RLock()
+        self._models = {}        # version -> pipeline
+        self._stat_versions = {}  # (path, mtime_ns, size) -> version
+        self._derived = {}       # (version, name) -> artifact built from that version
+        self._deltas = {}        # version -> Delta
+        self._pins = {}          # session id -> (version, expiry on the monotonic clock)
+        self._last_used = {}     # version -> monotonic time of its last load/derived lookup
+
+    # --- version naming ---
+    def _path_for(self, version):
+        return os.path.join(self.models_dir, f"model-{version}.pkl")
+
+    def _compact_path(self, version):
+        return os.path.join(self.models_dir, f"model-{version}.arrow")
+
+    def _delta_path(self, version):
+        return os.path.join(self.models_dir, f"model-{version}.delta.arrow")
+
+    def _pointer_path(self):
+        return os.path.join(self.models_dir, CURRENT_POINTER)
+
+    def _version_of_file(self, path):
+        """Content hash of a model file, memoized on (mtime, size) so the file is hashed once."""
+        st = os.stat(path)
+        key = (path, st.st_mtime_ns, st.st_size)
+        version = self._stat_versions.get(key)
+        if version is None:
+            with open(path, "rb") as f:
+                version = hashlib.sha256(f.read()).hexdigest()[:16]
+            self._stat_versions[key] = version
+        return version
+
+    def current_version(self):
+        """Version new sessions should use, or None if no model exists at all."""
+        try:
+            with open(self._pointer_path(), "r") as f:
+                version = f.read().strip()
+            if version and (os.path.exists(self._path_for(version)) or os.path.exists(self._delta_path(version))):
+                return version
+        except FileNotFoundError:
+            pass
+        if os.path.exists(self.legacy_path):
+            return self._version_of_file(self.legacy_path)
+        return None
+
+    # --- load / save ---
+    def load(self, version):
+        """Return the pipeline for `version`, unpickling it only on first use in this process."""
+        if version is None:
+            return None
+        self._last_used[version] = time.monotonic()
+        model = self._models.get(version)
+        if model is not None:
+            return model
+        with self._lock:
+            model = self._models.get(version)
+            if model is not None:
+                return model
+            path = self._path_for(version)
+            if not os.path.exists(path):
+                if self.delta(version) is not None:
+                    model = self._assemble(version)
+                    self._models[version] = model
+                    self._evict()
+                    return model
+                # Legacy model.pkl is addressed by its content hash as well.
+                if os.path.exists(self.legacy_path) and self._version_of_file(self.legacy_path) == version:
+                    path = self.legacy_path
+                else:
+                    return None
+            with span("model.unpickle"), open(path, "rb") as f:
+                model = pickle.load(f)
+            self._models[version] = model
+            self._evict()
+            return model
+
+    # --- incremental versions ---
+    def delta(self, version):
+        """The Delta stored for `version`, or None when it is a full model."""
+        delta = self._deltas.get(version)
+        if delta is None and version is not None and os.path.exists(self._delta_path(version)):
+            meta, X, y, doc_ids = load_delta(self._delta_path(version))
+            watermark = datetime.fromisoformat(meta["watermark"]) if meta["watermark"] else None
+            delta = self._deltas[version] = Delta(meta["parent"], watermark, X, y, doc_ids)
+        return delta
+
+    def lineage(self, version):
+        """(full base version, [Delta, ...] oldest first) that `version` is assembled from."""
+        chain = []
+        delta = self.delta(version)
+        while delta is not None:
+            chain.append(delta)
+            version = delta.parent
+            delta = self.delta(version)
+        return version, chain[::-1]
+
+    def _assemble(self, version):
+        """Pipeline for an incremental version: its base with every appended row stacked on."""
+        from core.incremental import append_rows
+
+        base, chain = self.lineage(version)
+        pipeline = self.load(base)
+        if pipeline is None:
+            return None
+        X = np.vstack([delta.X for delta in chain])
+        y = np.concatenate([delta.y for delta in chain])
+        return append_rows(pipeline, X, y, [i for delta in chain for i in delta.doc_ids], chain[-1].watermark)
+
+    def save_delta(self, parent, Xt_new, y_new, doc_ids, watermark=None, make_current=True):
+        """
+        Persist rows appended to `parent` as a new version without rewriting the model:
+        only the new rows are written and hashed, and artifacts already built for the
+        parent in this process are extended (carry_derived). Returns the version id.
+        """
+        Xt_new = np.ascontiguousarray(Xt_new, dtype=np.float32)
+        meta = {"parent": parent, "watermark": watermark.isoformat() if watermark else None}
+        data = export_delta(Xt_new, y_new, doc_ids, meta)
+        version = hashlib.sha256(data).hexdigest()[:16]
+        with self._lock:
+            os.makedirs(self.models_dir, exist_ok=True)
+            path = self._delta_path(version)
+            if not os.path.exists(path):
+                _atomic_write(path, data)
+            self._deltas[version] = Delta(parent, watermark, Xt_new, np.asarray(y_new), list(doc_ids))
+            self.carry_derived(parent, version, Xt_new, y_new)
+            self._last_used[version] = time.monotonic()
+            if make_current:
+                _atomic_write(self._pointer_path(), version.encode())
+            self._evict()
+        return version
+
+    def derived(self, version, name, factory):
+        """Artifact computed from a model version (e.g. a neighbour index), built once per process."""
+        key = (version, name)
+        self._last_used[version] = time.monotonic()
+        artifact = self._derived.get(key)
+        if artifact is None:
+            with self._lock:
+                artifact = self._derived.get(key)
+                if artifact is None:
+                    artifact = factory()
+                    self._derived[key] = artifact
+                    self._evict()
+        return artifact
+
+    def carry_derived(self, old_version, new_version, Xt_new, y_new):
+        """
+        Seed `new_version` with the artifacts already built for `old_version`, extended by
+        the appended rows instead of rebuilt (see NeighbourIndex.extend / CompactKNN.extend).
+        """
+        with self._lock:
+            for (version, name), artifact in list(self._derived.items()):
+                if version == old_version and artifact is not None and hasattr(artifact, "extend"):
+                    self._derived.setdefault((new_version, name), artifact.extend(Xt_new, y_new))
+
+    def load_compact(self, version):
+        """
+        Pickle-free predictor for `version`. Uses the exported .arrow artifact when present;
+        otherwise exports it once from the pickled pipeline. Returns None if neither works.
+        """
+        def build():
+            path = self._compact_path(version)
+            if not os.path.exists(path) and self.delta(version) is not None:
+                base, chain = self.lineage(version)
+                compact = self.load_compact(base)
+                if compact is None:
+                    return None
+                return compact.extend(np.vstack([delta.X for delta in chain]),
+                                      np.concatenate([delta.y for delta in chain]))
+            if not os.path.exists(path):
+                pipeline = self.load(version)
+                if pipeline is None:
+                    return None
+                os.makedirs(self.models_dir, exist_ok=True)
+                export_compact(pipeline, path)
+            with span("model.load_compact"):
+                return CompactKNN.load(path)
+
+        if version is None:
+            return None
+        return self.derived(version, "compact", build)
+
+    def save(self, pipeline, make_current=True):
+        """Persist `pipeline` as a new immutable version and return its version id."""
+        data = pickle.dumps(pipeline)
+        version = hashlib.sha256(data).hexdigest()[:16]
+        with self._lock:
+            os.makedirs(self.models_dir, exist_ok=True)
+            path = self._path_for(version)
+            if not os.path.exists(path):
+                _atomic_write(path, data)
+            try:
+                export_compact(pipeline, self._compact_path(version))
+            except ValueError:
+                pass  # not a Euclidean KNN pipeline; only the pickle is available
+            self._models[version] = pipeline
+            self._last_used[version] = time.monotonic()
+            if make_current:
+                _atomic_write(self._pointer_path(), version.encode())
+            self._evict()
+        return version
+
+    # --- residency ---
+    def pin(self, session_id, version):
+        """
+        Keep `version` resident for `session_id` (renewed on every call, e.g. each rerun);
+        a session that stops calling releases it after PIN_TTL_SECONDS.
+        """
+        with self._lock:
+            if version is None:
+                self._pins.pop(session_id, None)
+            else:
+                self._pins[session_id] = (version, time.monotonic() + PIN_TTL_SECONDS)
+        return version
+
+    def resident_versions(self):
+        with self._lock:
+            return set(self._models) | {version for version, _ in self._derived} | set(self._deltas)
+
+    def _evict(self):
+        """Drop versions beyond MAX_IDLE_VERSIONS that are neither current nor pinned (lock held)."""
+        now = time.monotonic()
+        self._pins = {s: pin for s, pin in self._pins.items() if pin[1] > now}
+        keep = {version for version, _ in self._pins.values()} | {self.current_version()}
+        idle = sorted((v for v in self.resident_versions() if v not in keep),
+                      key=lambda v: self._last_used.get(v, 0.0))
+        for version in idle[:max(0, len(idle) - MAX_IDLE_VERSIONS)]:
+            self._models.pop(version, None)
+            self._deltas.pop(version, None)
+            self._last_used.pop(version, None)
+            for key in [key for key in self._derived if key[0] == version]:
+                del self._derived[key]
+
+
+@process_singleton
+def get_registry():
+    """The registry shared by every session in this server process."""
+    return ModelRegistry()
@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+
+from core.features import SCHEMA
+
+
+def score_patients(df: pd.DataFrame, schema=SCHEMA):
+    """
+    Rule-based survival score for every row of `df` at once.
+      - a variable counts only when its value is present (missing columns count as missing)
+      - significant variables weigh double, both in the total and when within limit
+      - numerics are within limit at <= default, or >= default for higher-or-equal variables
+      - categoricals are within limit when they equal the expected value
+    Returns (scores, within): a float Series named "RuleBased_Score" (NaN when no variable
+    was filled in) and a boolean DataFrame of within-limit flags, one column per variable.
+    """
+    num = df.reindex(columns=schema.numeric).apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)
+    cat = df.reindex(columns=schema.categorical).to_numpy(dtype=object)
+
+    num_present = ~np.isnan(num)
+    with np.errstate(invalid="ignore"):
+        num_within = np.where(schema.num_higher, num >= schema.num_thresholds, num <= schema.num_thresholds) & num_present
+    cat_present = pd.notna(cat)
+    cat_within = (cat == schema.cat_expected) & cat_present
+
+    total = num_present @ schema.num_weights + cat_present @ schema.cat_weights
+    within = num_within @ schema.num_weights + cat_within @ schema.cat_weights
+    with np.errstate(invalid="ignore", divide="ignore"):
+        scores = np.where(total > 0, (within / total) * 100, np.nan)
+
+    flags = pd.DataFrame(
+        np.hstack([num_within, cat_within]), index=df.index, columns=schema.numeric + schema.categorical
+    )[schema.names]
+    return pd.Series(scores, index=df.index, name="RuleBased_Score"), flags
+
+
+def score_patient(user_data: dict, schema=SCHEMA):
+    """Single-patient wrapper: returns (score or None, tags of the variables within limit)."""
+    row = pd.DataFrame([{v: user_data.get(v, None) for v in schema.names}])
+    scores, flags = score_patients(row, schema)
+    score = scores.iloc[0]
+    within_limit_vars = [schema.tags[v] for v in schema.names if flags.iloc[0][v]]
+    return (None if np.isnan(score) else float(score)), within_limit_vars
@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+
+from core.features import SCHEMA
+from core.scoring import score_patients
+
+GRID_POINTS = 21
+DEFAULT_SPAN = 0.25   # numeric grids reach this fraction beyond the entered value and the threshold
+
+
+def _numeric_grid(value, threshold, points, span):
+    """Evenly spaced values covering the entered value and the rule threshold, widened by `span`."""
+    lo, hi = (threshold, threshold) if value is None else (min(value, threshold), max(value, threshold))
+    width = max(hi - lo, abs(hi), abs(lo)) * span or span
+    start = lo - width
+    if lo >= 0:
+        start = max(start, 0.0)   # non-negative measurements stay non-negative
+    grid = np.linspace(start, hi + width, points)
+    extras = [threshold] if value is None else [threshold, value]
+    # Rounding folds grid points that only differ from the extras by float noise.
+    return np.unique(np.round(np.concatenate([grid, extras]), 6))
+
+
+def perturbation_grid(user_data: dict, schema=SCHEMA, points=GRID_POINTS, span=DEFAULT_SPAN):
+    """
+    The patient as entered, followed by one row per (feature, candidate value) with only
+    that feature replaced:
+      - numerics sweep `points` values around the entered value and the rule threshold
+      - categoricals take every option
+    Other blank fields stay blank, so the rule score skips them and the model imputes
+    them exactly as it does for the entered patient.
+    Returns (grid in schema columns, perturbed feature per row, value per row); row 0 is the
+    unperturbed patient with feature None.
+    """
+    base = {v: user_data.get(v) for v in schema.names}
+    features, values = [None], [None]
+    for v in schema.names:
+        if v in schema.categorical_set:
+            candidates = schema.categorical_options[v]
+        else:
+            candidates = _numeric_grid(base[v], schema.defaults[v], points, span).tolist()
+        features.extend([v] * len(candidates))
+        values.extend(candidates)
+
+    features = np.asarray(features, dtype=object)
+    values_arr = np.asarray(values, dtype=object)
+    columns = {}
+    for v in schema.names:
+        column = np.full(len(features), base[v], dtype=object)
+        rows = features == v
+        column[rows] = values_arr[rows]
+        # Numerics stay float (blank -> NaN) so scoring and model input see the usual dtypes.
+        columns[v] = column if v in schema.categorical_set else pd.to_numeric(column, errors="coerce").astype(float)
+    return pd.DataFrame(columns, columns=schema.names), features, values
+
+
+def sensitivity(user_data: dict, predict=None, schema=SCHEMA, points=GRID_POINTS, span=DEFAULT_SPAN):
+    """
+    Rule-based score and KNN survival probability across `perturbation_grid`, computed as
+    one vectorized scoring pass and one batched neighbour query; nothing is persisted.
+    `predict` maps a model-input frame to a KNNResult (e.g. the calculator's worker-first
+    predictor), or returns None when no model is available.
+    Returns (curves, baseline):
+      - curves: one row per perturbation with Feature, Value, RuleBased_Score and, when
+        a prediction was made, KNN_Probability (percent)
+      - baseline: the same fields for the patient as entered
+    """
+    grid, features, values = perturbation_grid(user_data, schema, points, span)
+    scores, _ = score_patients(grid, schema)
+    frame = pd.DataFrame({"Feature": features, "Value": values, "RuleBased_Score": scores.to_numpy()})
+    result = predict(schema.model_input(grid)) if predict is not None else None
+    if result is not None:
+        frame["KNN_Probability"] = result.probability * 100.0
+    return frame.iloc[1:].reset_index(drop=True), frame.iloc[0]
+
+
+def swing(curves):
+    """Per feature, the range each output spans across its grid; largest KNN (else rule) swing first."""
+    outputs = [c for c in ("KNN_Probability", "RuleBased_Score") if c in curves]
+    grouped = curves.groupby("Feature", sort=False)[outputs]
+    table = (grouped.max() - grouped.min()).add_suffix(" swing").reset_index()
+    return table.sort_values(f"{outputs[0]} swing", ascending=False, ignore_index=True)
@@ -0,0 +1,47 @@
+import functools
+import threading
+
+
+class ProcessSingleton:
+    """
+    A factory whose result is built once per process and shared by every caller:
+      - the first call builds the instance under a lock; its arguments are used only then
+      - `valid` (optional) is checked on every call, and an instance failing it is rebuilt
+      - a factory that raises leaves nothing behind, so the next call tries again
+      - `peek()` returns the instance without building it; `clear()` drops it
+    Same role as @st.cache_resource (see core.db.get_db), but usable without a Streamlit
+    script context: from background threads, inference workers and `python -m core.*` tools.
+    """
+
+    def __init__(self, factory, valid=None):
+        functools.update_wrapper(self, factory)
+        self._factory = factory
+        self._valid = valid
+        self._instance = None
+        self._lock = threading.Lock()
+
+    def _usable(self, instance):
+        return instance is not None and (self._valid is None or self._valid(instance))
+
+    def __call__(self, *args, **kwargs):
+        instance = self._instance
+        if not self._usable(instance):
+            with self._lock:
+                instance = self._instance
+                if not self._usable(instance):
+                    instance = self._instance = self._factory(*args, **kwargs)
+        return instance
+
+    def peek(self):
+        return self._instance
+
+    def clear(self):
+        with self._lock:
+            self._instance = None
+
+
+def process_singleton(factory=None, *, valid=None):
+    """Decorator form of ProcessSingleton: `@process_singleton` or `@process_singleton(valid=...)`."""
+    if factory is None:
+        return lambda f: ProcessSingleton(f, valid=valid)
+    return ProcessSingleton(factory, valid=valid)
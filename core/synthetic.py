@@ -0,0 +1,65 @@
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+
+from core.features import SCHEMA
+from core.scoring import score_patients
+
+# Spread of each numeric around its calculator default (log-normal sigma).
+NUMERIC_SPREAD = 0.35
+
+
+def synthetic_patients(n, seed=0, missing_rate=0.1, schema=SCHEMA):
+    """
+    `n` fake patients shaped like the calculator form: Patient_ID, Patient_Name, Date
+    plus every schema variable.
+      - numerics are log-normal around their default (pH stays near 7.3)
+      - categoricals are drawn uniformly from their options
+      - each variable is blank with probability `missing_rate`
+      - a `Survival` label (0/1) that follows the rule-based score with noise,
+        so a KNN fitted on the frame has signal to learn
+    """
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "Patient_ID": [f"P{i:07d}" for i in range(n)],
+        "Patient_Name": [f"patient_{i:07d}" for i in range(n)],
+    })
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    df["Date"] = [start + timedelta(minutes=int(m)) for m in rng.integers(0, 60 * 24 * 365, size=n)]
+
+    for name in schema.numeric:
+        default = float(schema.defaults[name])
+        sigma = 0.02 if name == "pH" else NUMERIC_SPREAD
+        values = default * rng.lognormal(mean=0.0, sigma=sigma, size=n)
+        df[name] = np.round(values, 2)
+    for name in schema.categorical:
+        options = np.asarray(schema.categorical_options[name], dtype=object)
+        df[name] = options[rng.integers(0, len(options), size=n)]
+
+    if missing_rate:
+        mask = rng.random((n, len(schema.names))) < missing_rate
+        for j, name in enumerate(schema.names):
+            df.loc[mask[:, j], name] = None
+
+    scores, _ = score_patients(df, schema)
+    p_survive = 1.0 / (1.0 + np.exp(-(scores.fillna(50.0).to_numpy() - 50.0) / 10.0))
+    df["Survival"] = (rng.random(n) < p_survive).astype(int)
+    return df[["Patient_ID", "Patient_Name", "Date", *schema.names, "Survival"]]
+
+
+def synthetic_results(df, seed=0):
+    """Hasil_KNN-shaped documents ({doc_id: fields}) for the patients in `df`."""
+    rng = np.random.default_rng(seed)
+    scores, _ = score_patients(df)
+    probability = rng.uniform(0.0, 100.0, size=len(df))
+    frame = df.drop(columns=["Survival"], errors="ignore").assign(
+        RuleBased_Score=scores.to_numpy(),
+        KNN_Prediction=(probability >= 50).astype(int),
+        KNN_Probability=probability,
+    )
+    frame = frame.astype(object).where(frame.notna(), None)
+    return {
+        f"{row['Patient_Name']}_{row['Date']:%Y%m%d}": row
+        for row in frame.to_dict(orient="records")
+    }
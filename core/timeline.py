@@ -0,0 +1,72 @@
+import uuid
+
+import pandas as pd
+from google.cloud.firestore_v1.base_query import FieldFilter
+
+from core.features import SCHEMA
+from core.tracing import span
+
+# Fields each collection contributes to a timeline entry.
+TIMELINE_SOURCES = {
+    "Patients": ["Patient_ID", "Date", "Prediction_Score"],
+    "Hasil_KNN": ["Patient_ID", "Date", "RuleBased_Score", "KNN_Prediction", "KNN_Probability", "Survival"],
+}
+TIMELINE_COLUMNS = ["Patient_ID", "Version", "Date", "Result_ID", "Record_ID", "RuleBased_Score",
+                    "KNN_Prediction", "KNN_Probability", "Survival", "Prediction_Score"]
+
+
+def result_id(patient_name, date):
+    """
+    Hasil_KNN document id for one calculation. The name and day prefix keeps ids readable;
+    the time and random suffix keep same-day recalculations as separate entries instead of
+    overwriting each other.
+    """
+    return f"{patient_name}_{date:%Y%m%d}_{date:%H%M%S}_{uuid.uuid4().hex[:6]}"
+
+
+def merge_timeline(records: pd.DataFrame, results: pd.DataFrame) -> pd.DataFrame:
+    """
+    Patient timeline from legacy Patients rows and Hasil_KNN rows (each with a doc_id column).
+      - hash join on (Patient_ID, UTC day): a Patients record and the results calculated for
+        the same patient that day become one entry per result, so the two collections no
+        longer need cross-referencing by eye
+      - unmatched rows from either side stay as entries of their own
+      - Version numbers each patient's entries 1..n in Date order
+    Rows without a Patient_ID cannot be keyed and are left out.
+    """
+    def keyed(frame, id_column, fields):
+        frame = frame.reindex(columns=["doc_id", *fields]).rename(columns={"doc_id": id_column})
+        frame = frame[frame["Patient_ID"].notna() & (frame["Patient_ID"].astype(str) != "")].copy()
+        frame["Patient_ID"] = frame["Patient_ID"].astype(str)
+        frame["Date"] = pd.to_datetime(frame["Date"], utc=True, errors="coerce")
+        frame["Day"] = frame["Date"].dt.floor("D")
+        return frame
+
+    patients = keyed(records, "Record_ID", TIMELINE_SOURCES["Patients"])
+    results = keyed(results, "Result_ID", TIMELINE_SOURCES["Hasil_KNN"])
+    merged = results.merge(patients, on=["Patient_ID", "Day"], how="outer", suffixes=("", "_record"))
+    merged["Date"] = merged["Date"].fillna(merged["Date_record"])
+    merged = merged.sort_values(["Patient_ID", "Date", "Result_ID", "Record_ID"], ignore_index=True)
+    merged["Version"] = merged.groupby("Patient_ID").cumcount() + 1
+    return merged.reindex(columns=TIMELINE_COLUMNS)
+
+
+def query_timeline(db, patient_id, schema=SCHEMA):
+    """
+    One patient's timeline straight from Firestore: an equality query per collection on
+    Patient_ID (served by Firestore's automatic single-field index) with only the timeline
+    fields requested, merged with `merge_timeline`.
+    """
+    frames = {}
+    for collection, fields in TIMELINE_SOURCES.items():
+        query = (db.collection(collection)
+                 .where(filter=FieldFilter("Patient_ID", "==", patient_id))
+                 .select(schema.stored_fields(fields)))
+        rows = []
+        with span("firestore.query", collection=collection):
+            for doc in query.stream():
+                data = doc.to_dict()
+                data["doc_id"] = doc.id
+                rows.append(data)
+        frames[collection] = pd.DataFrame(rows)
+    return merge_timeline(frames["Patients"], frames["Hasil_KNN"])
@@ -0,0 +1,152 @@
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from core.shared import process_singleton
+
+TRACE_PATH = os.path.join("data", "traces.jsonl")
+RING_SIZE = 5000
+MAX_TRACE_BYTES = 50 * 1024 * 1024   # the JSON-lines file rotates to traces.jsonl.1 past this
+QUANTILES = (0.5, 0.95, 0.99)
+
+# Id of the rerun the current thread is executing (Streamlit runs each rerun in one thread).
+_rerun_id = contextvars.ContextVar("rerun_id", default=None)
+
+
+class Tracer:
+    """
+    Lightweight stage timings for the app:
+      - `span(stage)` times a block with perf_counter; spans of one rerun share a rerun id
+      - the last `maxlen` spans stay in an in-memory ring buffer for percentiles
+      - every span is also appended as one JSON line to `path` for offline analysis,
+        keeping one rotated file once it grows past MAX_TRACE_BYTES
+      - lifetime count/sum per stage back the Prometheus summary
+    """
+
+    def __init__(self, path=TRACE_PATH, maxlen=RING_SIZE):
+        self.path = path
+        self._spans = deque(maxlen=maxlen)
+        self._totals = {}   # stage -> [count, sum_seconds]
+        self._lock = threading.Lock()
+        self._file = None
+        self._file_bytes = 0
+
+    # --- recording ---
+    @contextmanager
+    def span(self, stage, **attrs):
+        error = False
+        t0 = time.perf_counter()
+        try:
+            yield
+        except BaseException as e:
+            # st.stop()/st.rerun() unwind with control-flow exceptions; only count real failures.
+            error = isinstance(e, Exception) and type(e).__module__.split(".")[0] != "streamlit"
+            raise
+        finally:
+            self.record(stage, time.perf_counter() - t0, error=error, **attrs)
+
+    def record(self, stage, seconds, error=False, **attrs):
+        span = {
+            "ts": datetime.now(timezone.utc).isoformat(),
+            "rerun": _rerun_id.get(),
+            "stage": stage,
+            "duration_ms": seconds * 1e3,
+            "error": error,
+            **attrs,
+        }
+        with self._lock:
+            self._spans.append(span)
+            totals = self._totals.setdefault(stage, [0, 0.0])
+            totals[0] += 1
+            totals[1] += seconds
+            self._write_locked(span)
+
+    def _write_locked(self, span):
+        try:
+            if self._file is not None and self._file_bytes > MAX_TRACE_BYTES:
+                self._file.close()
+                self._file = None
+                os.replace(self.path, self.path + ".1")
+            if self._file is None:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                self._file = open(self.path, "a", buffering=1, encoding="utf-8")
+                self._file_bytes = self._file.tell()
+            line = json.dumps(span, default=str) + "\n"
+            self._file.write(line)
+            self._file_bytes += len(line)
+        except OSError:
+            self._file = None   # tracing must never break the app; keep the ring buffer only
+
+    # --- reading ---
+    def recent(self, limit=None):
+        with self._lock:
+            spans = list(self._spans)
+        return spans[-limit:] if limit else spans
+
+    def stage_stats(self):
+        """Per stage over the ring buffer: count, mean and p50/p95/p99 in milliseconds."""
+        import numpy as np   # app.py imports this module; keep its login page free of numpy
+
+        by_stage = {}
+        for span in self.recent():
+            by_stage.setdefault(span["stage"], []).append(span["duration_ms"])
+        stats = []
+        for stage, durations in sorted(by_stage.items()):
+            values = np.asarray(durations)
+            p50, p95, p99 = np.percentile(values, [q * 100 for q in QUANTILES])
+            stats.append({"stage": stage, "count": len(values), "mean_ms": float(values.mean()),
+                          "p50_ms": float(p50), "p95_ms": float(p95), "p99_ms": float(p99)})
+        return stats
+
+    def prometheus_text(self):
+        """Prometheus text exposition: a summary of stage durations in seconds."""
+        name = "pccsp_stage_duration_seconds"
+        lines = [f"# HELP {name} Duration of app stages (quantiles over the last {self._spans.maxlen} spans).",
+                 f"# TYPE {name} summary"]
+        with self._lock:
+            totals = {stage: tuple(t) for stage, t in self._totals.items()}
+        quantiles = {s["stage"]: s for s in self.stage_stats()}
+        for stage in sorted(totals):
+            label = stage.replace("\\", "\\\\").replace('"', '\\"')
+            if stage in quantiles:
+                for q in QUANTILES:
+                    value = quantiles[stage][f"p{int(q * 100)}_ms"] / 1e3
+                    lines.append(f'{name}{{stage="{label}",quantile="{q}"}} {value:.9f}')
+            count, total = totals[stage]
+            lines.append(f'{name}_sum{{stage="{label}"}} {total:.9f}')
+            lines.append(f'{name}_count{{stage="{label}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+
+def start_rerun():
+    """Tag the spans recorded by this thread from now on with a fresh rerun id."""
+    _rerun_id.set(uuid.uuid4().hex[:12])
+
+
+@process_singleton
+def get_tracer():
+    """The tracer shared by every session in this server process."""
+    return Tracer()
+
+
+def span(stage, **attrs):
+    """Shorthand for get_tracer().span(stage)."""
+    return get_tracer().span(stage, **attrs)
+
+
+def traced(stage):
+    """Decorator form of `span` for whole functions."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
@@ -0,0 +1,126 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+from sklearn.compose import ColumnTransformer
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+from sklearn.impute import SimpleImputer
+from sklearn.neighbors import KNeighborsClassifier
+
+from core.features import SCHEMA
+from core.ingest import ingest_training_data
+from core.shared import process_singleton
+
+
+def build_knn_pipeline(categorical_cols, numeric_cols, n_neighbors=7):
+    """
+    Returns a scikit-learn Pipeline that:
+      - imputes missing numeric with median
+      - imputes missing categorical with most frequent
+      - one-hot encodes categoricals
+      - scales numerics
+      - trains KNN classifier
+    """
+    numeric_pipe = Pipeline(steps=[
+        ("imputer", SimpleImputer(strategy="median")),
+        ("scaler", StandardScaler())
+    ])
+    cat_pipe = Pipeline(steps=[
+        ("imputer", SimpleImputer(strategy="most_frequent")),
+        ("ohe", OneHotEncoder(handle_unknown="ignore"))
+    ])
+    pre = ColumnTransformer(
+        transformers=[
+            ("num", numeric_pipe, numeric_cols),
+            ("cat", cat_pipe, categorical_cols)
+        ],
+        remainder="drop",
+        verbose_feature_names_out=False
+    )
+    model = Pipeline(steps=[
+        ("preprocess", pre),
+        ("knn", KNeighborsClassifier(n_neighbors=n_neighbors, weights="distance", metric="minkowski", p=2))
+    ])
+    return model
+
+
+def load_training_frame(data: bytes, schema=SCHEMA):
+    """
+    Parse a training CSV or Parquet file into (X, y, report) with the streaming ingester.
+    Raises ValueError on a file without the required columns or usable targets.
+    """
+    return ingest_training_data(data, schema)
+
+
+def fit_from_csv(data: bytes, n_neighbors=7, schema=SCHEMA):
+    """Parse a training file and fit the KNN pipeline; returns (pipeline, ingest report)."""
+    X, y, report = load_training_frame(data, schema)
+    pipeline = build_knn_pipeline(schema.categorical, schema.numeric, n_neighbors=n_neighbors)
+    pipeline.fit(X, y)
+    return pipeline, report
+
+
+def content_digest(data: bytes):
+    """Content hash of a training file; the data part of a TrainingCache key."""
+    return hashlib.sha256(data).hexdigest()
+
+
+class TrainingCache:
+    """
+    Bounded LRU of fits keyed by (CSV content hash, n_neighbors, feature schema), so reruns
+    with the same upload and settings reuse the earlier fit instead of refitting.
+    An entry is whatever `on_fit` returns: the calculator stores the registry version id
+    of a saved fit rather than the pipeline, so fitted models stay under the registry's
+    eviction instead of being held here as well.
+    """
+
+    def __init__(self, maxsize=8):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(digest, n_neighbors, schema=SCHEMA):
+        return (digest, int(n_neighbors), schema.fingerprint)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def get_or_train(self, data, n_neighbors, schema=SCHEMA, on_fit=None, digest=None):
+        """
+        Return (entry, trained) where entry is whatever `on_fit(pipeline, report)` produced for
+        this key (the pipeline itself when `on_fit` is None) and `trained` tells whether a fit happened.
+          - `data` is the file's bytes, or a callable returning them that is only called to fit
+          - `digest` is content_digest(data) when the caller already knows it; a cache hit
+            then costs a dictionary lookup instead of reading and hashing the file
+        """
+        if digest is None:
+            data = data() if callable(data) else data
+            digest = content_digest(data)
+        key = self.make_key(digest, n_neighbors, schema)
+        entry = self.get(key)
+        if entry is not None:
+            return entry, False
+        data = data() if callable(data) else data
+        pipeline, report = fit_from_csv(data, n_neighbors=n_neighbors, schema=schema)
+        entry = on_fit(pipeline, report) if on_fit is not None else pipeline
+        self.put(key, entry)
+        return entry, True
+
+
+@process_singleton
+def get_training_cache():
+    """The training cache shared by every session in this server process."""
+    return TrainingCache()
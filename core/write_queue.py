@@ -0,0 +1,236 @@
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from google.api_core import exceptions as api_exceptions
+from google.auth.exceptions import TransportError
+
+from core.mirror import stamped
+from core.shared import process_singleton
+from core.tracing import span
+
+JOURNAL_PATH = os.path.join("data", "pending_writes.jsonl")
+DEAD_LETTER_PATH = os.path.join("data", "failed_writes.jsonl")
+MAX_BATCH = 500            # Firestore batched-write limit
+FLUSH_INTERVAL_SECONDS = 0.5
+MAX_BACKOFF_SECONDS = 60.0
+# Network and availability failures are retried with backoff; any other error means
+# Firestore rejected the write itself, and retrying it would never succeed.
+TRANSIENT_ERRORS = (
+    ConnectionError,
+    TimeoutError,
+    TransportError,
+    api_exceptions.ServiceUnavailable,
+    api_exceptions.DeadlineExceeded,
+    api_exceptions.InternalServerError,
+    api_exceptions.TooManyRequests,
+    api_exceptions.Aborted,
+    api_exceptions.RetryError,
+)
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    raise TypeError(f"Cannot journal value of type {type(value).__name__}")
+
+
+def _decode(obj):
+    if "__datetime__" in obj:
+        return datetime.fromisoformat(obj["__datetime__"])
+    return obj
+
+
+class WriteBehindQueue:
+    """
+    Background writer for Firestore result documents.
+      - enqueue() appends the write to a local append-only journal and returns immediately
+      - a worker thread flushes pending writes in batched commits of up to MAX_BATCH
+      - successful commits are acknowledged in the journal; network and availability
+        failures are retried with backoff
+      - a write Firestore rejects outright (bad document id, invalid value) is moved to the
+        dead-letter file and acknowledged, so it never holds up the writes behind it
+      - on start, writes journaled but never acknowledged (crash, restart, network drop) are replayed
+    """
+
+    def __init__(self, db, journal_path=JOURNAL_PATH, on_flush=None, dead_letter_path=DEAD_LETTER_PATH):
+        self.db = db
+        self.journal_path = journal_path
+        self.dead_letter_path = dead_letter_path
+        self.on_flush = on_flush
+        self.last_error = None           # transient error delaying the pending writes
+        self.dead_letters = 0            # writes set aside since this process started
+        self._pending = OrderedDict()   # write id -> (collection, doc_id, payload)
+        self._cond = threading.Condition()
+        self._journal_lock = threading.Lock()
+        for path in (journal_path, dead_letter_path):
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        self._replay()
+        self._thread = threading.Thread(target=self._run, name="firestore-write-behind", daemon=True)
+        self._thread.start()
+
+    # --- journal ---
+    def _append(self, record):
+        with self._journal_lock:
+            self._append_locked(record)
+
+    def _append_locked(self, record):
+        line = json.dumps(record, default=_encode) + "\n"
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _replay(self):
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line, object_hook=_decode)
+                except json.JSONDecodeError:
+                    continue  # torn last line from a crash mid-append
+                if record["op"] == "put":
+                    self._pending[record["id"]] = (record["collection"], record["doc_id"], record["payload"])
+                elif record["op"] == "ack":
+                    for write_id in record["ids"]:
+                        self._pending.pop(write_id, None)
+        self._compact()
+
+    def _compact(self):
+        """Rewrite the journal with only the still-pending writes."""
+        with self._journal_lock:
+            with self._cond:
+                pending = list(self._pending.items())
+            tmp_path = self.journal_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for write_id, (collection, doc_id, payload) in pending:
+                    record = {"op": "put", "id": write_id, "collection": collection, "doc_id": doc_id, "payload": payload}
+                    f.write(json.dumps(record, default=_encode) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.journal_path)
+
+    # --- producer side ---
+    def enqueue(self, collection, doc_id, payload):
+        """
+        Durably queue `payload` for `collection/doc_id`; returns the write id.
+        Raises ValueError for an id Firestore cannot address (e.g. one containing "/"),
+        before anything is journaled.
+        """
+        self.db.collection(collection).document(doc_id)
+        write_id = uuid.uuid4().hex
+        with self._journal_lock:
+            self._append_locked({"op": "put", "id": write_id, "collection": collection, "doc_id": doc_id, "payload": payload})
+            with self._cond:
+                self._pending[write_id] = (collection, doc_id, payload)
+                self._cond.notify()
+        return write_id
+
+    def pending_count(self):
+        with self._cond:
+            return len(self._pending)
+
+    def flush(self, timeout=10.0):
+        """Block until everything queued so far is written (or `timeout` elapses)."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._cond.notify()
+            while self._pending and time.monotonic() < deadline:
+                self._cond.wait(timeout=min(0.1, max(0.0, deadline - time.monotonic())))
+            return not self._pending
+
+    # --- worker ---
+    def _commit(self, items):
+        with span("firestore.write", docs=len(items)):
+            batch = self.db.batch()
+            for _, (collection, doc_id, payload) in items:
+                batch.set(self.db.collection(collection).document(doc_id), stamped(payload))
+            batch.commit()
+
+    def _commit_each(self, items):
+        """
+        Commit `items` one at a time after their batch was rejected, so only the bad writes
+        are set aside. Returns (committed items, rejected (item, error) pairs, transient
+        error that stopped the pass or None).
+        """
+        committed, rejected = [], []
+        for item in items:
+            try:
+                self._commit([item])
+            except TRANSIENT_ERRORS as e:
+                return committed, rejected, e
+            except Exception as e:
+                rejected.append((item, e))
+            else:
+                committed.append(item)
+        return committed, rejected, None
+
+    def _dead_letter(self, rejected):
+        """Record rejected writes, with their error, in the dead-letter file for follow-up."""
+        with self._journal_lock:
+            with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+                for (write_id, (collection, doc_id, payload)), error in rejected:
+                    record = {"id": write_id, "collection": collection, "doc_id": doc_id, "payload": payload,
+                              "error": f"{type(error).__name__}: {error}", "failed_at": datetime.now(timezone.utc)}
+                    f.write(json.dumps(record, default=_encode) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        self.dead_letters += len(rejected)
+
+    def _acknowledge(self, ids):
+        self._append({"op": "ack", "ids": ids})
+        with self._cond:
+            for write_id in ids:
+                self._pending.pop(write_id, None)
+            drained = not self._pending
+            self._cond.notify_all()
+        if drained:
+            self._compact()
+        if self.on_flush is not None:
+            try:
+                self.on_flush()
+            except Exception:
+                pass
+
+    def _run(self):
+        backoff = FLUSH_INTERVAL_SECONDS
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                # Short pause lets a burst of submissions share one commit.
+                self._cond.wait(timeout=FLUSH_INTERVAL_SECONDS)
+                batch_items = list(self._pending.items())[:MAX_BATCH]
+            transient = None
+            try:
+                self._commit(batch_items)
+                committed, rejected = batch_items, []
+            except TRANSIENT_ERRORS as e:
+                committed, rejected, transient = [], [], e
+            except Exception:
+                committed, rejected, transient = self._commit_each(batch_items)
+
+            if rejected:
+                self._dead_letter(rejected)
+            if transient is None:
+                backoff = FLUSH_INTERVAL_SECONDS
+                self.last_error = None
+            if committed or rejected:
+                self._acknowledge([write_id for write_id, _ in committed] + [write_id for (write_id, _), _ in rejected])
+            if transient is not None:
+                self.last_error = transient
+                time.sleep(backoff)
+                backoff = min(backoff * 2, MAX_BACKOFF_SECONDS)
+
+
+@process_singleton
+def get_write_queue(db, on_flush=None):
+    """The write-behind queue shared by every session in this server process."""
+    return WriteBehindQueue(db, on_flush=on_flush)
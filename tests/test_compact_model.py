@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from core.compact_model import CompactKNN, check_parity, export_compact
+from core.features import SCHEMA
+from core.inference import predict_with_neighbours
+from core.synthetic import synthetic_patients
+from core.training import build_knn_pipeline
+
+
+@pytest.fixture(scope="module")
+def models(tmp_path_factory):
+    train = synthetic_patients(2000, seed=1)
+    pipeline = build_knn_pipeline(SCHEMA.categorical, SCHEMA.numeric, n_neighbors=7)
+    pipeline.fit(SCHEMA.coerce(train[SCHEMA.names]), train["Survival"])
+    path = str(tmp_path_factory.mktemp("models") / "model.arrow")
+    export_compact(pipeline, path)
+    return pipeline, CompactKNN.load(path)
+
+
+@pytest.fixture(scope="module")
+def queries():
+    return SCHEMA.model_input(synthetic_patients(500, seed=2))
+
+
+def test_batch_matches_pipeline(models, queries):
+    pipeline, compact = models
+    parity = check_parity(pipeline, compact, queries)
+    assert parity["max_abs_proba_diff"] < 1e-6
+    assert parity["prediction_agreement"] == 1.0
+
+
+def test_single_row_path_matches_pipeline(models, queries):
+    pipeline, compact = models
+    for i in range(50):
+        row = queries.iloc[i:i + 1]
+        np.testing.assert_allclose(compact.predict_proba(row), pipeline.predict_proba(row), atol=1e-6)
+
+
+def test_neighbours_match_pipeline(models, queries):
+    pipeline, compact = models
+    expected = predict_with_neighbours(pipeline, queries)
+    got = predict_with_neighbours(compact, queries)
+    np.testing.assert_array_equal(got.neighbour_indices, expected.neighbour_indices)
+    np.testing.assert_allclose(got.neighbour_distances, expected.neighbour_distances, atol=1e-4)
+
+
+def test_blank_fields_take_the_pipeline_fills(models):
+    pipeline, compact = models
+    blank = SCHEMA.coerce(synthetic_patients(20, seed=3, missing_rate=0.6)[SCHEMA.names])
+    np.testing.assert_allclose(compact.predict_proba(blank), pipeline.predict_proba(blank), atol=1e-6)
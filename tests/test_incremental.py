@@ -0,0 +1,123 @@
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from core.features import SCHEMA
+from core.incremental import append_rows, encode_rows, labelled_rows, recalibrate, update_from_outcomes
+from core.inference import predict_with_neighbours
+from core.memory_db import MemoryFirestore
+from core.model_registry import ModelRegistry
+from core.synthetic import synthetic_patients
+from core.training import build_knn_pipeline
+
+START = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def pipeline():
+    train = synthetic_patients(1500, seed=1)
+    return build_knn_pipeline(SCHEMA.categorical, SCHEMA.numeric).fit(
+        SCHEMA.coerce(train[SCHEMA.names]), train["Survival"])
+
+
+@pytest.fixture
+def registry(tmp_path, pipeline):
+    registry = ModelRegistry(models_dir=str(tmp_path / "models"), legacy_path=str(tmp_path / "model.pkl"))
+    registry.save(pipeline)
+    return registry
+
+
+@pytest.fixture
+def outcomes():
+    return synthetic_patients(120, seed=2, missing_rate=0.3)
+
+
+def _record(db, patients, first_second):
+    """Store `patients` as Hasil_KNN results with their outcome recorded one second apart."""
+    ids = []
+    for i, (_, row) in enumerate(patients.iterrows()):
+        fields = {k: (None if pd.isna(row[k]) else row[k]) for k in SCHEMA.names}
+        doc_id = f"{row['Patient_ID']}_result"
+        db.collection("Hasil_KNN").document(doc_id).set(
+            {**fields, "Survival": int(row["Survival"]), "Outcome_Date": START + timedelta(seconds=first_second + i)})
+        ids.append(doc_id)
+    return ids
+
+
+def _reference(pipeline, patients):
+    """The base pipeline with `patients` appended as the calculator would have encoded them."""
+    Xt, y = encode_rows(pipeline, SCHEMA.model_input(patients), patients["Survival"])
+    return append_rows(pipeline, Xt, y)
+
+
+def test_update_saves_only_the_new_rows(registry, pipeline, outcomes):
+    db = MemoryFirestore()
+    _record(db, outcomes.iloc[:60], 0)
+    base = registry.current_version()
+    v1, added = update_from_outcomes(db, registry, base)
+    assert added == 60
+    assert registry.lineage(v1) == (base, [registry.delta(v1)])
+    assert update_from_outcomes(db, registry, v1) == (None, 0)
+
+    _record(db, outcomes.iloc[60:], 1000)
+    v2, added = update_from_outcomes(db, registry, v1)
+    assert added == 60
+    assert [d.parent for d in registry.lineage(v2)[1]] == [base, v1]
+
+
+def test_delta_version_matches_appended_pipeline(tmp_path, registry, pipeline, outcomes):
+    db = MemoryFirestore()
+    _record(db, outcomes, 0)
+    version, _ = update_from_outcomes(db, registry, registry.current_version())
+    queries = SCHEMA.model_input(synthetic_patients(200, seed=3))
+    expected = predict_with_neighbours(_reference(pipeline, outcomes), queries)
+
+    # A fresh registry rebuilds the version from the files alone.
+    fresh = ModelRegistry(models_dir=str(tmp_path / "models"), legacy_path=str(tmp_path / "model.pkl"))
+    for model in (registry.load_compact(version), fresh.load_compact(version), fresh.load(version)):
+        got = predict_with_neighbours(model, queries)
+        np.testing.assert_allclose(got.probability, expected.probability, atol=1e-6)
+        np.testing.assert_array_equal(got.prediction, expected.prediction)
+
+
+def test_blank_categoricals_take_the_calculator_fill(registry, pipeline):
+    patient = synthetic_patients(1, seed=4)
+    patient.loc[:, SCHEMA.categorical] = None
+    db = MemoryFirestore()
+    _record(db, patient, 0)
+    version, _ = update_from_outcomes(db, registry, registry.current_version())
+    Xt, _ = encode_rows(pipeline, SCHEMA.model_input(patient), patient["Survival"])
+    np.testing.assert_allclose(registry.delta(version).X, Xt, atol=1e-6)
+
+
+def test_corrected_outcome_replaces_its_row(registry, outcomes):
+    db = MemoryFirestore()
+    ids = _record(db, outcomes, 0)
+    v1, _ = update_from_outcomes(db, registry, registry.current_version())
+    n_rows = registry.load(v1).steps[-1][1]._fit_X.shape[0]
+
+    corrected = 1 - int(outcomes["Survival"].iloc[0])
+    db.collection("Hasil_KNN").document(ids[0]).set(
+        {"Survival": corrected, "Outcome_Date": START + timedelta(days=1)}, merge=True)
+    v2, changed = update_from_outcomes(db, registry, v1)
+    assert changed == 1
+
+    model = registry.load(v2)
+    knn = model.steps[-1][1]
+    assert knn._fit_X.shape[0] == n_rows
+    assert knn.classes_[knn._y[labelled_rows(model)[ids[0]]]] == corrected
+    assert model.outcomes_watermark_ == START + timedelta(days=1)
+
+
+def test_recalibrate_keeps_the_labelled_rows(registry, outcomes):
+    db = MemoryFirestore()
+    ids = _record(db, outcomes, 0)
+    v1, _ = update_from_outcomes(db, registry, registry.current_version())
+    model = recalibrate(registry.load(v1))
+    rows = labelled_rows(model)
+    assert set(rows) == set(ids)
+    knn = model.steps[-1][1]
+    np.testing.assert_array_equal(knn.classes_[knn._y[[rows[i] for i in ids]]], outcomes["Survival"].to_numpy())
+    assert update_from_outcomes(db, registry, registry.save(model)) == (None, 0)
@@ -0,0 +1,84 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import core.ingest
+from core.features import SCHEMA
+from core.ingest import TARGET, ingest_training_data
+from core.synthetic import synthetic_patients
+
+
+@pytest.fixture(scope="module")
+def patients():
+    return synthetic_patients(2000, seed=11, missing_rate=0.2)
+
+
+def _csv(df):
+    return df[[*SCHEMA.names, TARGET]].to_csv(index=False).encode()
+
+
+def _parquet(df):
+    buffer = io.BytesIO()
+    df[[*SCHEMA.names, TARGET]].to_parquet(buffer, index=False)
+    return buffer.getvalue()
+
+
+def _assert_same_frame(X, expected):
+    """Ingested X against the calculator's read_csv + SCHEMA.coerce path."""
+    expected = SCHEMA.coerce(expected[SCHEMA.names]).reset_index(drop=True)
+    pd.testing.assert_frame_equal(X[SCHEMA.numeric], expected[SCHEMA.numeric])
+    for col in SCHEMA.categorical:
+        assert X[col].astype(str).tolist() == expected[col].tolist()
+
+
+def test_csv_matches_read_csv_and_coerce(patients):
+    data = _csv(patients)
+    X, y, report = ingest_training_data(data)
+    assert report.ok and report.rows_kept == len(patients)
+    _assert_same_frame(X, pd.read_csv(io.BytesIO(data)))
+    np.testing.assert_array_equal(y, patients[TARGET])
+
+
+def test_small_batches_give_the_same_result(monkeypatch, patients):
+    data = _csv(patients)
+    X_whole, y_whole, _ = ingest_training_data(data)
+    monkeypatch.setattr(core.ingest, "CSV_BLOCK_SIZE", 16 << 10)
+    X, y, report = ingest_training_data(data)
+    assert report.rows_read == len(patients)
+    pd.testing.assert_frame_equal(X, X_whole)
+    pd.testing.assert_series_equal(y, y_whole)
+
+
+def test_parquet_matches_csv(patients):
+    X_csv, y_csv, _ = ingest_training_data(_csv(patients))
+    X, y, _ = ingest_training_data(_parquet(patients))
+    pd.testing.assert_frame_equal(X[SCHEMA.numeric], X_csv[SCHEMA.numeric])
+    for col in SCHEMA.categorical:
+        assert X[col].astype(str).tolist() == X_csv[col].astype(str).tolist()
+    pd.testing.assert_series_equal(y, y_csv)
+
+
+def test_bad_cells_are_reported_and_bad_targets_dropped(patients):
+    df = patients.head(10)[[*SCHEMA.names, TARGET]].astype(object)
+    numeric, categorical = SCHEMA.numeric[0], SCHEMA.categorical[0]
+    df.iloc[2, df.columns.get_loc(numeric)] = "abc"
+    df.iloc[3, df.columns.get_loc(categorical)] = "Maybe"
+    df.iloc[4, df.columns.get_loc(TARGET)] = 2
+    X, y, report = ingest_training_data(df.to_csv(index=False).encode())
+
+    assert (report.rows_read, report.rows_kept, report.rows_dropped) == (10, 9, 1)
+    assert report.issues_by_column == {numeric: 1, categorical: 1, TARGET: 1}
+    assert {(e["row"], e["column"], e["value"]) for e in report.examples} == {
+        (3, numeric, "abc"), (4, categorical, "Maybe"), (5, TARGET, "2")}
+    assert np.isnan(X[numeric].iloc[2])
+    assert len(X) == len(y) == 9
+
+
+def test_missing_column_is_rejected(patients):
+    without = [c for c in [*SCHEMA.names, TARGET] if c != SCHEMA.numeric[0]]
+    with pytest.raises(ValueError, match="missing columns"):
+        ingest_training_data(patients[without].to_csv(index=False).encode())
+    with pytest.raises(ValueError, match=TARGET):
+        ingest_training_data(patients[SCHEMA.names].to_csv(index=False).encode())
@@ -0,0 +1,73 @@
+from datetime import timedelta
+
+import pytest
+
+from core.memory_db import MemoryFirestore
+from core.mirror import UPDATED_AT, LocalMirror, stamped
+from core.synthetic import synthetic_patients, synthetic_results
+
+
+@pytest.fixture
+def db():
+    db = MemoryFirestore()
+    # Documents from before Updated_At existed carry only Date.
+    db.load("Hasil_KNN", synthetic_results(synthetic_patients(50, seed=4), seed=4))
+    return db
+
+
+@pytest.fixture
+def mirror(tmp_path):
+    return LocalMirror(str(tmp_path / "mirror.duckdb"))
+
+
+def _survival(mirror, doc_id):
+    return mirror.query('SELECT "Survival" FROM "Hasil_KNN" WHERE doc_id = ?', [doc_id])["Survival"][0]
+
+
+def test_first_sync_pulls_unstamped_documents(db, mirror):
+    assert mirror.sync(db, "Hasil_KNN") == 50
+    assert mirror.count("Hasil_KNN") == 50
+
+
+def test_document_arriving_after_a_newer_one_is_pulled(db, mirror):
+    docs = synthetic_results(synthetic_patients(2, seed=5), seed=5)
+    (newer_id, newer), (older_id, older) = sorted(docs.items(), key=lambda kv: kv[1]["Date"], reverse=True)
+    collection = db.collection("Hasil_KNN")
+    collection.document(newer_id).set(stamped(newer))
+    mirror.sync(db, "Hasil_KNN")
+    # A journal replay or a second server lands the older result after the newer one synced.
+    collection.document(older_id).set(stamped(older))
+    mirror.sync(db, "Hasil_KNN")
+
+    assert mirror.count("Hasil_KNN", [("doc_id", "==", older_id)]) == 1
+    assert mirror.count("Hasil_KNN") == 52
+
+
+def test_edit_keeping_date_is_pulled(db, mirror):
+    mirror.sync(db, "Hasil_KNN")
+    oldest = min(db.collection("Hasil_KNN").docs.items(), key=lambda kv: kv[1]["Date"])[0]
+    # An outcome recorded by another process: Date is unchanged and this mirror is not told.
+    db.collection("Hasil_KNN").document(oldest).set(stamped({"Survival": 1}), merge=True)
+    mirror.sync(db, "Hasil_KNN")
+
+    assert _survival(mirror, oldest) == 1
+
+
+def test_unstamped_writes_still_follow_date(db, mirror):
+    mirror.sync(db, "Hasil_KNN")
+    doc_id, doc = next(iter(synthetic_results(synthetic_patients(1, seed=6), seed=6).items()))
+    doc["Date"] = mirror.watermark("Hasil_KNN") + timedelta(days=1)
+    db.collection("Hasil_KNN").document(doc_id).set(doc)
+
+    assert mirror.sync(db, "Hasil_KNN") >= 1
+    assert mirror.count("Hasil_KNN", [("doc_id", "==", doc_id)]) == 1
+
+
+def test_watermark_follows_server_timestamp(db, mirror):
+    mirror.sync(db, "Hasil_KNN")
+    assert mirror.watermark("Hasil_KNN", UPDATED_AT) is None
+    doc_id = next(iter(db.collection("Hasil_KNN").docs))
+    db.collection("Hasil_KNN").document(doc_id).set(stamped({"Survival": 0}), merge=True)
+    mirror.sync(db, "Hasil_KNN")
+
+    assert mirror.watermark("Hasil_KNN", UPDATED_AT) == db.collection("Hasil_KNN").docs[doc_id][UPDATED_AT]
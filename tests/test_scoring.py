@@ -0,0 +1,90 @@
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from core.features import (
+    CATEGORICAL_OPTIONS, EXPECTED_CATEGORICAL, HIGHER_OR_EQUAL_VARIABLES, SCHEMA,
+    SIGNIFICANT_VARIABLES, VARIABLES,
+)
+from core.scoring import score_patient, score_patients
+from core.synthetic import synthetic_patients
+
+
+def legacy_score(user_data):
+    """The calculator's original per-variable loop, kept verbatim as the reference."""
+    total_variables = 0
+    within_limit = 0
+    within_limit_vars = []
+    for var, props in VARIABLES.items():
+        value = user_data.get(var, None)
+        upper_limit = props["default"]
+        if value is not None:
+            if var in CATEGORICAL_OPTIONS:
+                total_variables += 1
+                if var in SIGNIFICANT_VARIABLES:
+                    total_variables += 1
+                if var in EXPECTED_CATEGORICAL:
+                    if value == EXPECTED_CATEGORICAL[var]:
+                        within_limit += 1
+                        within_limit_vars.append(props["tag"])
+                        if var in SIGNIFICANT_VARIABLES:
+                            within_limit += 1
+            else:
+                total_variables += 1
+                if var in SIGNIFICANT_VARIABLES:
+                    total_variables += 1
+                if var in HIGHER_OR_EQUAL_VARIABLES:
+                    if value >= upper_limit:
+                        within_limit += 1
+                        within_limit_vars.append(props["tag"])
+                        if var in SIGNIFICANT_VARIABLES:
+                            within_limit += 1
+                else:
+                    if value <= upper_limit:
+                        within_limit += 1
+                        within_limit_vars.append(props["tag"])
+                        if var in SIGNIFICANT_VARIABLES:
+                            within_limit += 1
+    final_score = (within_limit / total_variables) * 100 if total_variables > 0 else None
+    return final_score, within_limit_vars
+
+
+def _as_form(row):
+    """A frame row as the calculator form fills user_data: blanks are None."""
+    return {v: (None if pd.isna(row[v]) else row[v]) for v in SCHEMA.names}
+
+
+@pytest.fixture(scope="module")
+def patients():
+    df = synthetic_patients(3000, seed=7, missing_rate=0.15)
+    # Put some values exactly on their thresholds so the <= / >= edges are exercised.
+    rng = np.random.default_rng(7)
+    for name in SCHEMA.numeric:
+        on_edge = rng.random(len(df)) < 0.05
+        df.loc[on_edge, name] = SCHEMA.defaults[name]
+    # Every variable blank: no score at all.
+    df.loc[0, SCHEMA.names] = None
+    return df
+
+
+def test_batch_scores_match_legacy_loop(patients):
+    scores, _ = score_patients(patients)
+    for i, row in patients.iterrows():
+        expected, _ = legacy_score(_as_form(row))
+        got = scores.iloc[i]
+        if expected is None:
+            assert math.isnan(got)
+        else:
+            assert got == expected
+
+
+def test_within_limit_tags_match_legacy_loop(patients):
+    for _, row in patients.head(500).iterrows():
+        user_data = _as_form(row)
+        assert score_patient(user_data) == legacy_score(user_data)
+
+
+def test_empty_form_has_no_score():
+    assert score_patient({}) == (None, [])
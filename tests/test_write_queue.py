@@ -0,0 +1,103 @@
+import json
+import os
+
+import pytest
+from google.api_core import exceptions as api_exceptions
+
+from core.memory_db import MemoryBatch, MemoryDocument, MemoryFirestore
+from core.mirror import UPDATED_AT
+from core.write_queue import WriteBehindQueue
+
+
+@pytest.fixture
+def db():
+    return MemoryFirestore()
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return {"journal_path": str(tmp_path / "pending.jsonl"), "dead_letter_path": str(tmp_path / "failed.jsonl")}
+
+
+def _docs(db):
+    return db.collection("Hasil_KNN").docs
+
+
+def _journal(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_writes_are_committed_and_acknowledged(db, paths):
+    queue = WriteBehindQueue(db, **paths)
+    for i in range(5):
+        queue.enqueue("Hasil_KNN", f"doc{i}", {"i": i})
+    assert queue.flush(5)
+    assert sorted(_docs(db)) == [f"doc{i}" for i in range(5)]
+    assert all(UPDATED_AT in doc for doc in _docs(db).values())
+    # Every journaled write is acknowledged (or already compacted away), so nothing replays.
+    journal = _journal(paths["journal_path"])
+    acked = {write_id for record in journal if record["op"] == "ack" for write_id in record["ids"]}
+    assert {record["id"] for record in journal if record["op"] == "put"} <= acked
+
+
+def test_unacknowledged_writes_are_replayed_on_start(db, paths):
+    records = [{"op": "put", "id": f"w{i}", "collection": "Hasil_KNN", "doc_id": f"doc{i}", "payload": {"i": i}}
+               for i in range(3)]
+    records.append({"op": "ack", "ids": ["w0"]})
+    with open(paths["journal_path"], "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+        f.write('{"op": "put", "id": "torn')   # crash mid-append
+
+    queue = WriteBehindQueue(db, **paths)
+    assert queue.flush(5)
+    assert sorted(_docs(db)) == ["doc1", "doc2"]
+
+
+def test_unaddressable_id_fails_before_journaling(db, paths):
+    queue = WriteBehindQueue(db, **paths)
+    with pytest.raises(ValueError):
+        queue.enqueue("Hasil_KNN", "ward/7_20260101", {"i": 0})
+    assert queue.pending_count() == 0
+    assert _journal(paths["journal_path"]) == []
+
+
+def test_rejected_write_is_dead_lettered_without_blocking_others(monkeypatch, db, paths):
+    set_document = MemoryDocument.set
+
+    def reject_bad(self, data, merge=False):
+        if data.get("bad"):
+            raise api_exceptions.InvalidArgument("invalid value")
+        return set_document(self, data, merge)
+
+    monkeypatch.setattr(MemoryDocument, "set", reject_bad)
+    queue = WriteBehindQueue(db, **paths)
+    for i in range(4):
+        queue.enqueue("Hasil_KNN", f"doc{i}", {"i": i, "bad": i == 1})
+    assert queue.flush(5)
+
+    assert sorted(_docs(db)) == ["doc0", "doc2", "doc3"]
+    assert queue.dead_letters == 1 and queue.last_error is None
+    [failed] = _journal(paths["dead_letter_path"])
+    assert failed["doc_id"] == "doc1" and failed["error"].startswith("InvalidArgument")
+
+
+def test_transient_error_is_retried(monkeypatch, db, paths):
+    commit = MemoryBatch.commit
+    failures = iter([api_exceptions.ServiceUnavailable("unavailable")])
+
+    def flaky_commit(self):
+        error = next(failures, None)
+        if error is not None:
+            raise error
+        return commit(self)
+
+    monkeypatch.setattr(MemoryBatch, "commit", flaky_commit)
+    queue = WriteBehindQueue(db, **paths)
+    queue.enqueue("Hasil_KNN", "doc0", {"i": 0})
+    assert queue.flush(10)
+    assert list(_docs(db)) == ["doc0"]
+    assert queue.dead_letters == 0 and queue.last_error is None
@@ -0,0 +1,60 @@
+import hmac
+
+import streamlit as st
+import pandas as pd
+
+from core.bootstrap import start_bootstrap
+from core.tracing import get_tracer
+
+
+def admin_unlocked():
+    """Second gate on top of the app login: the `admin_password` secret."""
+    if st.session_state.get("admin_unlocked", False):
+        return True
+    if "admin_password" not in st.secrets:
+        st.info("Set `admin_password` in the app secrets to enable this page.")
+        return False
+
+    with st.form("Admin"):
+        password = st.text_input("Admin password", type="password")
+        submitted = st.form_submit_button("Unlock")
+    if submitted:
+        if hmac.compare_digest(password, st.secrets["admin_password"]):
+            st.session_state["admin_unlocked"] = True
+            st.rerun()
+        st.error("😕 Incorrect admin password.")
+    return False
+
+
+st.title("⏱️ Performance")
+
+if admin_unlocked():
+    bootstrap = start_bootstrap().status()
+    st.subheader(f"Warm-up: {bootstrap['state']}")
+    if bootstrap["steps"]:
+        st.dataframe(
+            pd.DataFrame([{"step": name, **step} for name, step in bootstrap["steps"].items()]),
+            hide_index=True,
+        )
+    if bootstrap["finished_at"]:
+        st.caption(f"Finished {bootstrap['finished_at']} in process {bootstrap['pid']}.")
+
+    tracer = get_tracer()
+    stats = tracer.stage_stats()
+
+    st.subheader("Stage latency (ms)")
+    if not stats:
+        st.info("No spans recorded yet in this server process.")
+    else:
+        st.dataframe(pd.DataFrame(stats).round(3), hide_index=True)
+        st.caption(f"Percentiles over the last {len(tracer.recent())} spans; full log in `{tracer.path}`.")
+
+    st.subheader("Recent spans")
+    recent = tracer.recent(limit=200)
+    if recent:
+        st.dataframe(pd.DataFrame(recent[::-1]), hide_index=True)
+
+    st.download_button(
+        "Export Prometheus metrics", data=tracer.prometheus_text(),
+        file_name="metrics.prom", mime="text/plain",
+    )
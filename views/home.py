@@ -1,104 +1,124 @@
 import streamlit as st
 import pandas as pd
-import json
-import os
-import pickle
+import uuid
 from datetime import datetime, timezone
-from google.cloud import firestore
-from google.oauth2 import service_account
-
-# ML imports
-from sklearn.compose import ColumnTransformer
-from sklearn.pipeline import Pipeline
-from sklearn.preprocessing import OneHotEncoder, StandardScaler
-from sklearn.impute import SimpleImputer
-from sklearn.neighbors import KNeighborsClassifier
-
-@st.cache_resource
-def get_db():
-    key_dict = json.loads(st.secrets["textkey"])
-    return firestore.Client.from_service_account_info(key_dict)
-
-# #def fill_with_defaults(df: pd.DataFrame, variables: dict, categorical_cols: list, numeric_cols: list) -> pd.DataFrame:
-#     """Coerce dtypes then fill NaNs with defaults defined in `variables`."""
-#     df = df.copy()
-
-#     # Coerce types first
-#     for col in categorical_cols:
-#         if col in df.columns:
-#             df[col] = df[col].astype("string")  # robust string dtype
-#     for col in numeric_cols:
-#         if col in df.columns:
-#             df[col] = pd.to_numeric(df[col], errors="coerce")
-
-#     # Now fill with your defaults per column
-#     for col, spec in variables.items():
-#         if col in df.columns:
-#             default_val = spec["default"]
-#             df[col] = df[col].fillna(default_val)
-
-#     return df
-def build_knn_pipeline(categorical_cols, numeric_cols, n_neighbors=7):
+
+from core.db import get_db
+from core.features import SCHEMA
+from core.history import invalidate_history
+from core.inference import predict_with_neighbours
+from core.inference_worker import get_inference_pool
+from core.knn_index import EXACT_METHODS, NeighbourIndex
+from core.model_registry import get_registry
+from core.scoring import score_patient
+from core.timeline import result_id
+from core.tracing import span
+from core.write_queue import get_write_queue
+
+
+def pin_session_version(registry):
     """
-    Returns a scikit-learn Pipeline that:
-      - imputes missing numeric with median
-      - imputes missing categorical with most frequent
-      - one-hot encodes categoricals
-      - scales numerics
-      - trains KNN classifier
+    Pin the session to the model version current when it started, so a retrain
+    elsewhere never swaps the model under an in-flight session. The pin is renewed with
+    the registry on every rerun so the version stays resident while the session lives.
     """
-    numeric_pipe = Pipeline(steps=[
-        ("imputer", SimpleImputer(strategy="median")),
-        ("scaler", StandardScaler())
-    ])
-    cat_pipe = Pipeline(steps=[
-        ("imputer", SimpleImputer(strategy="most_frequent")),
-        ("ohe", OneHotEncoder(handle_unknown="ignore"))
-    ])
-    pre = ColumnTransformer(
-        transformers=[
-            ("num", numeric_pipe, numeric_cols),
-            ("cat", cat_pipe, categorical_cols)
-        ],
-        remainder="drop",
-        verbose_feature_names_out=False
-    )
-    model = Pipeline(steps=[
-        ("preprocess", pre),
-        ("knn", KNeighborsClassifier(n_neighbors=n_neighbors, weights="distance", metric="minkowski", p=2))
-    ])
-    return model
-# #def build_knn_pipeline(categorical_cols, numeric_cols, n_neighbors=7):
-#     """
-#     Preprocessing assumes NaNs are already filled with defaults.
-#     """
-#     numeric_pipe = Pipeline(steps=[
-#         ("scaler", StandardScaler())
-#     ])
-#     cat_pipe = Pipeline(steps=[
-#         ("ohe", OneHotEncoder(handle_unknown="ignore"))
-#     ])
-#     pre = ColumnTransformer(
-#         transformers=[
-#             ("num", numeric_pipe, numeric_cols),
-#             ("cat", cat_pipe, categorical_cols)
-#         ],
-#         remainder="drop",
-#         verbose_feature_names_out=False
-#     )
-#     model = Pipeline(steps=[
-#         ("preprocess", pre),
-#         ("knn", KNeighborsClassifier(n_neighbors=n_neighbors, weights="distance", metric="minkowski", p=2))
-#     ])
-#     return model
-
-def try_load_pipeline(path="model.pkl"):
+    if st.session_state.get("model_version") is None:
+        st.session_state["model_version"] = registry.current_version()
+    if "registry_pin" not in st.session_state:
+        st.session_state["registry_pin"] = uuid.uuid4().hex
+    return registry.pin(st.session_state["registry_pin"], st.session_state["model_version"])
+
+def load_knn_model(registry, version, index_method):
+    """Predictor for `version`: the pickle-free compact model, the sklearn pipeline, or an index over it."""
     try:
-        with open(path, "rb") as f:
-            return pickle.load(f)
+        if index_method == "compact":
+            return registry.load_compact(version)
+        pipeline = registry.load(version)
+        if index_method == "pipeline" or pipeline is None:
+            return pipeline
+        return registry.derived(
+            version, f"index:{index_method}",
+            lambda: NeighbourIndex.from_pipeline(pipeline, method=index_method),
+        )
     except Exception:
         return None
 
+def upload_digest(uploaded, digest):
+    """
+    `digest` of an uploaded file, computed once per upload: st.file_uploader gives every
+    upload its own file_id, so later reruns reuse the stored hash instead of rehashing.
+    """
+    file_id, value = st.session_state.get("upload_digest", (None, None))
+    if file_id != uploaded.file_id:
+        with span("model.upload_digest"):
+            value = digest(uploaded.getvalue())
+        st.session_state["upload_digest"] = (uploaded.file_id, value)
+    return value
+
+def preload_on_workers(version, index_method):
+    """
+    Have the inference workers load the session's model version now (it was just saved or
+    switched to), so the first calculation does not wait on the load. Only sent once per
+    version and method; does nothing when the workers are unavailable.
+    """
+    if version is None:
+        return
+    try:
+        get_inference_pool().preload(version, index_method)
+    except Exception:
+        pass
+
+def predict_knn(version, index_method, X_user, local_model):
+    """
+    Score on the shared inference workers, which batch concurrent sessions together;
+    fall back to `local_model()` in this process when they are unavailable, still loading
+    the version, or too slow.
+    """
+    if version is not None:
+        try:
+            with span("model.predict.worker", method=index_method):
+                return get_inference_pool().predict(version, index_method, X_user)
+        except Exception:
+            pass
+    knn_model = local_model()
+    if knn_model is None:
+        return None
+    with span("model.predict.local", method=index_method):
+        return predict_with_neighbours(knn_model, X_user)
+
+def sensitivity_panel(user_data, predict):
+    """
+    Per-feature response curves for the current inputs, from one batched computation.
+    `predict` scores the whole grid as one request, on the workers like the calculator.
+    """
+    from core.sensitivity import sensitivity, swing
+
+    span_pct = st.slider("Numeric range (± % around entered value and threshold)", 5, 100, 25, step=5)
+    with span("sensitivity"):
+        curves, baseline = sensitivity(user_data, predict, span=span_pct / 100)
+    names = {"RuleBased_Score": "rule-based score", "KNN_Probability": "KNN probability of survival"}
+    outputs = [c for c in names if c in curves]
+    st.caption("As entered: " + " • ".join(
+        f"{names[c]} {baseline[c]:.1f}%" for c in outputs if pd.notna(baseline[c])
+    ))
+
+    table = swing(curves)
+    table.insert(1, "Label", table["Feature"].map(lambda v: SCHEMA.variables[v]["label"]))
+    st.dataframe(table.round(2), hide_index=True)
+
+    chosen = st.multiselect(
+        "Response curves", SCHEMA.names, default=table["Feature"].head(3).tolist(),
+        format_func=lambda v: SCHEMA.variables[v]["label"],
+    )
+    for feature in chosen:
+        st.markdown(f"**{SCHEMA.variables[feature]['label']}**")
+        curve = curves[curves["Feature"] == feature].set_index("Value")[outputs]
+        if feature in SCHEMA.categorical_set:
+            st.bar_chart(curve, stack=False)
+        else:
+            st.line_chart(curve)
+
+
 def main():
     db = get_db()
 
@@ -109,55 +129,6 @@ def main():
     Patient_ID = st.text_input("Patient ID", key="Patient_ID")
     date = datetime.now(timezone.utc)
 
-    # --- Feature schema (your existing defaults & tags) ---
-    variables = {
-        "Sex": {"label": "Sex", "default": "Male", "tag": "Sex"},
-        "Age": {"label": "Age (years)", "default": 5.7, "tag": "Age (Significant)"},
-        "Weight": {"label": "Weight (kg)", "default": 16.8, "tag": "Weight (Significant)"},
-        "PRISM_III_Score": {"label": "PRISM III Score *", "default": 14.02, "tag": "PRISM III Score (Significant)"},
-        "Vasoactive_Inotropic_Score": {"label": "Vasoactive-Inotropic Score *", "default": 9.36, "tag": "Vasoactive-Inotropic Score (Significant)"},
-        "PICU_Stay": {"label": "PICU Stay (days)", "default": 13.5, "tag": "PICU Stay"},
-        "Ventilator_Usage": {"label": "Ventilator Usage *", "default": "No", "tag": "Ventilator Usage (Significant)"},
-        "Interval_from_Admission": {"label": "Interval from Admission (hours)", "default": 18.17, "tag": "Interval from Admission"},
-        "Duration_of_CRRT": {"label": "Duration of CRRT (days)", "default": 4.23, "tag": "Duration of CRRT (Significant)"},
-        "Fluid_Overload": {"label": "Fluid Overload *", "default": "No", "tag": "Fluid Overload (Significant)"},
-        "FO_at_CRRT_Initiation": {"label": "% FO at CRRT Initiation *", "default": 8.12, "tag": "% FO at CRRT Initiation (Significant)"},
-        "pH": {"label": "pH Level *", "default": 7.33, "tag": "pH Level (Significant)"},
-        "Lactic_Acid": {"label": "Lactic Acid (mmol/L) *", "default": 2.24, "tag": "Lactic Acid"},
-        "Hb": {"label": "Hemoglobin (g/dL)", "default": 9.45, "tag": "Hemoglobin"},
-        "Platelet": {"label": "Platelet (10³/µL)", "default": 109.54, "tag": "Platelet"},
-        "Urine_Volume": {"label": "Urine Volume (mL/Kg/h) *", "default": 0.9, "tag": "Urine Volume"},
-        "Sepsis": {"label": "Sepsis", "default": "No", "tag": "Sepsis (Significant)"},
-        "Acute_Liver_Failure": {"label": "Acute Liver Failure", "default": "No", "tag": "Acute Liver Failure (Significant)"},
-        "Respiratory_Disease": {"label": "Respiratory System Disease *", "default": "No", "tag": "Respiratory System Disease (Significant)"},
-        "Albumin": {"label": "Albumin (g/dL) *", "default": 3.05, "tag": "Albumin (Significant)"},
-        "Creatinine": {"label": "Creatinine (mg/dL)", "default": 1.5, "tag": "Creatinine (Significant)"},
-        "PELOD": {"label": "PELOD Score *", "default": 12.22, "tag": "PELOD Score (Significant)"},
-        "pSOFA": {"label": "pSOFA Score *", "default": 9.56, "tag": "pSOFA Score (Significant)"},
-        "Bicarbonate": {"label": "Bicarbonate (mmEq/L)", "default": 21.7, "tag": "Bicarbonate"},
-        "Sodium": {"label": "Sodium (mmol/L)", "default": 138.72, "tag": "Sodium (Significant)"},
-        "Potassium": {"label": "Potassium (mmol/L)", "default": 3.61, "tag": "Potassium"},
-        "Tumor_Lysis_Syndrome": {"label": "Tumor Lysis Syndrome", "default": "Yes", "tag": "Tumor Lysis Syndrome"},
-        "Hyperammonemia": {"label": "Hyperammonemia", "default": "Yes", "tag": "Hyperammonemia"}
-    }
-
-    categorical_options = {
-        "Sex": ["Male", "Female"],
-        "Ventilator_Usage": ["Yes", "No"],
-        "Fluid_Overload": ["Yes", "No"],
-        "Sepsis": ["Yes", "No"],
-        "Acute_Liver_Failure": ["Yes", "No"],
-        "Respiratory_Disease": ["Yes", "No"],
-        "Tumor_Lysis_Syndrome": ["Yes", "No"],
-        "Hyperammonemia": ["Yes", "No"]
-    }
-
-    significant_variables = ["Age","Weight","PRISM_III_Score","Vasoactive_Inotropic_Score","Ventilator_Usage","Duration_of_CRRT",
-                             "Fluid_Overload","FO_at_CRRT_Initiation","pH","Sepsis","Acute_Liver_Failure",
-                             "Respiratory_Disease","Albumin","Creatinine","PELOD","pSOFA","Sodium"]
-
-    higher_or_equal_variables = ["pH","Platelet","Urine_Volume","Albumin","Bicarbonate","Potassium"]
-
     # --- UI layout ---
     col1, col2 = st.columns(2)
 
@@ -198,161 +169,149 @@ def main():
     st.subheader("Model")
     c1, c2 = st.columns(2)
     with c1:
-        uploaded_csv = st.file_uploader("Upload training CSV (must include 'Survival' target)", type=["csv"])
+        uploaded_csv = st.file_uploader("Upload training CSV or Parquet (must include 'Survival' target)", type=["csv", "parquet"])
     with c2:
         n_neighbors = st.slider("k (neighbors)", min_value=3, max_value=31, value=7, step=2)
-
-    # Columns split for preprocessing
-    categorical_cols = list(categorical_options.keys())
-    numeric_cols = [c for c in variables.keys() if c not in categorical_cols]
+        index_method = st.selectbox(
+            "Neighbour search", ["compact", "pipeline", *EXACT_METHODS],
+            format_func=lambda m: {"compact": "compact (NumPy)", "pipeline": "exact (sklearn)"}.get(m, m),
+        )
 
     # Try to load pre-trained pipeline first; if CSV is uploaded, we’ll train & override.
-    knn_pipeline = try_load_pipeline("model.pkl")
+    registry = get_registry()
+    model_version = pin_session_version(registry)
+    latest_version = registry.current_version()
+    if latest_version is not None and latest_version != model_version:
+        if st.button(f"Newer model available ({latest_version}) — switch"):
+            st.session_state["model_version"] = model_version = latest_version
+    unsaved_pipeline = None
+
+    if model_version is not None:
+        with st.expander("Update model with recorded outcomes"):
+            st.caption("Appends results whose survival outcome has been recorded; preprocessing stays frozen until recalibrated.")
+            add_col, recal_col = st.columns(2)
+            with add_col:
+                if st.button("Add labelled outcomes"):
+                    from core.incremental import update_from_outcomes
+                    try:
+                        with span("model.incremental_update"):
+                            new_version, added = update_from_outcomes(db, registry, model_version)
+                    except Exception as e:
+                        st.error(f"Update failed: {e}")
+                    else:
+                        if new_version is None:
+                            st.info("No new labelled outcomes.")
+                        else:
+                            st.session_state["model_version"] = model_version = new_version
+                            st.success(f"Added {added} outcomes as model version {new_version}.")
+            with recal_col:
+                if st.button("Recalibrate preprocessing"):
+                    from core.incremental import recalibrate
+                    try:
+                        pipeline = registry.load(model_version)
+                        if pipeline is None:
+                            raise ValueError(f"model version {model_version} is not available")
+                        with span("model.recalibrate"):
+                            new_version = registry.save(recalibrate(pipeline))
+                    except Exception as e:
+                        st.error(f"Recalibration failed: {e}")
+                    else:
+                        st.session_state["model_version"] = model_version = new_version
+                        st.success(f"Recalibrated as model version {new_version}.")
 
     # Train from uploaded CSV (cached by file content)
     if uploaded_csv is not None:
-        df = pd.read_csv(uploaded_csv)
-        missing_cols = [c for c in variables.keys() if c not in df.columns]
-        if missing_cols:
-            st.error(f"Training CSV is missing columns: {', '.join(missing_cols)}")
-        elif "Survival" not in df.columns:
-            st.error("Training CSV must include target column 'Survival' (0/1).")
-        else:
-            # Cast category cols to string, numerics to float where possible
-            for col in categorical_cols:
-                if col in df.columns:
-                    df[col] = df[col].astype(str)
-            for col in numeric_cols:
-                if col in df.columns:
-                    df[col] = pd.to_numeric(df[col], errors="coerce")
-
-            X = df[variables.keys()]
-            y = df["Survival"].astype(int)
-
-            knn_pipeline = build_knn_pipeline(categorical_cols, numeric_cols, n_neighbors=n_neighbors)
-            knn_pipeline.fit(X, y)
-            st.success("KNN pipeline trained from uploaded CSV.")
-            # Optionally persist
+        # Training and evaluation pull in sklearn's model selection; only import them here.
+        from core.evaluation import best_k, k_sweep
+        from core.training import content_digest, get_training_cache, load_training_frame
+
+        def persist(pipeline, report):
+            # Optionally persist as a new immutable version. Once saved, the cache keeps only
+            # the version id; the registry loads (and evicts) the model itself.
             try:
-                with open("model.pkl", "wb") as f:
-                    pickle.dump(knn_pipeline, f)
-                st.caption("Saved trained pipeline to model.pkl")
+                return None, registry.save(pipeline), report
             except Exception:
-                pass
-    # if uploaded_csv is not None:
-    #     df = pd.read_csv(uploaded_csv)
-    #     missing_cols = [c for c in variables.keys() if c not in df.columns]
-    #     if missing_cols:
-    #         st.error(f"Training CSV is missing columns: {', '.join(missing_cols)}")
-    #     elif "Survival" not in df.columns:
-    #         st.error("Training CSV must include target column 'Survival' (0/1).")
-    #     else:
-    #         # Columns split once (same as below)
-    #         categorical_cols = list(categorical_options.keys())
-    #         numeric_cols = [c for c in variables.keys() if c not in categorical_cols]
-
-    #         # 1) Coerce types + 2) Fill NaNs with defaults from `variables`
-    #         df = fill_with_defaults(df, variables, categorical_cols, numeric_cols)
-
-    #         # Build X/y with guaranteed no NaNs
-    #         X = df[list(variables.keys())]
-    #         y = df["Survival"].astype(int)
-
-    #         knn_pipeline = build_knn_pipeline(categorical_cols, numeric_cols, n_neighbors=n_neighbors)
-    #         knn_pipeline.fit(X, y)
-    #         st.success("KNN pipeline trained from uploaded CSV with default-value imputation.")
-    #         try:
-    #             with open("model.pkl", "wb") as f:
-    #                 pickle.dump(knn_pipeline, f)
-    #             st.caption("Saved trained pipeline to model.pkl")
-    #         except Exception:
-    #             pass
-                
+                return pipeline, None, report
+
+        try:
+            with span("model.train"):
+                (trained_pipeline, version, ingest_report), trained = get_training_cache().get_or_train(
+                    uploaded_csv.getvalue, n_neighbors, on_fit=persist,
+                    digest=upload_digest(uploaded_csv, content_digest),
+                )
+        except ValueError as e:
+            st.error(str(e))
+        else:
+            if version is not None:
+                # Switch to the upload's version once per upload and k; later reruns hit the
+                # cache and keep whatever the session moved to since (an outcome update,
+                # recalibration or a newer model).
+                upload_key = (uploaded_csv.file_id, n_neighbors)
+                if st.session_state.get("upload_version_key") != upload_key:
+                    st.session_state["upload_version_key"] = upload_key
+                    st.session_state["model_version"] = model_version = version
+            else:
+                unsaved_pipeline = trained_pipeline
+            if trained:
+                st.success("KNN pipeline trained from uploaded CSV.")
+                if version is not None:
+                    st.caption(f"Saved trained pipeline as model version {version}")
+            else:
+                st.caption("Using cached KNN pipeline for this CSV and k.")
+            if not ingest_report.ok:
+                st.warning(f"Training data problems: {ingest_report.summary()}")
+                with st.expander("Bad rows"):
+                    st.dataframe(pd.DataFrame(ingest_report.examples), hide_index=True)
+
+        with st.expander("Choose k (cross-validated)"):
+            if st.button("Evaluate every odd k from 3 to 31"):
+                try:
+                    X_train, y_train, _ = load_training_frame(uploaded_csv.getvalue())
+                    k_table = k_sweep(X_train, y_train)
+                except ValueError as e:
+                    st.error(str(e))
+                else:
+                    st.dataframe(k_table, hide_index=True)
+                    st.caption(f"Best k by AUC: {best_k(k_table)} (5-fold stratified CV)")
+
+    # Saved versions are served by the inference workers; the model is only loaded into
+    # this process for an unsaved fit or when the workers cannot answer.
+    def local_model():
+        if unsaved_pipeline is not None:
+            return unsaved_pipeline
+        with span("model.load", method=index_method):
+            return load_knn_model(registry, model_version, index_method)
+
+    knn_available = unsaved_pipeline is not None or model_version is not None
+    if unsaved_pipeline is None:
+        preload_on_workers(model_version, index_method)
+
     # --- Calculate button (keeps your original logic) ---
     if st.button("Calculate"):
         # ===== 1) Your rule-based score =====
-        expected_categorical = {
-            "Sex": "Male",
-            "Ventilator_Usage": "No",
-            "Fluid_Overload": "No",
-            "Respiratory_Disease": "No",
-            "Sepsis": "No",
-            "Acute_Liver_Failure": "No",
-            "Tumor_Lysis_Syndrome": "No",
-            "Hyperammonemia": "No"
-        }
-
-        total_variables = 0
-        within_limit = 0
-        within_limit_vars = []
-
-        for var, props in variables.items():
-            value = user_data.get(var, None)
-            upper_limit = props["default"]
-            if value is not None:
-                if var in categorical_options:
-                    total_variables += 1
-                    if var in significant_variables:
-                        total_variables += 1
-                    if var in expected_categorical:
-                        if value == expected_categorical[var]:
-                            within_limit += 1
-                            within_limit_vars.append(props["tag"])
-                            if var in significant_variables:
-                                within_limit += 1
-                    else:
-                        # Neutral categoricals (e.g., Sex) do not affect score
-                        pass
-                else:
-                    total_variables += 1
-                    if var in significant_variables:
-                        total_variables += 1
-                    if var in higher_or_equal_variables:
-                        if value >= upper_limit:
-                            within_limit += 1
-                            within_limit_vars.append(props["tag"])
-                            if var in significant_variables:
-                                within_limit += 1
-                    else:
-                        if value <= upper_limit:
-                            within_limit += 1
-                            within_limit_vars.append(props["tag"])
-                            if var in significant_variables:
-                                within_limit += 1
-
-        final_score = (within_limit / total_variables) * 100 if total_variables > 0 else None
+        with span("score.rule_based"):
+            final_score, within_limit_vars = score_patient(user_data)
 
         # ===== 2) KNN prediction =====
-        # Build a single-row DataFrame in the exact training column order.
-        row = {}
-        for key in variables.keys():
-            v = user_data.get(key, None)
-            # If user left it empty, fall back to your "default"
-            if v is None:
-                v = variables[key]["default"]
-            row[key] = v
-
-        X_user = pd.DataFrame([row])
-
-        # Ensure dtypes are consistent: categorical as str, numerics as float
-        for col in categorical_cols:
-            if col in X_user.columns:
-                X_user[col] = X_user[col].astype(str)
-        for col in numeric_cols:
-            if col in X_user.columns:
-                X_user[col] = pd.to_numeric(X_user[col], errors="coerce")
+        # Single-row frame in training column order; empty fields fall back to your "default".
+        with span("model.input"):
+            X_user = SCHEMA.model_input(pd.DataFrame([user_data]))
 
         knn_pred = None
         knn_prob = None
+        knn_result = None
 
-        if knn_pipeline is not None:
+        if knn_available:
             try:
-                knn_pred = int(knn_pipeline.predict(X_user)[0])
-                # Assume class 1 = survivor probability
-                proba = knn_pipeline.predict_proba(X_user)[0]
-                # Find index for class 1 safely
-                class_index = list(knn_pipeline.classes_).index(1) if hasattr(knn_pipeline, "classes_") else 1
-                knn_prob = float(proba[class_index]) * 100.0
+                # One preprocessing + neighbour query gives class, probability and neighbours.
+                worker_version = model_version if unsaved_pipeline is None else None
+                with span("model.predict", method=index_method):
+                    knn_result = predict_knn(worker_version, index_method, X_user, local_model)
+                if knn_result is None:
+                    st.warning("Model could not be loaded. Upload training CSV or provide model.pkl to enable KNN.")
+                else:
+                    knn_pred = int(knn_result.prediction[0])
+                    knn_prob = float(knn_result.probability[0]) * 100.0
             except Exception as e:
                 st.error(f"KNN prediction error: {e}")
         else:
@@ -362,17 +321,29 @@ def main():
         if not Patient_Name or not Patient_ID:
             st.warning("Please fill Patient Name and Patient ID.")
         else:
-            doc_ref = db.collection("Hasil_KNN").document(f"{Patient_Name}_{datetime.now(timezone.utc).strftime('%Y%m%d')}")
+            # Every calculation is its own entry; same-day recalculations no longer overwrite.
+            doc_id = result_id(Patient_Name, date)
             payload = {
                 "Patient_Name": Patient_Name,
                 "Patient_ID": Patient_ID,
                 "Date": date,
-                **{k: user_data.get(k, None) for k in variables.keys()},
+                **{k: user_data.get(k, None) for k in SCHEMA.names},
                 "RuleBased_Score": final_score,
                 "KNN_Prediction": knn_pred,
                 "KNN_Probability": knn_prob
             }
-            doc_ref.set(payload)
+            # Written in the background; the journal keeps it safe across restarts and outages.
+            write_queue = get_write_queue(db, on_flush=invalidate_history)
+            try:
+                with span("write.enqueue"):
+                    write_queue.enqueue("Hasil_KNN", doc_id, payload)
+            except ValueError as e:
+                st.error(f"Result not saved: {e}")
+            if write_queue.last_error is not None:
+                st.caption(f"Saving is delayed ({write_queue.pending_count()} results pending): {write_queue.last_error}")
+            if write_queue.dead_letters:
+                st.caption(f"{write_queue.dead_letters} results were rejected by Firestore and set aside "
+                           f"in {write_queue.dead_letter_path}.")
 
         # ===== 4) UI feedback =====
         if final_score is None:
@@ -386,14 +357,28 @@ def main():
         if knn_prob is not None:
             label = "Survivor" if knn_pred == 1 else "Non-survivor"
             st.success(f"KNN predicted: {label}  •  Probability of survival: {knn_prob:.2f}%")
-        elif knn_pipeline is None:
+        elif not knn_available:
             st.info("Train or load a KNN model to see ML predictions.")
 
+        if knn_result is not None:
+            with st.expander("Similar past patients"):
+                st.dataframe(pd.DataFrame({
+                    "Training row": knn_result.neighbour_indices[0],
+                    "Distance": knn_result.neighbour_distances[0],
+                    "Outcome": ["Survivor" if o == 1 else "Non-survivor" for o in knn_result.neighbour_outcomes[0]],
+                }), hide_index=True)
+
         if within_limit_vars:
             st.info("Variables within the survivor criteria: " + ", ".join(within_limit_vars))
         else:
             st.info("No variables met the survivor criteria based on current inputs.")
 
+    # --- What-if sensitivity (nothing is saved) ---
+    if st.toggle("What-if sensitivity", help="How the scores move when one input changes at a time."):
+        worker_version = model_version if unsaved_pipeline is None else None
+        sensitivity_panel(user_data, (lambda X: predict_knn(worker_version, index_method, X, local_model))
+                          if knn_available else None)
+
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
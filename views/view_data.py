@@ -1,61 +1,162 @@
 import streamlit as st
 import pandas as pd
-import json
-from google.cloud import firestore
-from google.oauth2 import service_account
+from datetime import datetime, time, timedelta, timezone
+
+from core.db import get_db
+from core.features import SCHEMA
+from core.history import (
+    NO_FILTERS, PAGE_SIZES, PERIOD_FREQS, SUMMARY_FIELDS, HistoryFilters,
+    fetch_page, fetch_summary, fetch_timeline, invalidate_history, summary_periods,
+)
+from core.mirror import COLLECTION_COLUMNS, get_mirror, stamped
+from core.tracing import span
+
+KNN_COLUMNS = SCHEMA.history_columns
+PREDICTION_LABELS = {"All": None, "Survivor": 1, "Non-survivor": 0}
+
+
+def filter_controls():
+    """Patient / date range / prediction inputs as HistoryFilters."""
+    id_col, date_col, pred_col = st.columns([2, 2, 1])
+    with id_col:
+        patient_id = st.text_input("Patient ID", key="history_patient_id").strip()
+    with date_col:
+        dates = st.date_input("Date range", value=(), key="history_dates")
+    with pred_col:
+        prediction = st.selectbox("KNN prediction", list(PREDICTION_LABELS), key="history_prediction")
+
+    start = end = None
+    if len(dates) == 2:
+        start = datetime.combine(dates[0], time.min, tzinfo=timezone.utc)
+        end = datetime.combine(dates[1] + timedelta(days=1), time.min, tzinfo=timezone.utc)
+    return HistoryFilters(patient_id or None, start, end, PREDICTION_LABELS[prediction])
+
+
+def paged_table(collection, columns, page_size, empty_message, filters=NO_FILTERS):
+    """Show one page of `collection` with Previous/Next controls backed by Firestore cursors."""
+    # Stack of start cursors for the pages visited so far; resets when the page size or filters change.
+    key = f"{collection}_cursors_{page_size}_{hash(filters)}"
+    cursors = st.session_state.setdefault(key, [None])
+
+    rows, next_cursor = fetch_page(collection, page_size, cursors[-1], tuple(columns), filters)
+    if not rows:
+        st.info(empty_message)
+    else:
+        st.write(SCHEMA.normalize_fields(pd.DataFrame(rows)).reindex(columns=columns))
+
+    prev_col, page_col, next_col = st.columns([1, 2, 1])
+    with prev_col:
+        st.button("◀ Previous", key=f"{collection}_prev", disabled=len(cursors) == 1,
+                  on_click=cursors.pop)
+    with page_col:
+        st.caption(f"Page {len(cursors)}")
+    with next_col:
+        st.button("Next ▶", key=f"{collection}_next", disabled=next_cursor is None,
+                  on_click=cursors.append, args=(next_cursor,))
+
+
+def mirrored_table(mirror, collection, columns, page_size, empty_message, filters=NO_FILTERS):
+    """Same view as `paged_table`, served from the local mirror."""
+    conditions = filters.conditions(collection)
+    total = mirror.count(collection, conditions)
+    if total == 0:
+        st.info(empty_message)
+        return
+    last_page = (total - 1) // page_size
+    key = f"{collection}_page_{page_size}_{hash(filters)}"
+    page = min(st.session_state.setdefault(key, 0), last_page)
+
+    st.write(mirror.read_page(collection, columns, page_size, page, conditions))
+
+    def go(delta):
+        st.session_state[key] = page + delta
+
+    prev_col, page_col, next_col = st.columns([1, 2, 1])
+    with prev_col:
+        st.button("◀ Previous", key=f"{collection}_prev", disabled=page == 0, on_click=go, args=(-1,))
+    with page_col:
+        st.caption(f"Page {page + 1} of {last_page + 1} • {total} records")
+    with next_col:
+        st.button("Next ▶", key=f"{collection}_next", disabled=page >= last_page, on_click=go, args=(1,))
 
-st.subheader("📁 Rule Based History")
 
-# Establish the database connection
-# authenticate with Firebase service account
-key_dict = json.loads(st.secrets["textkey"])
-creds = service_account.Credentials.from_service_account_info(key_dict)
-db = firestore.Client(credentials=creds)
+page_size = st.selectbox("Rows per page", PAGE_SIZES, index=0)
+
+# Prefer the local mirror (only changed documents are fetched); fall back to Firestore paging.
+try:
+    mirror = get_mirror()
+    for collection in COLLECTION_COLUMNS:
+        with span("history.sync", collection=collection):
+            mirror.sync_if_stale(get_db(), collection)
+except Exception as e:
+    mirror = None
+    st.caption(f"Local history mirror unavailable ({e}); reading Firestore directly.")
+
+show_table = paged_table if mirror is None else (
+    lambda *args: mirrored_table(mirror, *args)
+)
+
+# Filters are applied by the query (Firestore or the mirror), not to downloaded rows.
+filters = filter_controls()
+
+st.subheader("🧑‍⚕️ Patient Timeline")
+
+# Both collections merged per patient: one indexed lookup instead of two collection scans.
+if filters.patient_id is None:
+    st.caption("Enter a Patient ID above to see every calculation for that patient.")
+else:
+    with span("history.timeline"):
+        timeline = fetch_timeline(filters.patient_id) if mirror is None else mirror.timeline(filters.patient_id)
+    if timeline.empty:
+        st.info(f"⚠️ No history found for patient {filters.patient_id}")
+    else:
+        st.dataframe(timeline, hide_index=True)
+
+
+st.subheader("📁 Rule Based History")
 
 # Display the patient data from firestore with arranged columns
-patients_ref = db.collection("Patients")
-patients_snap = patients_ref.get()
-patient_data = []
-for doc in patients_snap:
-    data = doc.to_dict()
-    data["Patient_Name"] = doc.id
-    patient_data.append(data)
-patient_df = pd.DataFrame(patient_data)
-patient_df = patient_df[[
-    "Patient_ID", "Patient_Name", 
-    "Date", "Age", "Sex", "Weight",
-    "Vasoactive_Inotropic_Score", "Ventilator_Usage",
-    "Duration_of_CRRT", "FO_at_CRRT_Initiation",
-    "Lactic_Acid", "Platelet", "Sepsis",
-    "Respiratory_Disease", "Creatinine", "pSOFA",
-    "Sodium", "Tumor_Lysis_Syndrome", "PRISM_III_Score",
-    "PICU_Stay", "Interval_from_Admission",
-    "Fluid_Overload", "pH", "Hb", "Urin",
-    "Acute_Liver_Failure", "Albumin", "PELOD",
-    "Bicarbonate", "Potassium", "Hyperammonemia",
-    "Prediction_Score"
-]]
-st.write(patient_df)
+with span("history.table", collection="Patients"):
+    show_table("Patients", COLLECTION_COLUMNS["Patients"], page_size,
+               "⚠️ No patient history found in the database", filters)
 
 
 st.subheader("📁 KNN History")
 
-knn_ref = db.collection("Hasil_KNN")
-knn_snap = knn_ref.get()
-knn_data = []
-
-for doc in knn_snap:
-    data = doc.to_dict()
-    data["Patient_Name"] = doc.id
-    knn_data.append(data)
-
-if knn_data:
-    knn_df = pd.DataFrame(knn_data)
-    knn_df = knn_df[[
-        "Patient_ID", "Patient_Name", 
-        "Date", "RuleBased_Score", 
-        "KNN_Probability", "KNN_Prediction"
-    ]]
-    st.write(knn_df)
+with span("history.table", collection="Hasil_KNN"):
+    show_table("Hasil_KNN", KNN_COLUMNS, page_size, "⚠️ No KNN history found in the database", filters)
+
+
+st.subheader("📊 KNN Summary")
+
+freq = st.radio("Period", list(PERIOD_FREQS), index=2, horizontal=True)
+try:
+    periods = summary_periods(freq, filters.start, filters.end)
+except ValueError as e:
+    st.warning(str(e))
 else:
-    st.info("⚠️ No KNN history found in the database")
\ No newline at end of file
+    with span("history.summary", period=freq):
+        if mirror is None:
+            summary = fetch_summary("Hasil_KNN", periods, filters)
+        else:
+            summary = mirror.aggregate_periods("Hasil_KNN", periods, SUMMARY_FIELDS, filters.conditions("Hasil_KNN"))
+    st.dataframe(summary.round(2), hide_index=True)
+
+
+with st.expander("Record outcome"):
+    # Labelled results are what core.incremental appends to the model.
+    with st.form("record_outcome", clear_on_submit=True):
+        result_id = st.text_input("Result ID (from the patient timeline)")
+        outcome = st.radio("Outcome", ["Survived", "Did not survive"], horizontal=True)
+        submitted = st.form_submit_button("Save outcome")
+    if submitted and result_id:
+        doc_ref = get_db().collection("Hasil_KNN").document(result_id)
+        if not doc_ref.get().exists:
+            st.error(f"No KNN result with ID {result_id}.")
+        else:
+            fields = {"Survival": 1 if outcome == "Survived" else 0, "Outcome_Date": datetime.now(timezone.utc)}
+            doc_ref.set(stamped(fields), merge=True)
+            if mirror is not None:
+                mirror.update_fields("Hasil_KNN", result_id, {"Survival": fields["Survival"]})
+            invalidate_history()
+            st.success(f"Outcome saved for {result_id}.")